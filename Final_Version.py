@@ -1,67 +1,169 @@
-import os
-import json
-import whisper
-import pyttsx3
+import re
+import time
 import warnings
-from openai import OpenAI
-from utils.audio_2 import record_press_enter1,transcribe_audio1
+# whisper, pyttsx3 and the audio helpers are imported where they are first
+# used, so typing-only sessions (and tests) never pay for torch or PortAudio
+from utils.json_stream import JSONFieldStreamer
+from utils.llm_client import get_client, connection_stats, shutdown as shutdown_llm_clients
+from utils.metrics import (FALLBACK_RESPONSES, LLM_FAILURES, PARSE_FAILURES, STAGE_SECONDS, collect_timings,
+                           format_timings, span)
+from utils.prompting import PromptBuilder
+from utils.resilience import get_policy
+from utils.structured_output import FailedGeneration, ResponseFormatError, decode_tutor_response, json_completion, salvage_reply
+from utils.tts import SpeechWorker, split_sentences
+from utils.whisper_registry import WHISPER_MODEL, WHISPER_PRELOAD, get_whisper_model, preload_whisper
 
 warnings.filterwarnings("ignore",message="FP16 is not supported on CPU; using FP32 instead")
 
 SAMPLE_RATE = 16000
-WHISPER_MODEL = "base"
 GROQ_API_KEY = "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"
 GROQ_MODEL = "llama-3.3-70b-versatile"
+PROMPT_TOKEN_BUDGET = 1500
+MAX_USER_TOKENS = 300
+MAX_HISTORY_TURNS = 5
+JSON_MODE = True  # ask Groq for JSON mode; dropped automatically if the model refuses it
+STREAM_REPLIES = True  # stream the completion and start speaking at the first finished sentence
+FALLBACK_RESPONSE = "I'm having a little trouble connecting right now. Let's talk about something else."
+PERFECT_PREFIX = "That's perfectly said!"
 
-class EnglishTutor:
-    def __init__(self):
-        print("Loading models and initializing...")
-        self.whisper_model = whisper.load_model(WHISPER_MODEL)
-        self.selected_voice_id = self._get_voice_id()
-        self.conversation_history = [
-            {
-                "role": "system",
-                "content": "You are Alex, a friendly and precise AI English tutor. Your primary goal is to identify grammar errors, explain them clearly, and engage the user in conversation."
-            }
-        ]
-        print("English Tutor initialized successfully!")
+# Instructions and few-shot examples are one fixed system message, built once,
+# so every request starts with the same bytes and provider prompt caching can hit
+SYSTEM_MESSAGE = """You are Alex, an expert English tutor. Your task is to analyze the user's message with high accuracy.
 
-    def _get_voice_id(self):
-        try:
-            engine = pyttsx3.init(driverName="sapi5")
-        except Exception:
-            engine = pyttsx3.init()
+RULES:
+1. **Analyze Thoroughly**: Check for any grammar, spelling, or phrasing errors.
+2. **Correct the Sentence**: Provide a single, fully corrected version.
+3. **Determine Error Status**: Set `has_errors` to `true` if even one error is found.
+4. **Explain Clearly**: If errors exist, provide a friendly explanation.
+5. **Respond Conversationally**: Write a natural response that continues the conversation.
+
+Return ONLY a JSON object with this exact structure:
+{
+    "corrected_sentence": "The fully corrected sentence.",
+    "has_errors": true_or_false,
+    "explanation": "A friendly explanation of corrections, or empty string if none.",
+    "conversational_response": "Your engaging response to continue the conversation."
+}
 
-        voices = engine.getProperty("voices")
+EXAMPLES:
+User: "Hello, how is you?"
+Output: {"corrected_sentence": "Hello, how are you?", "has_errors": true, "explanation": "We say 'how are you?' because 'are' is used with 'you'.", "conversational_response": "I'm doing well, thanks! What's on your mind today?"}
 
-        selected_id = None
-        if len(voices) > 1:
-            selected_id = voices[1].id
-            print(f"\nSUCCESS: Selected voice is '{voices[1].name}'\n")
-        else:
-            print("WARNING: Only one voice available. Using default.")
-            if voices:
-                selected_id = voices[0].id
-        
-        engine.stop()
-        del engine
-        return selected_id
+User: "What do you think about Babar Azam?"
+Output: {"corrected_sentence": "What do you think about Babar Azam?", "has_errors": false, "explanation": "", "conversational_response": "Perfect grammar! Babar Azam is an incredible cricketer with such elegant technique. Are you a cricket fan?"}"""
+
+USER_TEMPLATE = """USER'S MESSAGE: "{text}"
+
+Now analyze the message above and return only the JSON."""
+
+TUTOR_PROMPT = PromptBuilder(SYSTEM_MESSAGE, USER_TEMPLATE, token_budget=PROMPT_TOKEN_BUDGET, max_user_tokens=MAX_USER_TOKENS)
+
+_HAS_ERRORS = re.compile(r'"has_errors"\s*:\s*"?(true|false)', re.IGNORECASE)
+
+
+class ResponseSpeaker:
+    """
+    Turns a streamed tutor completion into sentences to speak, as they are
+    finished, in the order speak() used to say them: the explanation if there
+    are errors (otherwise PERFECT_PREFIX), then the conversational response.
+    Reply sentences that arrive before the explanation is settled wait for it.
+    """
+
+    def __init__(self, say):
+        self.say = say
+        self.explanation = JSONFieldStreamer("explanation")
+        self.reply = JSONFieldStreamer("conversational_response")
+        self.has_errors = None
+        self.spoken = []
+        self._pending = {"explanation": "", "reply": ""}
+        self._ready = {"explanation": [], "reply": []}
+        self._reply_started = False
+
+    def feed(self, text):
+        for part, streamer in (("explanation", self.explanation), ("reply", self.reply)):
+            sentences, self._pending[part] = split_sentences(self._pending[part], streamer.feed(text))
+            self._ready[part] += sentences
+            if streamer.done:
+                self._flush(part)
+        if self.has_errors is None:
+            match = _HAS_ERRORS.search(self.reply.text)
+            if match:
+                self.has_errors = match.group(1).lower() == "true"
+        self._pump()
+
+    def abort(self, reply):
+        """
+        The completion broke off. Unfinished sentences are dropped rather
+        than spoken as fragments, and if the reply hadn't started, reply
+        (salvaged or the fallback) is said in its place. With nothing said
+        yet, the caller speaks the whole answer as usual.
+        """
+        self._pending = {"explanation": "", "reply": ""}
+        self._ready = {"explanation": [], "reply": []}
+        if self.spoken and not self._reply_started:
+            self._reply_started = True
+            self._say(reply)
+
+    def finish(self):
+        """The completion has ended: speak whatever is left."""
+        self._flush("explanation")
+        self._flush("reply")
+        if self.has_errors is None:
+            self.has_errors = False
+        self._pump(final=True)
+
+    def _flush(self, part):
+        rest = self._pending[part].strip()
+        if rest:
+            self._ready[part].append(rest)
+        self._pending[part] = ""
+
+    def _pump(self, final=False):
+        if self.has_errors and not self._reply_started:
+            self._say_all("explanation")
+        if not (final or self.has_errors is False or (self.has_errors and self.explanation.done)):
+            return
+        if not self._reply_started and self._ready["reply"]:
+            if not (self.has_errors and self.explanation.value.strip()):
+                self._say(PERFECT_PREFIX)
+            self._reply_started = True
+        if self._reply_started:
+            self._say_all("reply")
+
+    def _say_all(self, part):
+        for sentence in self._ready[part]:
+            self._say(sentence)
+        self._ready[part] = []
+
+    def _say(self, text):
+        self.spoken.append(text)
+        self.say(text)
+
+
+class EnglishTutor:
+    def __init__(self, whisper_model_name=WHISPER_MODEL, preload_whisper=WHISPER_PRELOAD, tts=None):
+        print("Initializing...")
+        # Whisper is loaded on the first voice turn, or in the background from
+        # start_session when preload_whisper is on
+        self.whisper_model_name = whisper_model_name
+        self.preload_whisper = preload_whisper
+        # One engine for the whole session, on its own thread; speech is queued to it
+        self.tts = tts or SpeechWorker().start()
+        self.selected_voice_id = self.tts.voice_id
+        self.history_turns = []  # (user_text, conversational_response) pairs, oldest first
+        self._audio_buffer = None  # reused across voice turns, created on the first one
+        print("English Tutor initialized successfully!")
+
+    @property
+    def whisper_model(self):
+        return get_whisper_model(self.whisper_model_name)
 
     def speak(self,text):
+        """Say text and wait until it has been spoken; returns its Utterance."""
         print(f"\nAlex says: {text}")
-        try:
-            engine = pyttsx3.init(driverName="sapi5") if os.name == 'nt' else pyttsx3.init()
-            
-            if self.selected_voice_id:
-                engine.setProperty("voice",self.selected_voice_id)
-            engine.setProperty("rate",165)
-            engine.setProperty("volume",1.0)
-            engine.say(text)
-            engine.runAndWait()
-            engine.stop()
-            del engine
-        except Exception as e:
-            print(f"TTS Error: {e}. Could not play audio.")
+        utterance = self.tts.say(text)
+        self.tts.wait()
+        return utterance
 
     def get_user_input(self):
         print("\n" + "="*50)
@@ -72,10 +174,24 @@ class EnglishTutor:
         return self._get_voice_input() if choice == "1" else self._get_text_input()
 
     def _get_voice_input(self):
-        audio_path = record_press_enter1(SAMPLE_RATE,channels=1)
-        if not audio_path:
+        from utils.audio_2 import (AUDIO_MAX_SECONDS, AUDIO_STREAMING, AUDIO_VAD, AudioRingBuffer, record_until_enter,
+                                   record_until_silence, transcribe_audio1, transcribe_streaming)
+
+        if self._audio_buffer is None:
+            # Streaming transcription tracks sample offsets, so its buffer must not wrap
+            self._audio_buffer = AudioRingBuffer(SAMPLE_RATE, max_seconds=None if AUDIO_STREAMING else AUDIO_MAX_SECONDS)
+        if AUDIO_STREAMING:
+            transcript,_ = transcribe_streaming(lambda: self.whisper_model,SAMPLE_RATE,buffer=self._audio_buffer)
+            if transcript:
+                print(f"You said: {transcript}")
+            return transcript or None
+        record = record_until_silence if AUDIO_VAD else record_until_enter
+        audio = record(SAMPLE_RATE,channels=1,buffer=self._audio_buffer)
+        if audio is None:
             return None
-        transcript,_ = transcribe_audio1(audio_path,self.whisper_model,SAMPLE_RATE)
+        with span("transcribe"):
+            # record_until_silence has already trimmed the silence
+            transcript,_ = transcribe_audio1(audio,self.whisper_model,SAMPLE_RATE,trim=not AUDIO_VAD)
         if transcript:
             print(f"You said: {transcript}")
         return transcript
@@ -85,86 +201,153 @@ class EnglishTutor:
         return text if text else None
 
     def call_groq(self,user_text):
-        self.conversation_history.append({"role": "user","content": user_text})
-        client = OpenAI(
-            api_key=GROQ_API_KEY,
-            base_url="https://api.groq.com/openai/v1",
-        )
-        system_message = """You are Alex, an expert English tutor. Your task is to analyze the user's message with high accuracy.
-
-RULES:
-1. **Analyze Thoroughly**: Check for any grammar, spelling, or phrasing errors.
-2. **Correct the Sentence**: Provide a single, fully corrected version.
-3. **Determine Error Status**: Set `has_errors` to `true` if even one error is found.
-4. **Explain Clearly**: If errors exist, provide a friendly explanation.
-5. **Respond Conversationally**: Write a natural response that continues the conversation.
-
-Return ONLY a JSON object with this exact structure:
-{
-    "corrected_sentence": "The fully corrected sentence.",
-    "has_errors": true_or_false,
-    "explanation": "A friendly explanation of corrections, or empty string if none.",
-    "conversational_response": "Your engaging response to continue the conversation."
-}"""
+        client = get_client(GROQ_API_KEY, max_retries=0)  # retries are left to get_policy()
+        with span("prompt"):
+            prompt = TUTOR_PROMPT.build(user_text, self.history_turns)
+        print(f"Prompt: ~{prompt.prompt_tokens} tokens, {prompt.history_turns} history turns")
 
-        user_message = f"""USER'S MESSAGE: "{user_text}"
-
-EXAMPLES:
-User: "Hello, how is you?"
-Output: {{"corrected_sentence": "Hello, how are you?", "has_errors": true, "explanation": "We say 'how are you?' because 'are' is used with 'you'.", "conversational_response": "I'm doing well, thanks! What's on your mind today?"}}
+        print(f"Making request to Groq API with model: {GROQ_MODEL}")
+        
+        try:
+            with span("llm"):
+                response = get_policy().call(lambda timeout: json_completion(
+                    client, json_mode=JSON_MODE,
+                    model=GROQ_MODEL,
+                    messages=prompt.messages,
+                    temperature=0.3,
+                    max_tokens=500,
+                    timeout=timeout
+                ))
+            content = response.choices[0].message.content
+        except FailedGeneration as e:
+            content = e.content
+        except Exception as e:
+            print(f"Groq API error: {e}")
+            LLM_FAILURES.inc(call="full")
+            FALLBACK_RESPONSES.inc()
+            return self._fallback(user_text, FALLBACK_RESPONSE)
 
-User: "What do you think about Babar Azam?"
-Output: {{"corrected_sentence": "What do you think about Babar Azam?", "has_errors": false, "explanation": "", "conversational_response": "Perfect grammar! Babar Azam is an incredible cricketer with such elegant technique. Are you a cricket fan?"}}
+        print(f"Content from API: {content}")
+        try:
+            with span("parse"):
+                ai_result = decode_tutor_response(content, user_text)
+        except ResponseFormatError as e:
+            print(f"Could not decode LLM output: {e}")
+            PARSE_FAILURES.inc(model=GROQ_MODEL)
+            reply = salvage_reply(content)
+            if not reply:
+                FALLBACK_RESPONSES.inc()
+            return self._fallback(user_text, reply or FALLBACK_RESPONSE)
+        self.history_turns.append((user_text, ai_result["conversational_response"]))
+        return ai_result
 
-Now analyze the message above and return only the JSON."""
+    def call_groq_streaming(self, user_text, on_text, on_error=None):
+        """
+        Like call_groq, but streams the completion and passes each piece of
+        raw text to on_text as it arrives. No JSON mode: not every provider
+        allows it with stream=True, and the tolerant parser copes without it.
+        If the stream fails, on_error gets the reply that replaces it.
+        """
+        client = get_client(GROQ_API_KEY, max_retries=0)
+        with span("prompt"):
+            prompt = TUTOR_PROMPT.build(user_text, self.history_turns)
+        print(f"Prompt: ~{prompt.prompt_tokens} tokens, {prompt.history_turns} history turns")
 
         print(f"Making request to Groq API with model: {GROQ_MODEL}")
-        
+        content = ""
         try:
-            response = client.chat.completions.create(
+            start = time.perf_counter()
+            # Retried only until the response starts; a stream can't be hedged
+            stream = get_policy().call(lambda timeout: client.chat.completions.create(
                 model=GROQ_MODEL,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
+                messages=prompt.messages,
                 temperature=0.3,
-                max_tokens=500
-            )
-            
-            content = response.choices[0].message.content.strip()
-            print(f"Content from API: {content}")
-            
-            if content.startswith("```json"):
-                content = content[7:-3].strip()
-            elif content.startswith("```"):
-                content = content[3:-3].strip()
-            
-            print(f"Cleaned content: {content}")
-            ai_result = json.loads(content)
-            self.conversation_history.append({"role": "assistant", "content": ai_result.get("conversational_response", "")})
-            return ai_result
-            
+                max_tokens=500,
+                stream=True,
+                timeout=timeout
+            ), hedge=False)
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content or ""
+                if text:
+                    content += text
+                    on_text(text)
+            # Not a span: the stream was interleaved with speaking
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm")
         except Exception as e:
-            print(f"Groq API error: {e}")
-            return {
-                "corrected_sentence": user_text, "has_errors": False, "explanation": "",
-                "conversational_response": "I'm having a little trouble connecting right now. Let's talk about something else."
-            }
+            print(f"\nGroq API error: {e}")
+            LLM_FAILURES.inc(call="full")
+            reply = salvage_reply(content)
+            if not reply:
+                FALLBACK_RESPONSES.inc()
+            if on_error is not None:
+                on_error(reply or FALLBACK_RESPONSE)
+            return self._fallback(user_text, reply or FALLBACK_RESPONSE)
+
+        print(f"\nContent from API: {content}")
+        try:
+            with span("parse"):
+                ai_result = decode_tutor_response(content, user_text)
+        except ResponseFormatError as e:
+            print(f"Could not decode LLM output: {e}")
+            PARSE_FAILURES.inc(model=GROQ_MODEL)
+            reply = salvage_reply(content)
+            if not reply:
+                FALLBACK_RESPONSES.inc()
+            return self._fallback(user_text, reply or FALLBACK_RESPONSE)
+        self.history_turns.append((user_text, ai_result["conversational_response"]))
+        return ai_result
+
+    @staticmethod
+    def _fallback(user_text, conversational_response):
+        return {
+            "corrected_sentence": user_text, "has_errors": False, "explanation": "",
+            "conversational_response": conversational_response
+        }
 
     def process_turn(self, user_text):
-        ai_result = self.call_groq(user_text)
+        input_done = time.perf_counter()
+        with collect_timings() as timings:
+            first = self._process_turn(user_text)
+            # From the learner's input being in hand to the first word of the answer
+            if first.started_at is not None:
+                first_word = max(0.0, first.started_at - input_done)
+                STAGE_SECONDS.observe(first_word, stage="first_word")
+                timings.append(("first_word", first_word))
+        print(f"  Timings: {format_timings(timings)}")
+
+    def _process_turn(self, user_text):
+        """Answer one turn; returns the Utterance of the first thing said."""
+        utterances = []
+        if STREAM_REPLIES:
+            def say(sentence):
+                if not utterances:
+                    print("\nAlex says:", end=" ")
+                print(sentence, end=" ", flush=True)
+                utterances.append(self.tts.say(sentence))
+
+            speaker = ResponseSpeaker(say)
+            ai_result = self.call_groq_streaming(user_text, speaker.feed, on_error=speaker.abort)
+            speaker.finish()
+        else:
+            ai_result = self.call_groq(user_text)
 
         has_errors = ai_result.get("has_errors",False)
         explanation = ai_result.get("explanation", "")
         conversational_response = ai_result.get("conversational_response","Let's keep practicing!")
         
-        full_response_to_speak = ""
-        if has_errors and explanation:
-            full_response_to_speak = f"{explanation} {conversational_response}"
-        else:
-            full_response_to_speak = f"That's perfectly said! {conversational_response}"
-            
-        self.speak(full_response_to_speak)
+        with span("speak"):
+            if utterances:
+                self.tts.wait()
+            else:
+                # Nothing streamed (or streaming is off): say it all at once, as before
+                full_response_to_speak = ""
+                if has_errors and explanation:
+                    full_response_to_speak = f"{explanation} {conversational_response}"
+                else:
+                    full_response_to_speak = f"{PERFECT_PREFIX} {conversational_response}"
+                utterances.append(self.speak(full_response_to_speak))
         
         print("\n--- Debug Info ---")
         print(f"  Original:   {user_text}")
@@ -174,11 +357,15 @@ Now analyze the message above and return only the JSON."""
             print(f"  Explanation: {explanation}")
         print("--------------------")
         
-        if len(self.conversation_history)>10:
-            self.conversation_history = [self.conversation_history[0]] + self.conversation_history[-9:]
+        # The prompt builder trims history to the token budget; this just bounds memory
+        if len(self.history_turns) > MAX_HISTORY_TURNS:
+            self.history_turns = self.history_turns[-MAX_HISTORY_TURNS:]
+        return utterances[0]
 
     def start_session(self):
         welcome_msg = "Hello! I'm Alex, your English tutor. Let's start our conversation. You can talk about anything you'd like!"
+        if self.preload_whisper:
+            preload_whisper(self.whisper_model_name)  # loads while the welcome is spoken
         self.speak(welcome_msg)
 
         while True:
@@ -204,8 +391,15 @@ Now analyze the message above and return only the JSON."""
 def run_conversation():
     print("Welcome to Alex - Your Personal English Tutor!")
     tutor = EnglishTutor()
-    tutor.start_session()
+    try:
+        tutor.start_session()
+    finally:
+        tutor.tts.close()
+        print(f"LLM connection stats: {connection_stats.snapshot()}")
+        shutdown_llm_clients()
+
 
-run_conversation()
+if __name__ == "__main__":
+    run_conversation()
 
 
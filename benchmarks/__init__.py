@@ -0,0 +1,8 @@
+"""
+Performance benchmarks for the tutor. Run them from the project root, e.g.
+
+    python -m benchmarks.bench_async_views
+    python -m benchmarks.bench_suite --output bench-results.json
+
+They talk to a local stub LLM server (benchmarks.stub_llm), never to Groq.
+"""
@@ -0,0 +1,154 @@
+"""
+Sync (WSGI) vs async (ASGI) throughput of /api/message/ against the stub LLM.
+
+The sync run drives the WSGI handler from --workers threads, like a threaded
+WSGI server. The async run drives the ASGI handler from one event loop with
+--concurrency requests in flight. Each mode runs in its own subprocess
+because TUTOR_ASYNC_VIEWS is read when the URLconf is loaded.
+
+"peak" is the most requests the stub was answering at once, i.e. the
+concurrency each mode actually reached. "cpu ms" is what each request costs
+the app process (mostly building and parsing the OpenAI client's request and
+response) and "stub cpu ms" what answering it costs the stub. The async run
+reaches its concurrency but not concurrency / latency req/s: its requests
+start in waves of --concurrency, and a wave's CPU work queues for the cores
+before the LLM wait begins, so it is bound by
+concurrency / (latency + concurrency * cpu ms / cores).
+
+    python -m benchmarks.bench_async_views --latency 1.0 --requests 200 --workers 8 --concurrency 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from . import django_env
+from .report import summarize
+from .stub_llm import StubLLMServer
+
+
+def message(n):
+    # Too long for the fast path, and numbered so the correction cache can't answer it:
+    # every request makes the full analysis call
+    return json.dumps({"message": f"Yesterday I goed to the park with my dog, take {n}", "input_method": "text"})
+
+
+def run_sync(args):
+    django_env.setup()
+    from django.test import Client
+
+    latencies = []
+    lock = threading.Lock()
+    remaining = [args.requests]
+
+    def worker():
+        client = Client()
+        client.get("/")  # creates the session_id, like a real page load
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                n = remaining[0]
+            start = time.perf_counter()
+            response = client.post("/api/message/", message(n), content_type="application/json")
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, response.content
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.workers)]
+    start, cpu_start = time.perf_counter(), time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {**summarize(latencies, time.perf_counter() - start),
+            "cpu_ms": cpu_ms_per_request(cpu_start, args.requests)}
+
+
+def run_async(args):
+    django_env.setup()
+    from django.test import AsyncClient
+
+    latencies = []
+
+    async def conversation(client, queue):
+        while not queue.empty():
+            n = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.post("/api/message/", message(n), content_type="application/json")
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.content
+
+    async def main():
+        queue = asyncio.Queue()
+        for n in range(args.requests):
+            queue.put_nowait(n)
+        clients = [AsyncClient() for _ in range(args.concurrency)]
+        # Page loads create the session_ids; they aren't the API's throughput, so run them untimed
+        await asyncio.gather(*(client.get("/") for client in clients))
+        start, cpu_start = time.perf_counter(), time.process_time()
+        await asyncio.gather(*(conversation(client, queue) for client in clients))
+        return time.perf_counter() - start, cpu_ms_per_request(cpu_start, args.requests)
+
+    elapsed, cpu_ms = asyncio.run(main())
+    return {**summarize(latencies, elapsed), "cpu_ms": cpu_ms}
+
+
+def cpu_ms_per_request(cpu_start, requests):
+    # process_time() counts every thread, so this includes sync_to_async work
+    return round((time.process_time() - cpu_start) / requests * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=1.0, help="stub LLM latency in seconds")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8, help="threads for the sync (WSGI) run")
+    parser.add_argument("--concurrency", type=int, default=100, help="in-flight requests for the async run")
+    parser.add_argument("--run-mode", choices=["sync", "async"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        result = run_sync(args) if args.run_mode == "sync" else run_async(args)
+        print(json.dumps(result))
+        return
+
+    with StubLLMServer(latency=args.latency) as stub:
+        results = {}
+        for mode in ("sync", "async"):
+            stub.peak_in_flight = 0
+            stub_cpu_start = time.process_time()  # this process only runs the stub meanwhile
+            env = dict(os.environ, GROQ_BASE_URL=stub.url, TUTOR_ASYNC_VIEWS="1" if mode == "async" else "0",
+                       LLM_POOL_SIZE=str(max(args.workers, args.concurrency)))
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_async_views", "--run-mode", mode,
+                 "--requests", str(args.requests), "--workers", str(args.workers),
+                 "--concurrency", str(args.concurrency)],
+                env=env, cwd=django_env.ROOT, capture_output=True, text=True, check=True,
+            )
+            results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+            results[mode]["peak"] = stub.peak_in_flight
+            results[mode]["stub_cpu_ms"] = cpu_ms_per_request(stub_cpu_start, args.requests)
+
+    print(f"Stub LLM latency {args.latency}s, {args.requests} requests")
+    print(f"Sync ceiling (workers / latency): {args.workers / args.latency:.1f} req/s")
+    cores = os.cpu_count() or 1
+    cpu_seconds = (results["async"]["cpu_ms"] + results["async"]["stub_cpu_ms"]) / 1000
+    bound = args.concurrency / (args.latency + args.concurrency * cpu_seconds / cores)
+    print(f"Async bound (concurrency / (latency + concurrency * cpu / {cores} cores)): {bound:.1f} req/s")
+    print(f"{'mode':<6} {'in flight':>9} {'peak':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'cpu ms':>7} {'stub cpu ms':>11}")
+    for mode, in_flight in (("sync", args.workers), ("async", args.concurrency)):
+        r = results[mode]
+        print(f"{mode:<6} {in_flight:>9} {r['peak']:>5} {r['throughput_rps']:>8} {r['p50_ms']:>8} "
+              f"{r['p95_ms']:>8} {r['p99_ms']:>8} {r['cpu_ms']:>7} {r['stub_cpu_ms']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+History query latency before and after the (session_id, timestamp) index.
+
+Seeds --rows ChatMessage rows spread over --sessions sessions into a throwaway
+SQLite database with only 0001_initial applied, times the two per-session
+history queries the views run, then applies the index migration and times
+them again.
+
+    python -m benchmarks.bench_history_index --rows 1000000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from . import django_env
+from .report import percentile
+
+
+def seed(rows, sessions, batch=20000):
+    from django.db import connection, transaction
+
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    sql = (
+        "INSERT INTO tutor_chat_chatmessage "
+        "(user_message, input_method, corrected_sentence, has_errors, explanation, ai_response, session_id, timestamp) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+    )
+    rng = random.Random(42)
+    with connection.cursor() as cursor:
+        for offset in range(0, rows, batch):
+            params = []
+            for i in range(offset, min(offset + batch, rows)):
+                params.append((
+                    "I are happy today", "text", "I am happy today", True,
+                    "We say 'I am' not 'I are'", "Glad to hear it! What made your day?",
+                    f"session-{rng.randrange(sessions)}", start + timedelta(seconds=i),
+                ))
+            with transaction.atomic():
+                cursor.executemany(sql, params)
+
+
+def time_queries(session_ids, repeat):
+    from tutor_chat.history_cache import get_history_cache
+    from tutor_chat.views import page_history_query, recent_history_query
+
+    # The query itself, not get_recent_history(): that is answered from the
+    # history cache after the first turn and would time cache hits
+    turns = get_history_cache().turns
+    timings = {"recent_history (turn)": [], "page_history (page load)": []}
+    for _ in range(repeat):
+        for session_id in session_ids:
+            start = time.perf_counter()
+            list(recent_history_query(session_id, turns))
+            timings["recent_history (turn)"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            list(page_history_query(session_id))
+            timings["page_history (page load)"].append(time.perf_counter() - start)
+    return timings
+
+
+def query_plan(queryset):
+    from django.db import connection
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return "; ".join(row[-1] for row in cursor.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=50, help="sessions sampled per measurement")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db_path = django_env.setup()
+    from django.core.management import call_command
+    from tutor_chat.views import page_history_query, recent_history_query
+
+    call_command("migrate", "tutor_chat", "0001", verbosity=0)
+    print(f"Seeding {args.rows:,} rows over {args.sessions:,} sessions into {db_path} ...")
+    start = time.perf_counter()
+    seed(args.rows, args.sessions)
+    print(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+    session_ids = [f"session-{i}" for i in random.Random(7).sample(range(args.sessions), args.queries)]
+    results = {}
+    for label in ("before", "after"):
+        if label == "after":
+            start = time.perf_counter()
+            call_command("migrate", "tutor_chat", verbosity=0)
+            print(f"Index built in {time.perf_counter() - start:.1f}s")
+        print(f"[{label}] recent_history plan: {query_plan(recent_history_query(session_ids[0], 5))}")
+        print(f"[{label}] page_history plan: {query_plan(page_history_query(session_ids[0]))}")
+        results[label] = time_queries(session_ids, args.repeat)
+
+    print(f"{'query':<26} {'p50 before':>11} {'p50 after':>10} {'p95 before':>11} {'p95 after':>10}  (ms)")
+    for name in results["before"]:
+        before, after = results["before"][name], results["after"][name]
+        print(f"{name:<26} {percentile(before, 50) * 1000:>11.2f} {percentile(after, 50) * 1000:>10.2f} "
+              f"{percentile(before, 95) * 1000:>11.2f} {percentile(after, 95) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Per-request overhead of the full session/auth/messages middleware versus the
+lean API mode (signed-cookie session id, see tutor_chat/lean_api.py).
+
+Each mode makes --requests calls to a cheap API view (GET /api/dashboard/,
+one indexed query of its own) from the same browser session, so the
+difference is what the middleware costs. The session is also given a
+few-kB payload, like a real one that has collected a CSRF token and the odd
+extra key, because the stock middleware loads and decodes the whole row.
+
+    python -m benchmarks.bench_lean_api --requests 2000
+"""
+import argparse
+import json
+import time
+
+from . import django_env
+from .report import summarize
+
+
+def run_mode(client, lean, requests, path):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext, override_settings
+
+    with override_settings(TUTOR_LEAN_API={"ENABLED": lean}):
+        client.get(path)  # warm up; sets the signed cookie in lean mode
+        latencies = []
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(requests):
+                t0 = time.perf_counter()
+                response = client.get(path)
+                latencies.append(time.perf_counter() - t0)
+                assert response.status_code == 200, response.status_code
+            elapsed = time.perf_counter() - start
+    result = summarize(latencies, elapsed)
+    result["mean_us"] = round(sum(latencies) / len(latencies) * 1e6, 1)
+    result["queries_per_request"] = round(len(queries) / requests, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--path", default="/api/dashboard/")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    django_env.setup()
+    from django.test import Client
+
+    client = Client()
+    client.get("/")  # the page load creates the session_id
+    session = client.session
+    session["preferences"] = {"voice": "en-US", "history": ["x" * 64] * 40}
+    session.save()
+
+    results = {mode: run_mode(client, mode == "lean", args.requests, args.path) for mode in ("full", "lean")}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<6} {'mean us':>9} {'p50 ms':>7} {'p95 ms':>7} {'req/s':>8} {'queries/req':>12}")
+    for mode, r in results.items():
+        print(f"{mode:<6} {r['mean_us']:>9.1f} {r['p50_ms']:>7.1f} {r['p95_ms']:>7.1f} "
+              f"{r['throughput_rps']:>8.1f} {r['queries_per_request']:>12.2f}")
+    saved = results["full"]["mean_us"] - results["lean"]["mean_us"]
+    print(f"lean mode saves {saved:.0f} us per request ({saved / results['full']['mean_us']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
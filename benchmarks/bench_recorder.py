@@ -0,0 +1,128 @@
+"""
+Memory use and end-of-speech-to-transcript latency of the CLI recorder
+(utils/audio_2.py) for 5 s, 30 s and 120 s recordings.
+
+    queue  the old recorder: each PortAudio block copied into a queue.Queue,
+           np.concatenate at the end, float32 -> int16, a temp WAV written
+           with soundfile and read straight back as float32 for Whisper
+    ring   AudioRingBuffer: blocks copied into one preallocated float32
+           array, handed to Whisper as a view
+
+No audio device is used: the callback is fed --block-frame blocks of a quiet
+tone, as PortAudio would. Peak memory is measured with tracemalloc over the
+whole recording; latency runs from the moment recording stops until the
+samples are ready for Whisper. With --model (needs whisper installed) the
+transcription itself is timed too, which is the same for both recorders.
+
+    python -m benchmarks.bench_recorder --seconds 5 30 120 --model base
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from .django_env import ROOT
+
+SAMPLE_RATE = 16000
+
+
+def blocks(seconds, block_frames):
+    """float32 (frames, 1) blocks of a quiet tone, reusing one array like PortAudio does."""
+    block = np.empty((block_frames, 1), dtype=np.float32)
+    t = np.arange(block_frames) / SAMPLE_RATE
+    for start in range(0, int(seconds * SAMPLE_RATE), block_frames):
+        block[:, 0] = 0.05 * np.sin(2 * np.pi * 220 * (t + start / SAMPLE_RATE))
+        yield block
+
+
+def record_queue(seconds, block_frames):
+    import soundfile as sf
+
+    q = queue.Queue()
+    for block in blocks(seconds, block_frames):
+        q.put(block.copy())
+    stopped = time.perf_counter()
+    frames = []
+    while not q.empty():
+        frames.append(q.get())
+    audio = np.concatenate(frames, axis=0)
+    int16_audio = (audio * 32767).astype('int16')
+    tmpf = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
+    tmpf.close()
+    sf.write(tmpf.name, int16_audio, SAMPLE_RATE, subtype='PCM_16')
+    data, _ = sf.read(tmpf.name, dtype='float32')
+    os.remove(tmpf.name)
+    return stopped, data[:, 0] if data.ndim == 2 else data
+
+
+def record_ring(seconds, block_frames, buffer):
+    buffer.clear()
+    for block in blocks(seconds, block_frames):
+        buffer.write(block)
+    stopped = time.perf_counter()
+    return stopped, buffer.get()
+
+
+def run(mode, seconds, block_frames, model):
+    from utils.audio_2 import AudioRingBuffer
+
+    tracemalloc.start()
+    if mode == "ring":
+        stopped, audio = record_ring(seconds, block_frames, AudioRingBuffer(SAMPLE_RATE))
+    else:
+        stopped, audio = record_queue(seconds, block_frames)
+    ready = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(audio) >= int(seconds * SAMPLE_RATE) - block_frames
+    result = {
+        "peak_mb": round(peak / 2 ** 20, 2),
+        "to_array_ms": round((ready - stopped) * 1000, 2),
+    }
+    if model is not None:
+        model.transcribe(audio, task="transcribe", language="en")
+        result["to_transcript_ms"] = round((time.perf_counter() - stopped) * 1000, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, nargs="+", default=[5, 30, 120])
+    parser.add_argument("--block-frames", type=int, default=1024, help="frames per PortAudio callback")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case; the median latency is reported")
+    parser.add_argument("--model", help="also time transcription with this Whisper model")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT))
+    model = None
+    if args.model:
+        from utils.whisper_registry import get_whisper_model
+
+        model = get_whisper_model(args.model)
+
+    results = {}
+    for seconds in args.seconds:
+        for mode in ("queue", "ring"):
+            runs = [run(mode, seconds, args.block_frames, model) for _ in range(args.repeat)]
+            key = "to_transcript_ms" if model is not None else "to_array_ms"
+            runs.sort(key=lambda r: r[key])
+            results[f"{mode} {seconds:g}s"] = runs[len(runs) // 2]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    header = f"{'case':<12} {'peak MB':>8} {'stop->array ms':>15}"
+    print(header + (f" {'stop->transcript ms':>20}" if model is not None else ""))
+    for case, r in results.items():
+        line = f"{case:<12} {r['peak_mb']:>8.2f} {r['to_array_ms']:>15.2f}"
+        print(line + (f" {r['to_transcript_ms']:>20.1f}" if model is not None else ""))
+
+
+if __name__ == "__main__":
+    main()
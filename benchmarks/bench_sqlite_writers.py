@@ -0,0 +1,130 @@
+"""
+Concurrent ChatMessage writers against SQLite, under three configurations:
+
+    default       stock settings, one INSERT transaction per message
+    production    TUTOR_DB_PROFILE=production (WAL, synchronous=NORMAL,
+                  IMMEDIATE transactions, busy timeout, persistent connections)
+    write-behind  production plus TUTOR_WRITE_BEHIND (batched bulk_create)
+
+--writers threads each save --messages rows through save_chat_message, the
+helper the views use, while --readers threads keep running the per-turn
+history query. Each configuration runs in its own subprocess because database
+settings are read when Django starts.
+
+    python -m benchmarks.bench_sqlite_writers --writers 16 --messages 200 --readers 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from . import django_env
+from .report import percentile
+
+PROFILES = {
+    "default": {},
+    "production": {"TUTOR_DB_PROFILE": "production"},
+    "write-behind": {"TUTOR_DB_PROFILE": "production", "TUTOR_WRITE_BEHIND": "1"},
+}
+
+
+def run(args):
+    django_env.setup()
+    from django.db import connection
+    from tutor_chat.models import ChatMessage
+    from tutor_chat.views import recent_history_query
+    from tutor_chat.write_queue import get_writer, save_chat_message
+
+    latencies, errors, reads = [], [], [0]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def writer(index):
+        for i in range(args.messages):
+            fields = {
+                "user_message": f"message {i}", "corrected_sentence": f"message {i}", "has_errors": False,
+                "explanation": "", "ai_response": "Tell me more!", "session_id": f"session-{index}",
+            }
+            start = time.perf_counter()
+            try:
+                save_chat_message(fields)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+        connection.close()
+
+    def reader(index):
+        while not done.is_set():
+            try:
+                list(recent_history_query(f"session-{index}", 5))
+                with lock:
+                    reads[0] += 1
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+        connection.close()
+
+    readers = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    writers = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    for thread in readers:
+        thread.start()
+    start = time.perf_counter()
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    writer_queue = get_writer()
+    if writer_queue is not None:
+        writer_queue.flush()  # count the time until every row is actually stored
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in readers:
+        thread.join()
+
+    return {
+        "rows": ChatMessage.objects.count(),
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_s": round(args.writers * args.messages / elapsed, 1),
+        "save_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "save_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "reads_per_s": round(reads[0] / elapsed, 1),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else "",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--messages", type=int, default=200, help="rows saved per writer")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run(args)))
+        return
+
+    print(f"{args.writers} writers x {args.messages} rows, {args.readers} readers")
+    print(f"{'profile':<13} {'rows/s':>8} {'save p50':>9} {'save p99':>9} {'reads/s':>8} {'errors':>7}  (ms)")
+    for name, env in PROFILES.items():
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_sqlite_writers", "--run",
+             "--writers", str(args.writers), "--messages", str(args.messages), "--readers", str(args.readers)],
+            env=dict(os.environ, **env), cwd=django_env.ROOT, capture_output=True, text=True, check=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{name:<13} {r['rows_per_s']:>8} {r['save_p50_ms']:>9} {r['save_p99_ms']:>9} "
+              f"{r['reads_per_s']:>8} {r['errors']:>7}")
+        if r["first_error"]:
+            print(f"    first error: {r['first_error']}")
+
+
+if __name__ == "__main__":
+    main()
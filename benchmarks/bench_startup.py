@@ -0,0 +1,83 @@
+"""
+Cold-start time of the CLI tutor (Final_Version.py): time to the first input
+prompt and time to the first transcription, for three ways of loading Whisper.
+
+    eager    load the model in the constructor, as the tutor used to
+    lazy     load it on the first voice turn
+    preload  start loading on a background thread while the welcome is spoken
+
+Each mode runs in a fresh interpreter so imports are cold. The welcome
+message is simulated with --welcome seconds of sleep, and the learner takes
+--think seconds to start speaking before the first voice turn. The first
+transcription is of --audio seconds of a quiet tone. Needs whisper (and torch)
+installed; pyttsx3 and an audio device are not used.
+
+    python -m benchmarks.bench_startup --model base --welcome 3 --think 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from .django_env import ROOT
+
+MODES = ("eager", "lazy", "preload")
+
+
+def run_child(args):
+    start = time.perf_counter()
+    sys.path.insert(0, str(ROOT))
+    import numpy as np
+
+    import Final_Version
+    from utils.whisper_registry import get_whisper_model
+
+    imported = time.perf_counter() - start
+    Final_Version.EnglishTutor.speak = lambda self, text: time.sleep(args.welcome)
+    tutor = Final_Version.EnglishTutor(whisper_model_name=args.model, preload_whisper=args.mode == "preload")
+    if args.mode == "eager":
+        get_whisper_model(args.model)
+    if args.mode == "preload":
+        Final_Version.preload_whisper(args.model)
+    tutor.speak("welcome")
+    first_prompt = time.perf_counter() - start
+
+    time.sleep(args.think)
+    spoken = time.perf_counter()
+    t = np.arange(int(args.audio * Final_Version.SAMPLE_RATE)) / Final_Version.SAMPLE_RATE
+    audio = (0.05 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    tutor.whisper_model.transcribe(audio, task="transcribe", language="en")
+    print(json.dumps({
+        "import_s": round(imported, 2),
+        "first_prompt_s": round(first_prompt, 2),
+        "first_transcription_s": round(time.perf_counter() - spoken, 2),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--welcome", type=float, default=3.0, help="seconds the welcome message takes to speak")
+    parser.add_argument("--think", type=float, default=4.0, help="seconds before the learner's first voice turn")
+    parser.add_argument("--audio", type=float, default=3.0, help="seconds of audio in the first voice turn")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        return run_child(args)
+
+    env = {**os.environ, "PYTHONWARNINGS": "ignore"}
+    print(f"{'mode':<8} {'import s':>9} {'first prompt s':>15} {'first transcription s':>22}")
+    for mode in MODES:
+        command = [sys.executable, "-m", "benchmarks.bench_startup", "--mode", mode, "--model", args.model,
+                   "--welcome", str(args.welcome), "--think", str(args.think), "--audio", str(args.audio)]
+        output = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<8} {result['import_s']:>9.2f} {result['first_prompt_s']:>15.2f} "
+              f"{result['first_transcription_s']:>22.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Wait after the learner stops speaking until the transcript is ready: batch
+transcription (transcribe_audio1 on the whole take) versus streaming
+(StreamingTranscriber, in utils/audio_2.py, working while the take is
+recorded and finishing the tail at the end).
+
+Each WAV fixture is played into an AudioRingBuffer in 1024-frame blocks at
+--speed times real time, as the recorder would fill it. Pass recorded takes
+with --wav; without them, synthetic 5 s, 30 s and 120 s fixtures (a voiced
+tone with short pauses) are written to a temp directory.
+
+--model loads a Whisper model (needs whisper installed). The default,
+"simulated", sleeps 0.15 s plus 0.08 s per second of audio per call, about
+the CPU cost of the base model, which shows the shape of the latency without
+whisper; its sleeps are divided by --speed along with the playback.
+
+    python -m benchmarks.bench_streaming --wav take1.wav take2.wav --model base
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .django_env import ROOT
+
+SAMPLE_RATE = 16000
+BLOCK = 1024
+
+
+class SimulatedModel:
+    def __init__(self, speed, fixed=0.15, per_second=0.08):
+        self.speed = speed
+        self.fixed = fixed
+        self.per_second = per_second
+
+    def transcribe(self, audio, **options):
+        seconds = len(audio) / SAMPLE_RATE
+        time.sleep((self.fixed + self.per_second * seconds) / self.speed)
+        segments = [{"start": float(s), "end": float(min(s + 2, seconds)), "text": " word"}
+                    for s in np.arange(0, seconds, 2)]
+        return {"text": "".join(s["text"] for s in segments), "segments": segments}
+
+
+def synthetic_fixtures(directory, lengths):
+    from utils.audio_2 import save_wav
+
+    rng = np.random.default_rng(0)
+    paths = []
+    for seconds in lengths:
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        voiced = np.sin(2 * np.pi * 0.4 * t) > -0.8  # a short pause every 2.5 s
+        audio = rng.normal(0, 0.002, len(t)) + voiced * 0.1 * np.sin(2 * np.pi * 180 * t)
+        audio = np.concatenate((audio, rng.normal(0, 0.002, int(0.8 * SAMPLE_RATE))))  # VAD's end-of-speech wait
+        path = os.path.join(directory, f"synthetic_{seconds:g}s.wav")
+        save_wav(path, audio.astype(np.float32), SAMPLE_RATE)
+        paths.append(path)
+    return paths
+
+
+def load(path):
+    import soundfile as sf
+
+    audio, sr = sf.read(path, dtype="float32")
+    if audio.ndim == 2:
+        audio = audio[:, 0]
+    if sr != SAMPLE_RATE:
+        raise SystemExit(f"{path}: expected {SAMPLE_RATE} Hz audio, got {sr}")
+    return audio
+
+
+def play(audio, buffer, speed):
+    """Write audio into buffer block by block at speed times real time."""
+    start = time.perf_counter()
+    for offset in range(0, len(audio), BLOCK):
+        buffer.write(audio[offset:offset + BLOCK])
+        delay = start + (offset + BLOCK) / SAMPLE_RATE / speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def run_batch(audio, model, speed):
+    from utils.audio_2 import AudioRingBuffer, transcribe_audio1
+
+    buffer = AudioRingBuffer(SAMPLE_RATE, max_seconds=None)
+    play(audio, buffer, speed)
+    stopped = time.perf_counter()
+    transcribe_audio1(buffer.get(), model, SAMPLE_RATE)
+    return {"wait_s": round(time.perf_counter() - stopped, 3)}
+
+
+def run_streaming(audio, model, speed):
+    from utils.audio_2 import AudioRingBuffer, StreamingTranscriber
+
+    buffer = AudioRingBuffer(SAMPLE_RATE, max_seconds=None)
+    streamer = StreamingTranscriber(model, buffer, SAMPLE_RATE).start()
+    play(audio, buffer, speed)
+    stopped = time.perf_counter()
+    _, result = streamer.finish()
+    return {"wait_s": round(time.perf_counter() - stopped, 3), "passes": result["passes"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--wav", nargs="+", help="16 kHz WAV fixtures (default: synthetic ones)")
+    parser.add_argument("--seconds", type=float, nargs="+", default=[5, 30, 120],
+                        help="lengths of the synthetic fixtures")
+    parser.add_argument("--model", default="simulated", help='Whisper model name, or "simulated"')
+    parser.add_argument("--speed", type=float, help="playback speed (default 10 simulated, 1 with Whisper)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT))
+    simulated = args.model == "simulated"
+    speed = args.speed or (10.0 if simulated else 1.0)
+    if simulated:
+        model = SimulatedModel(speed)
+    else:
+        from utils.whisper_registry import get_whisper_model
+
+        model = get_whisper_model(args.model)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = args.wav or synthetic_fixtures(directory, args.seconds)
+        results = {}
+        for path in paths:
+            audio = load(path)
+            with contextlib.redirect_stdout(io.StringIO()):  # keep the table readable
+                results[os.path.basename(path)] = {
+                    "seconds": round(len(audio) / SAMPLE_RATE, 1),
+                    "batch": run_batch(audio, model, speed),
+                    "streaming": run_streaming(audio, model, speed),
+                }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    # Simulated runs are sped up; scale the waits back to real time
+    scale = speed if simulated else 1.0
+    print(f"{'fixture':<24} {'audio s':>8} {'batch wait s':>13} {'streaming wait s':>17} {'passes':>7}")
+    for name, r in results.items():
+        print(f"{name:<24} {r['seconds']:>8.1f} {r['batch']['wait_s'] * scale:>13.2f} "
+              f"{r['streaming']['wait_s'] * scale:>17.2f} {r['streaming']['passes']:>7}")
+
+
+if __name__ == "__main__":
+    main()
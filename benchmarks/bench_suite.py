@@ -0,0 +1,283 @@
+"""
+Load test of the tutor's endpoints against the stub LLM, with results saved as JSON.
+
+Virtual users each load the chat page once and then send a weighted mix of
+requests (--mix) to /api/message/, / and /api/clear/ until --requests have
+been made at each --concurrency level. Two ways of driving the app:
+
+    client  Django's test Client, in this process (no HTTP layer)
+    server  real HTTP against Django's threaded WSGI server (benchmarks.serve)
+
+Each response carries benchmarks.timing's X-Bench-Timing header, so latency is
+split into LLM wait, SQL time and the rest (framework, server and client
+overhead). Run with the same flags before and after a change and compare the
+JSON files:
+
+    python -m benchmarks.bench_suite --latency 0.3 --token-rate 300 --error-rate 0.01 \
+        --concurrency 1,8,32 --requests 300 --output bench-results.json
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from . import django_env
+from .report import breakdown, summarize
+from .stub_llm import StubLLMServer
+
+ENDPOINTS = {
+    "message": ("POST", "/api/message/"),
+    "page": ("GET", "/"),
+    "clear": ("POST", "/api/clear/"),
+}
+
+# A mix of rule-fixable, clean and free-form messages, so the fast path,
+# the correction cache and the full LLM call all get exercised
+SAMPLE_MESSAGES = [
+    "I are happy today",
+    "He don't like coffee",
+    "Yesterday I goed to the cinema with my friends and we watched a movie",
+    "thank you",
+    "My favourite food is pizza because it is delicious and easy to share",
+    "Where is you from?",
+    "I have been learning English for three years but speaking is still hard for me",
+]
+
+
+def parse_mix(value):
+    """'message=8,page=1,clear=1' -> {'message': 8, 'page': 1, 'clear': 1}"""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r} (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class ClientDriver:
+    """Drives the app in-process through django.test.Client."""
+
+    def __init__(self):
+        from django.test import Client
+        self.client = Client()
+
+    def request(self, method, path, body=None):
+        if method == "GET":
+            response = self.client.get(path)
+        else:
+            response = self.client.post(path, body or "{}", content_type="application/json")
+        return response.status_code, response.get("X-Bench-Timing")
+
+    def close(self):
+        pass
+
+
+class HTTPDriver:
+    """Drives a running server over HTTP; cookies keep one session per driver."""
+
+    def __init__(self, base_url):
+        from utils.llm_client import httpx
+        self.client = httpx.Client(base_url=base_url, timeout=120)
+
+    def request(self, method, path, body=None):
+        response = self.client.request(method, path, content=body, headers={"Content-Type": "application/json"})
+        return response.status_code, response.headers.get("X-Bench-Timing")
+
+    def close(self):
+        self.client.close()
+
+
+def run_level(make_driver, concurrency, total_requests, mix, seed, repeat_messages):
+    """Run one concurrency level; returns {'overall': ..., 'endpoints': {...}}."""
+    from .timing import parse_header
+
+    samples = {name: [] for name in ENDPOINTS}
+    errors = {name: 0 for name in ENDPOINTS}
+    lock = threading.Lock()
+    remaining = [total_requests]
+    counter = [0]
+    names, weights = list(mix), list(mix.values())
+
+    def user(index):
+        rng = random.Random(seed + index)
+        driver = make_driver()
+        try:
+            driver.request("GET", "/")  # page load creates the session, like a real visit
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                    counter[0] += 1
+                    n = counter[0]
+                name = rng.choices(names, weights)[0]
+                method, path = ENDPOINTS[name]
+                body = None
+                if name == "message":
+                    text = SAMPLE_MESSAGES[n % len(SAMPLE_MESSAGES)]
+                    if not repeat_messages:
+                        text = f"{text} ({n})"  # defeat the correction cache
+                    body = json.dumps({"message": text, "input_method": "text"})
+                start = time.perf_counter()
+                try:
+                    status, timing = driver.request(method, path, body)
+                except Exception as e:
+                    print(f"{name} request failed: {e}")
+                    with lock:
+                        errors[name] += 1
+                    continue
+                latency = time.perf_counter() - start
+                split = parse_header(timing)
+                with lock:
+                    if status >= 400:
+                        errors[name] += 1
+                    samples[name].append({
+                        "latency": latency,
+                        "llm": split.get("llm", 0.0) / 1000,
+                        "db": split.get("db", 0.0) / 1000,
+                    })
+        finally:
+            driver.close()
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    def report(entries, error_count):
+        result = summarize([s["latency"] for s in entries], elapsed)
+        result["errors"] = error_count
+        result.update(breakdown(entries))
+        return result
+
+    everything = [s for entries in samples.values() for s in entries]
+    return {
+        "overall": report(everything, sum(errors.values())),
+        "endpoints": {name: report(samples[name], errors[name]) for name in mix},
+    }
+
+
+def _wait_for_port(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on {host}:{port} did not start")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=django_env.ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.3, help="stub LLM time to first token, seconds")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="stub LLM tokens per second (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub LLM calls that fail")
+    parser.add_argument("--concurrency", default="1,8", help="comma-separated virtual user counts")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--mix", type=parse_mix, default="message=8,page=1,clear=1",
+                        help="endpoint weights, e.g. message=8,page=1,clear=1")
+    parser.add_argument("--modes", default="client,server", help="client, server or both")
+    parser.add_argument("--repeat-messages", action="store_true",
+                        help="reuse the sample messages verbatim so the correction cache can hit")
+    parser.add_argument("--verbose", action="store_true", help="show the views' own output")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="", help="free-form tag stored with the results")
+    parser.add_argument("--output", default="bench-results.json")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(",")]
+    modes = [mode for mode in args.modes.split(",") if mode]
+
+    stub = StubLLMServer(latency=args.latency, token_rate=args.token_rate,
+                         error_rate=args.error_rate, seed=args.seed).start()
+    # Before Django (and utils.llm_client) are imported, in this process and the server's
+    os.environ["GROQ_BASE_URL"] = stub.url
+    os.environ["LLM_POOL_SIZE"] = str(max(levels + [int(os.environ.get("LLM_POOL_SIZE", "20"))]))
+
+    import django
+    runs = []
+    try:
+        for mode in modes:
+            server = None
+            if mode == "client":
+                django_env.setup(middleware=["benchmarks.timing.TimingMiddleware"])
+                make_driver = ClientDriver
+            elif mode == "server":
+                port = _free_port()
+                server = subprocess.Popen(
+                    [sys.executable, "-m", "benchmarks.serve", "--port", str(port)],
+                    cwd=django_env.ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                )
+                _wait_for_port("127.0.0.1", port)
+                make_driver = lambda: HTTPDriver(f"http://127.0.0.1:{port}")
+            else:
+                parser.error(f"unknown mode {mode!r}")
+            try:
+                for concurrency in levels:
+                    llm_before, llm_errors_before = stub.requests, stub.errors
+                    with open(os.devnull, "w") as devnull, \
+                            contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                        result = run_level(make_driver, concurrency, args.requests, args.mix,
+                                           args.seed, args.repeat_messages)
+                    result.update(mode=mode, concurrency=concurrency,
+                                  llm_calls=stub.requests - llm_before, llm_errors=stub.errors - llm_errors_before)
+                    runs.append(result)
+                    o = result["overall"]
+                    print(f"{mode:<6} c={concurrency:<4} {o['throughput_rps']:>8} req/s  "
+                          f"p50 {o['p50_ms']:>8}  p95 {o['p95_ms']:>8}  p99 {o['p99_ms']:>8} ms  "
+                          f"llm {o['llm_mean_ms']:>8}  db {o['db_mean_ms']:>6}  framework {o['framework_mean_ms']:>6} ms  "
+                          f"errors {o['errors']}")
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.wait(timeout=10)
+    finally:
+        stub.stop()
+
+    results = {
+        "meta": {
+            "label": args.label,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "stub": {"latency": args.latency, "token_rate": args.token_rate, "error_rate": args.error_rate},
+            "requests_per_level": args.requests,
+            "mix": args.mix,
+            "repeat_messages": args.repeat_messages,
+        },
+        "runs": runs,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Time from the end of the learner's input to the first audible word of the
+CLI tutor's answer (Final_Version.EnglishTutor), before and after the
+persistent speech worker.
+
+    before   the whole JSON completion is awaited and parsed, then a new
+             pyttsx3 engine is created, configured and torn down to speak it
+    after    the completion is streamed, and each finished sentence goes to
+             the SpeechWorker, whose engine was created once at startup
+
+The LLM is the local stub (benchmarks/stub_llm.py) returning a reply with a
+two-sentence explanation and a two-sentence response, in the field order the
+system prompt asks for. The TTS engine is simulated, since pyttsx3 needs an
+audio device: creating one costs --init-ms, audio starts --audio-ms after
+runAndWait() and speech runs at TTS_RATE words per minute, scaled by
+--speech-scale to keep runs short.
+
+    python -m benchmarks.bench_tts --turns 10 --latency 0.3 --token-rate 250 --init-ms 150
+"""
+import argparse
+import json
+import sys
+import time
+
+from .django_env import ROOT
+from .report import percentile
+from .stub_llm import StubLLMServer
+
+REPLY = {
+    "corrected_sentence": "I went to the market yesterday.",
+    "has_errors": True,
+    "explanation": "We use the past tense 'went' for something that already happened. "
+                   "'Yesterday' tells us the action is finished.",
+    "conversational_response": "That sounds like a nice trip! What did you buy at the market?",
+}
+
+
+class JSONStub(StubLLMServer):
+    """The stub only sends JSON for prompts saying "Return JSON"; the CLI prompt words it differently."""
+
+    def _content_for(self, payload):
+        return self.reply
+
+
+class SimulatedEngine:
+    """Enough of the pyttsx3 engine API for SpeechWorker and the old speak()."""
+
+    def __init__(self, init_ms, audio_ms, speech_scale):
+        time.sleep(init_ms / 1000)
+        self.audio_ms = audio_ms
+        self.speech_scale = speech_scale
+        self.rate = 165
+        self._queued = []
+        self._callbacks = []
+
+    def getProperty(self, name):
+        return [] if name == "voices" else None
+
+    def setProperty(self, name, value):
+        if name == "rate":
+            self.rate = value
+
+    def connect(self, topic, callback):
+        if topic == "started-utterance":
+            self._callbacks.append(callback)
+
+    def say(self, text):
+        self._queued.append(text)
+
+    def runAndWait(self):
+        for text in self._queued:
+            time.sleep(self.audio_ms / 1000)
+            for callback in self._callbacks:
+                callback("utterance")
+            time.sleep(len(text.split()) / self.rate * 60 * self.speech_scale)
+        self._queued = []
+
+    def stop(self):
+        pass
+
+
+class PerUtteranceSpeech:
+    """The old speak(): a new engine for every call, spoken before returning."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.voice_id = None
+
+    def say(self, text):
+        from utils.tts import Utterance
+
+        utterance = Utterance(text)
+        engine = self.factory()
+        engine.setProperty("rate", 165)
+        engine.setProperty("volume", 1.0)
+        engine.connect("started-utterance", lambda name: utterance.mark_started())
+        engine.say(text)
+        engine.runAndWait()
+        engine.stop()
+        utterance.done.set()
+        return utterance
+
+    def wait(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def run_mode(mode, args):
+    import Final_Version
+    from utils.tts import SpeechWorker
+
+    def factory():
+        return SimulatedEngine(args.init_ms, args.audio_ms, args.speech_scale)
+
+    Final_Version.STREAM_REPLIES = mode == "after"
+    tts = SpeechWorker(engine_factory=factory).start() if mode == "after" else PerUtteranceSpeech(factory)
+    tutor = Final_Version.EnglishTutor(preload_whisper=False, tts=tts)
+    latencies = []
+    for _ in range(args.turns):
+        tutor.history_turns = []
+        start = time.perf_counter()
+        first = tutor._process_turn("I go to the market yesterday")
+        latencies.append(first.started_at - start)
+    tts.close()
+    return {
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3, help="LLM time to first token, seconds")
+    parser.add_argument("--token-rate", type=float, default=250.0, help="LLM tokens per second")
+    parser.add_argument("--init-ms", type=float, default=150.0, help="cost of creating a TTS engine")
+    parser.add_argument("--audio-ms", type=float, default=30.0, help="runAndWait() to audible output")
+    parser.add_argument("--speech-scale", type=float, default=0.1, help="fraction of real speaking time to wait")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT))
+    import contextlib
+    import io
+
+    from utils import llm_client
+
+    with JSONStub(latency=args.latency, token_rate=args.token_rate, reply=REPLY) as server:
+        llm_client.GROQ_BASE_URL = server.url
+        with contextlib.redirect_stdout(io.StringIO()):  # the tutor's console output
+            results = {mode: run_mode(mode, args) for mode in ("before", "after")}
+    llm_client.shutdown()
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<7} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7}   (end of input -> first audible word)")
+    for mode, r in results.items():
+        print(f"{mode:<7} {r['mean_ms']:>8.1f} {r['p50_ms']:>7.1f} {r['p95_ms']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
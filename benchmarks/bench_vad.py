@@ -0,0 +1,113 @@
+"""
+What voice-activity detection (utils/audio_2.py) saves per voice turn.
+
+Each case is a synthetic take: --lead seconds of background noise, speech
+(a voiced tone) with one short pause, then --tail seconds of noise, as when
+the learner finishes talking and reaches for ENTER. For each speech length
+the table shows:
+
+    sent s        seconds of audio Whisper gets, untrimmed and trimmed
+    trim ms       cost of trim_silence() on the whole take
+    stop s        delay from the end of speech to the VoiceActivityDetector
+                  ending the recording (feeding 1024-frame callbacks)
+    vad us/s      detector CPU time per second of audio, i.e. the callback cost
+
+With --model (needs whisper installed) Whisper is also timed on the
+untrimmed and the trimmed audio.
+
+    python -m benchmarks.bench_vad --speech 3 10 30 --lead 2 --tail 3 --model base
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from .django_env import ROOT
+
+SAMPLE_RATE = 16000
+
+
+def take(lead, speech, tail, pause=0.6):
+    rng = np.random.default_rng(0)
+    parts = [("n", lead), ("s", speech / 2), ("n", pause), ("s", speech / 2), ("n", tail)]
+    chunks = []
+    for kind, seconds in parts:
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        chunk = rng.normal(0, 0.002, len(t))
+        if kind == "s":
+            chunk += 0.1 * np.sin(2 * np.pi * 180 * t) * (1 + 0.5 * np.sin(2 * np.pi * 3 * t))
+        chunks.append(chunk)
+    return np.concatenate(chunks).astype(np.float32)
+
+
+def run(speech, args, model):
+    from utils.audio_2 import VoiceActivityDetector, trim_silence
+
+    audio = take(args.lead, speech, args.tail)
+    start = time.perf_counter()
+    trimmed = trim_silence(audio, SAMPLE_RATE)
+    trim_ms = (time.perf_counter() - start) * 1000
+
+    vad = VoiceActivityDetector(SAMPLE_RATE, silence_seconds=args.silence)
+    fed = 0
+    start = time.perf_counter()
+    for fed in range(0, len(audio), 1024):
+        if vad.feed(audio[fed:fed + 1024]):
+            break
+    vad_s = time.perf_counter() - start
+    fed += 1024
+    speech_end = args.lead + speech + 0.6
+    result = {
+        "sent_full_s": round(len(audio) / SAMPLE_RATE, 2),
+        "sent_trimmed_s": round(len(trimmed) / SAMPLE_RATE, 2),
+        "trim_ms": round(trim_ms, 2),
+        "stop_s": round(fed / SAMPLE_RATE - speech_end, 2) if vad.done else None,
+        "vad_us_per_s": round(vad_s * 1e6 / (fed / SAMPLE_RATE), 1),
+    }
+    if model is not None:
+        for name, samples in (("whisper_full_s", audio), ("whisper_trimmed_s", trimmed)):
+            start = time.perf_counter()
+            model.transcribe(samples, task="transcribe", language="en")
+            result[name] = round(time.perf_counter() - start, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--speech", type=float, nargs="+", default=[3, 10, 30], help="seconds of speech per take")
+    parser.add_argument("--lead", type=float, default=2.0, help="seconds of noise before speech")
+    parser.add_argument("--tail", type=float, default=3.0, help="seconds of noise after speech")
+    parser.add_argument("--silence", type=float, default=0.8, help="VAD_SILENCE_SECONDS for the detector")
+    parser.add_argument("--model", help="also time Whisper with this model")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT))
+    model = None
+    if args.model:
+        from utils.whisper_registry import get_whisper_model
+
+        model = get_whisper_model(args.model)
+
+    from utils.audio_2 import trim_silence
+
+    trim_silence(take(0.5, 1, 0.5), SAMPLE_RATE)  # warm up numpy's first-call costs
+    results = {f"{speech:g}s": run(speech, args, model) for speech in args.speech}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    extra = model is not None
+    print(f"{'speech':<7} {'sent s':>13} {'trim ms':>8} {'stop s':>7} {'vad us/s':>9}"
+          + (f" {'whisper s':>13}" if extra else ""))
+    for case, r in results.items():
+        line = (f"{case:<7} {r['sent_full_s']:>6.2f}->{r['sent_trimmed_s']:<6.2f} {r['trim_ms']:>8.2f} "
+                f"{r['stop_s'] if r['stop_s'] is not None else '-':>7} {r['vad_us_per_s']:>9.1f}")
+        if extra:
+            line += f" {r['whisper_full_s']:>6.2f}->{r['whisper_trimmed_s']:<6.2f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
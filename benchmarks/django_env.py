@@ -0,0 +1,42 @@
+"""
+Boot Django for a benchmark run against a throwaway SQLite database,
+so benchmarks never touch db.sqlite3.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup(db_path=None, middleware=()):
+    """
+    Configure settings, point the default database at db_path (a fresh temp
+    file, removed at exit, by default), put any extra middleware in front of
+    the project's, run migrations and return the database path. Admission
+    control is switched off: load generators sending from one session would
+    otherwise be measuring 429s.
+    """
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "english_tutor_web.settings")
+
+    import django
+    from django.conf import settings
+
+    if db_path is None:
+        tmpdir = tempfile.mkdtemp(prefix="tutor-bench-")
+        atexit.register(shutil.rmtree, tmpdir, ignore_errors=True)
+        db_path = os.path.join(tmpdir, "bench.sqlite3")
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]
+    settings.MIDDLEWARE = [*middleware, *settings.MIDDLEWARE]
+    settings.TUTOR_ADMISSION = {**settings.TUTOR_ADMISSION, "BACKEND": "none"}
+    django.setup()
+
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+    return db_path
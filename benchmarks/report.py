@@ -0,0 +1,41 @@
+"""Small helpers for summarising benchmark latencies."""
+import math
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list; 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies, elapsed):
+    """Throughput and latency percentiles (in ms) for one run."""
+    return {
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def breakdown(samples):
+    """
+    Where the time went, from samples of {'latency', 'llm', 'db'} in seconds:
+    mean and p95 in ms of the LLM wait, the SQL time and everything else
+    (framework, server and client overhead).
+    """
+    parts = {
+        "llm": [s["llm"] for s in samples],
+        "db": [s["db"] for s in samples],
+        "framework": [max(0.0, s["latency"] - s["llm"] - s["db"]) for s in samples],
+    }
+    result = {}
+    for name, values in parts.items():
+        result[f"{name}_mean_ms"] = round(sum(values) / len(values) * 1000, 2) if values else 0.0
+        result[f"{name}_p95_ms"] = round(percentile(values, 95) * 1000, 2)
+    return result
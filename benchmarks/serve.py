@@ -0,0 +1,30 @@
+"""
+Run the project under Django's threaded development WSGI server against a
+throwaway database, with benchmarks.timing.TimingMiddleware installed.
+Started by bench_suite for its real-server runs; usable by hand too:
+
+    GROQ_BASE_URL=http://127.0.0.1:8001/v1 python -m benchmarks.serve --port 8002
+"""
+import argparse
+
+from . import django_env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    args = parser.parse_args()
+
+    django_env.setup(middleware=["benchmarks.timing.TimingMiddleware"])
+    from django.conf import settings
+    from django.core.servers.basehttp import run
+    from django.core.wsgi import get_wsgi_application
+
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, args.host]
+    print(f"Serving on http://{args.host}:{args.port}/", flush=True)
+    run(args.host, args.port, get_wsgi_application(), threading=True)
+
+
+if __name__ == "__main__":
+    main()
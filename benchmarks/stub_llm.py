@@ -0,0 +1,228 @@
+"""
+Local OpenAI-compatible stub server for benchmarks.
+
+Answers POST .../chat/completions with a fixed tutor reply: the JSON analysis,
+or just the conversational text when the system prompt doesn't ask for JSON
+(the reply-only prompt asks for plain text). Timing is configurable:
+
+    latency      seconds before the first byte (time to first token)
+    token_rate   tokens per second after that (0 = the whole reply at once);
+                 streamed requests ("stream": true) get one SSE chunk per token
+    error_rate   fraction of requests answered with HTTP 500 instead
+
+It is asyncio-based so hundreds of slow requests can be in flight at once
+without the stub itself becoming the bottleneck.
+
+    python -m benchmarks.stub_llm --port 8001 --latency 1.0 --token-rate 200 --error-rate 0.01
+
+or, from code:
+
+    with StubLLMServer(latency=1.0) as server:
+        os.environ["GROQ_BASE_URL"] = server.url
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+
+DEFAULT_REPLY = {
+    "conversational_response": "That sounds great! Tell me more about it.",
+    "corrected_sentence": "I am happy",
+    "has_errors": True,
+    "explanation": "We say 'I am' not 'I are'",
+}
+
+
+ERROR_BODY = json.dumps({"error": {"message": "stub error", "type": "server_error"}}).encode()
+
+
+def _completion(content):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "stub",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+    }
+
+
+def _chunk(delta, finish_reason=None):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "stub",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def _tokens(text):
+    # Roughly word-and-punctuation sized pieces, which join back to the original text
+    return re.findall(r"\s*\S+", text) or [text]
+
+
+class StubLLMServer:
+    """Runs the stub on its own event loop in a background thread."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.5, reply=None, token_rate=0.0, error_rate=0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        reply = reply or DEFAULT_REPLY
+        self.reply = json.dumps(reply)
+        self.plain_reply = reply.get("conversational_response", self.reply)
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0  # most requests being answered at once
+        self._random = random.Random(seed)
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value.strip())
+                body = await reader.readexactly(length) if length else b"{}"
+                self.requests += 1
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                try:
+                    await self._respond(writer, json.loads(body or b"{}"))
+                finally:
+                    self.in_flight -= 1
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def _content_for(self, payload):
+        messages = payload.get("messages") or [{}]
+        wants_json = "Return JSON" in str(messages[0].get("content", ""))
+        return self.reply if wants_json else self.plain_reply
+
+    async def _respond(self, writer, payload):
+        await asyncio.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            writer.write(
+                b"HTTP/1.1 500 Internal Server Error\r\nContent-Type: application/json\r\n"
+                b"Content-Length: " + str(len(ERROR_BODY)).encode() + b"\r\n\r\n" + ERROR_BODY
+            )
+            await writer.drain()
+            return
+
+        content = self._content_for(payload)
+        tokens = _tokens(content)
+        token_delay = 1 / self.token_rate if self.token_rate else 0.0
+        if not payload.get("stream"):
+            await asyncio.sleep(len(tokens) * token_delay)
+            body = json.dumps(_completion(content)).encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+            await writer.drain()
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        events = [_chunk({"role": "assistant", "content": ""})]
+        events += [_chunk({"content": token}) for token in tokens]
+        events.append(_chunk({}, "stop"))
+        for i, event in enumerate(events):
+            if 0 < i < len(events) - 1 and token_delay:
+                await asyncio.sleep(token_delay)
+            self._write_chunk(writer, f"data: {json.dumps(event)}\n\n".encode())
+            await writer.drain()
+        self._write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _write_chunk(writer, data):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())  # cancels and waits for open connections on the way out
+        except asyncio.CancelledError:
+            pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._server is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._cancel_all)
+            except RuntimeError:  # loop already closed
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _cancel_all(self):
+        for task in asyncio.all_tasks(self._loop):
+            task.cancel()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible stub LLM server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each response")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="tokens per second after the first (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that get HTTP 500")
+    args = parser.parse_args()
+    server = StubLLMServer(args.host, args.port, args.latency,
+                           token_rate=args.token_rate, error_rate=args.error_rate).start()
+    print(f"Stub LLM listening on {server.url} (latency {args.latency}s, {args.token_rate or 'instant'} tokens/s, "
+          f"error rate {args.error_rate}). Ctrl+C to stop.")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
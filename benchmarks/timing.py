@@ -0,0 +1,89 @@
+"""
+Per-request time split for benchmarks.
+
+TimingMiddleware goes first in MIDDLEWARE (django_env.setup(middleware=[...]))
+and adds a header to every response:
+
+    X-Bench-Timing: app=12.40;llm=10.02;db=0.85
+
+all in milliseconds: app is the time spent inside Django, llm the time waiting
+on the provider (utils.llm_client.measure_llm_time) and db the time spent in
+SQL queries. The load generator compares those with the latency it measured
+itself; whatever is left over is framework, server and client overhead.
+"""
+import contextvars
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+
+from utils.llm_client import measure_llm_time
+
+HEADER = "X-Bench-Timing"
+
+_db_timer = contextvars.ContextVar("bench_db_timer", default=None)
+
+
+def _time_query(execute, sql, params, many, context):
+    timer = _db_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer["seconds"] += time.perf_counter() - start
+
+
+def _install_db_timer(sender, connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+# Every connection, in whichever thread sync_to_async runs the ORM
+connection_created.connect(_install_db_timer)
+
+
+class TimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        db = {"seconds": 0.0}
+        token = _db_timer.set(db)
+        start = time.perf_counter()
+        try:
+            with measure_llm_time() as llm:
+                response = self.get_response(request)
+        finally:
+            _db_timer.reset(token)
+        return self._annotate(response, time.perf_counter() - start, llm, db)
+
+    async def __acall__(self, request):
+        db = {"seconds": 0.0}
+        token = _db_timer.set(db)
+        start = time.perf_counter()
+        try:
+            with measure_llm_time() as llm:
+                response = await self.get_response(request)
+        finally:
+            _db_timer.reset(token)
+        return self._annotate(response, time.perf_counter() - start, llm, db)
+
+    @staticmethod
+    def _annotate(response, app_seconds, llm, db):
+        response[HEADER] = f"app={app_seconds * 1000:.2f};llm={llm['seconds'] * 1000:.2f};db={db['seconds'] * 1000:.2f}"
+        return response
+
+
+def parse_header(value):
+    """'app=1.0;llm=0.5;db=0.1' -> {'app': 1.0, 'llm': 0.5, 'db': 0.1} (milliseconds)."""
+    parts = (item.partition("=") for item in (value or "").split(";") if item)
+    return {name: float(number) for name, _, number in parts}
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'english_tutor_web.settings')
+# Route the chat endpoints to the async views (see tutor_chat/urls.py)
+os.environ.setdefault('TUTOR_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
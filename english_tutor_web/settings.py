@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,15 +42,26 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tutor_chat.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'tutor_chat.lean_api.LeanSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'tutor_chat.lean_api.LeanAuthenticationMiddleware',
+    'tutor_chat.lean_api.LeanMessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# The Lean* middleware above behave exactly like Django's session, auth and
+# messages middleware unless ENABLED is on. Then the chat API paths in PATHS
+# read the session_id from a signed cookie instead of loading the database
+# session, and skip auth and messages (see tutor_chat/lean_api.py).
+TUTOR_LEAN_API = {
+    'ENABLED': os.environ.get('TUTOR_LEAN_API', '1') == '1',
+    'PATHS': ('/api/message/', '/api/history/', '/api/clear/', '/api/dashboard/'),
+    'COOKIE_NAME': 'tutor_sid',
+}
+
 ROOT_URLCONF = 'english_tutor_web.urls'
 
 TEMPLATES = [
@@ -70,6 +82,92 @@ TEMPLATES = [
 WSGI_APPLICATION = 'english_tutor_web.wsgi.application'
 
 
+# Serve the async versions of the chat views. asgi.py turns this on;
+# under WSGI the sync views are used.
+TUTOR_ASYNC_VIEWS = os.environ.get('TUTOR_ASYNC_VIEWS', '0') == '1'
+
+# Cache for the grammar-analysis half of responses, keyed by normalized message
+# (see tutor_chat/correction_cache.py). BACKEND is 'local', 'django' or 'none';
+# use 'django' with a shared CACHES backend when running several workers.
+TUTOR_CORRECTION_CACHE = {
+    'BACKEND': 'local',
+    'MAX_ENTRIES': 5000,
+    'TTL': 24 * 60 * 60,
+    'CACHE_ALIAS': 'default',
+}
+
+# Ring buffer of each session's last TURNS exchanges, so call_groq can skip the
+# history query (see tutor_chat/history_cache.py). Same BACKEND choices as above.
+TUTOR_HISTORY_CACHE = {
+    'BACKEND': 'local',
+    'TURNS': 5,
+    'MAX_SESSIONS': 10000,
+    'TTL': 60 * 60,
+    'CACHE_ALIAS': 'default',
+}
+
+# Chat page history: the page renders the last INITIAL messages and fetches
+# older ones from /api/history/ in pages of PAGE_SIZE (at most MAX_PAGE_SIZE)
+# as the user scrolls up (see tutor_chat/pagination.py).
+TUTOR_HISTORY_PAGE = {
+    'INITIAL': 10,
+    'PAGE_SIZE': 20,
+    'MAX_PAGE_SIZE': 100,
+}
+
+# Idempotency-Key handling for /api/message/: duplicates of an in-flight message
+# share its LLM call, repeats within TTL seconds get the stored answer back
+# (see tutor_chat/idempotency.py). Same BACKEND choices as above.
+TUTOR_IDEMPOTENCY = {
+    'BACKEND': 'local',
+    'TTL': 120,
+    'MAX_ENTRIES': 10000,
+    'WAIT_TIMEOUT': 30,
+    'CACHE_ALIAS': 'default',
+}
+
+# Admission control for the message endpoints: a per-session token bucket
+# (RATE messages a second, BURST at once), at most MAX_CONCURRENT LLM calls in
+# flight and a queue of MAX_QUEUE requests waiting up to MAX_WAIT seconds for
+# one; anything beyond gets a 429 with Retry-After (see tutor_chat/admission.py).
+TUTOR_ADMISSION = {
+    'BACKEND': 'local',
+    'RATE': 1.0,
+    'BURST': 10,
+    'MAX_CONCURRENT': 16,
+    'MAX_QUEUE': 32,
+    'MAX_WAIT': 5.0,
+    'MAX_SESSIONS': 10000,
+    'CACHE_ALIAS': 'default',
+}
+
+# Local rule-based grammar check in front of the LLM (see tutor_chat/fast_path.py).
+# With CORRECTION_ONLY the LLM is skipped entirely when the correction is known.
+TUTOR_FAST_PATH = {
+    'ENABLED': True,
+    'MAX_WORDS': 8,
+    'CORRECTION_ONLY': False,
+}
+
+# Prompt size limits (see utils/prompting.py): history turns are dropped,
+# oldest first, to keep each prompt within the budget, and longer learner
+# messages are clipped.
+TUTOR_PROMPT_TOKEN_BUDGET = 1500
+TUTOR_MAX_USER_TOKENS = 300
+
+# Ask the provider for JSON mode on full-analysis calls (see
+# utils/structured_output.py); models that reject it are called without it.
+TUTOR_LLM_JSON_MODE = os.environ.get('TUTOR_LLM_JSON_MODE', '1') == '1'
+
+# Per-stage timings and counters (see utils/metrics.py). ENDPOINT serves them
+# at /metrics/ in the Prometheus text format; SERVER_TIMING adds a
+# Server-Timing header with the stage breakdown to /api/ responses.
+TUTOR_METRICS = {
+    'ENDPOINT': True,
+    'SERVER_TIMING': os.environ.get('TUTOR_SERVER_TIMING', '1' if DEBUG else '0') == '1',
+}
+
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -80,6 +178,50 @@ DATABASES = {
     }
 }
 
+# TUTOR_DB_PROFILE=production tunes SQLite for concurrent users: WAL lets
+# readers run alongside the writer, synchronous=NORMAL is safe under WAL and
+# skips an fsync per commit, IMMEDIATE transactions take the write lock up
+# front (waiting up to 'timeout' seconds instead of failing with "database is
+# locked"), and connections are kept open between requests.
+if os.environ.get('TUTOR_DB_PROFILE') == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA busy_timeout=20000;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-20000;'
+            ),
+        },
+    })
+
+# Optional write-behind queue for ChatMessage inserts (see tutor_chat/write_queue.py).
+# Rows are saved by a background thread with bulk_create, every BATCH_SIZE rows or
+# FLUSH_INTERVAL seconds, so API responses don't wait on the insert; message_id is
+# then returned as null.
+TUTOR_WRITE_BEHIND = {
+    'ENABLED': os.environ.get('TUTOR_WRITE_BEHIND', '0') == '1',
+    'BATCH_SIZE': 50,
+    'FLUSH_INTERVAL': 0.5,
+    'MAX_QUEUE': 10000,
+}
+
+# Retention for ChatMessage rows (see tutor_chat/retention.py): the
+# archive_chats command moves sessions idle for ARCHIVE_DAYS into gzipped JSONL
+# files in ARCHIVE_DIR, SESSIONS_PER_FILE sessions per file, and deletes them
+# BATCH_SIZE rows per transaction.
+TUTOR_RETENTION = {
+    'ARCHIVE_DAYS': 90,
+    'ARCHIVE_DIR': BASE_DIR / 'archive',
+    'SESSIONS_PER_FILE': 1000,
+    'BATCH_SIZE': 500,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,392 @@
+"""
+Admission control for the message endpoints, so a burst from a few sessions
+can't use up the provider's rate limit for everyone.
+
+    with get_admission().admit(session_id):
+        ai_response = call_groq(user_message, session_id)
+
+Each message first takes a token from its session's bucket (RATE tokens a
+second, up to BURST saved up); an empty bucket is rejected with RateLimited.
+It then needs one of MAX_CONCURRENT slots for outstanding LLM calls. When all
+are busy it waits in a queue of at most MAX_QUEUE requests for up to MAX_WAIT
+seconds; a full queue or a wait that runs out is rejected with Overloaded.
+The views turn both into a 429 with a Retry-After header, so clients are told
+to back off at once instead of piling onto a slow provider. An Overloaded
+request gets its token back.
+
+The stream views outlive their with block, so they acquire() a Slot and
+release it when the stream ends or the response is closed, whichever is
+first.
+
+Configured by settings.TUTOR_ADMISSION:
+    BACKEND         'local' (per-process), 'django' (a Django cache shared by
+                    all workers) or 'none' (admit everything)
+    RATE, BURST     per-session token bucket
+    MAX_CONCURRENT  LLM calls in flight at once
+    MAX_QUEUE       requests allowed to wait for a slot
+    MAX_WAIT        seconds a request may wait for a slot
+    MAX_SESSIONS    number of buckets the local backend keeps
+    CACHE_ALIAS     which entry of settings.CACHES the django backend uses
+
+The django backend counts slots with cache.incr/decr, which is atomic on
+Redis and Memcached. Its buckets are read and written without a lock, so two
+workers racing on one session can each spend the same token; fine for a
+limit whose job is to stop bursts, not to bill. A worker killed mid-call
+leaves its slot counted until the cache is cleared.
+"""
+import asyncio
+import contextlib
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from utils.metrics import ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS, REGISTRY
+
+# How often a queued request checks for a free slot
+POLL_INTERVAL = 0.02
+
+
+class AdmissionRejected(Exception):
+    reason = 'rejected'
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class RateLimited(AdmissionRejected):
+    reason = 'rate_limited'
+
+
+class Overloaded(AdmissionRejected):
+    reason = 'overloaded'
+
+
+class Slot:
+    """One admitted request's LLM slot; released once, by whichever of release()/arelease() comes first."""
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._lock = threading.Lock()
+        self._held = True
+
+    def _claim_release(self):
+        with self._lock:
+            held, self._held = self._held, False
+        return held
+
+    def release(self):
+        if self._claim_release():
+            self._controller._release_slot()
+
+    async def arelease(self):
+        if self._claim_release():
+            await self._controller._astore(self._controller._release_slot)
+
+
+class AdmissionController:
+    """
+    Subclasses provide the storage: _take_token, _return_token, _try_slot,
+    _release_slot, _enqueue, _dequeue and the in_flight()/queued() readings.
+    """
+
+    def __init__(self, rate=1.0, burst=5, max_concurrent=16, max_queue=32, max_wait=5.0):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+    def _refill(self, tokens, stamp, now):
+        """Take one token from a bucket last seen at stamp; returns (tokens, seconds until one is free)."""
+        tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0
+        return tokens, (1 - tokens) / self.rate
+
+    def _reject(self, error):
+        ADMISSION_REJECTIONS.inc(reason=error.reason)
+        raise error
+
+    def _check_rate(self, wait):
+        if wait:
+            self._reject(RateLimited("Too many messages, please slow down", wait))
+
+    @contextlib.contextmanager
+    def admit(self, session_id):
+        slot = self.acquire(session_id)
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def acquire(self, session_id):
+        """
+        admit() without the with block, for a slot that outlives the view
+        call (a streamed response); the caller must release() the Slot.
+        """
+        self._check_rate(self._take_token(session_id))
+        try:
+            self._wait_for_slot()
+        except Overloaded:
+            self._return_token(session_id)  # not the session's fault; don't count it against its rate
+            raise
+        return Slot(self)
+
+    def _wait_for_slot(self):
+        if self._try_slot():
+            return
+        if not self._enqueue():
+            self._reject(Overloaded("Server busy, please try again shortly", self.max_wait))
+        start = time.monotonic()
+        try:
+            while not self._try_slot():
+                if time.monotonic() - start >= self.max_wait:
+                    self._reject(Overloaded("Server busy, please try again shortly", self.max_wait))
+                time.sleep(POLL_INTERVAL)
+        finally:
+            self._dequeue()
+            ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start)
+
+    @contextlib.asynccontextmanager
+    async def aadmit(self, session_id):
+        """Async admit(); waiting for a slot doesn't block the event loop."""
+        slot = await self.aacquire(session_id)
+        try:
+            yield
+        finally:
+            await slot.arelease()
+
+    async def aacquire(self, session_id):
+        self._check_rate(await self._astore(self._take_token, session_id))
+        try:
+            await self._await_slot()
+        except Overloaded:
+            await self._astore(self._return_token, session_id)
+            raise
+        return Slot(self)
+
+    async def _await_slot(self):
+        if await self._astore(self._try_slot):
+            return
+        if not await self._astore(self._enqueue):
+            self._reject(Overloaded("Server busy, please try again shortly", self.max_wait))
+        start = time.monotonic()
+        try:
+            while not await self._astore(self._try_slot):
+                if time.monotonic() - start >= self.max_wait:
+                    self._reject(Overloaded("Server busy, please try again shortly", self.max_wait))
+                await asyncio.sleep(POLL_INTERVAL)
+        finally:
+            await self._astore(self._dequeue)
+            ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start)
+
+    async def _astore(self, method, *args):
+        # Local storage never blocks, so call it in place
+        return method(*args)
+
+
+class NullAdmission(AdmissionController):
+    def _take_token(self, session_id):
+        return 0
+
+    def _return_token(self, session_id):
+        pass
+
+    def _try_slot(self):
+        return True
+
+    def _release_slot(self):
+        pass
+
+    def _enqueue(self):
+        return True
+
+    def _dequeue(self):
+        pass
+
+    def in_flight(self):
+        return 0
+
+    def queued(self):
+        return 0
+
+
+class LocalAdmission(AdmissionController):
+    def __init__(self, max_sessions=10000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # session_id -> (tokens, monotonic stamp)
+        self._in_flight = 0
+        self._queued = 0
+
+    def _take_token(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.get(session_id, (self.burst, now))
+            tokens, wait = self._refill(tokens, stamp, now)
+            self._buckets[session_id] = (tokens, now)
+            self._buckets.move_to_end(session_id)
+            while len(self._buckets) > self.max_sessions:
+                self._buckets.popitem(last=False)  # the oldest bucket would be full again anyway
+        return wait
+
+    def _return_token(self, session_id):
+        with self._lock:
+            if session_id in self._buckets:
+                tokens, stamp = self._buckets[session_id]
+                self._buckets[session_id] = (min(self.burst, tokens + 1), stamp)
+
+    def _try_slot(self):
+        with self._lock:
+            if self._in_flight >= self.max_concurrent:
+                return False
+            self._in_flight += 1
+            return True
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _enqueue(self):
+        with self._lock:
+            if self._queued >= self.max_queue:
+                return False
+            self._queued += 1
+            return True
+
+    def _dequeue(self):
+        with self._lock:
+            self._queued -= 1
+
+    def in_flight(self):
+        return self._in_flight
+
+    def queued(self):
+        return self._queued
+
+
+class DjangoAdmission(AdmissionController):
+    IN_FLIGHT_KEY = 'tutor:admission:in_flight'
+    QUEUED_KEY = 'tutor:admission:queued'
+
+    def __init__(self, alias='default', **kwargs):
+        super().__init__(**kwargs)
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _bucket_key(session_id):
+        return 'tutor:admission:bucket:' + hashlib.sha1(str(session_id).encode('utf-8')).hexdigest()
+
+    def _take_token(self, session_id):
+        now = time.time()  # shared between machines, so wall-clock time
+        key = self._bucket_key(session_id)
+        tokens, stamp = self.cache.get(key) or (self.burst, now)
+        tokens, wait = self._refill(tokens, stamp, now)
+        self.cache.set(key, (tokens, now), self._bucket_timeout())
+        return wait
+
+    def _return_token(self, session_id):
+        key = self._bucket_key(session_id)
+        bucket = self.cache.get(key)
+        if bucket is not None:
+            tokens, stamp = bucket
+            self.cache.set(key, (min(self.burst, tokens + 1), stamp), self._bucket_timeout())
+
+    def _bucket_timeout(self):
+        # Untouched for this long, the bucket would be full again anyway
+        return math.ceil(self.burst / self.rate) + 1
+
+    def _incr(self, key):
+        self.cache.add(key, 0, None)
+        return self.cache.incr(key)
+
+    def _claim(self, key, limit):
+        if self._incr(key) <= limit:
+            return True
+        self.cache.decr(key)
+        return False
+
+    def _try_slot(self):
+        return self._claim(self.IN_FLIGHT_KEY, self.max_concurrent)
+
+    def _release_slot(self):
+        self.cache.decr(self.IN_FLIGHT_KEY)
+
+    def _enqueue(self):
+        return self._claim(self.QUEUED_KEY, self.max_queue)
+
+    def _dequeue(self):
+        self.cache.decr(self.QUEUED_KEY)
+
+    def in_flight(self):
+        return self.cache.get(self.IN_FLIGHT_KEY, 0)
+
+    def queued(self):
+        return self.cache.get(self.QUEUED_KEY, 0)
+
+    async def _astore(self, method, *args):
+        return await sync_to_async(method)(*args)
+
+
+def build_admission():
+    config = getattr(settings, 'TUTOR_ADMISSION', {})
+    backend = config.get('BACKEND', 'local')
+    limits = {
+        'rate': config.get('RATE', 1.0),
+        'burst': config.get('BURST', 5),
+        'max_concurrent': config.get('MAX_CONCURRENT', 16),
+        'max_queue': config.get('MAX_QUEUE', 32),
+        'max_wait': config.get('MAX_WAIT', 5.0),
+    }
+    if backend == 'local':
+        return LocalAdmission(max_sessions=config.get('MAX_SESSIONS', 10000), **limits)
+    if backend == 'django':
+        return DjangoAdmission(alias=config.get('CACHE_ALIAS', 'default'), **limits)
+    if backend == 'none':
+        return NullAdmission(**limits)
+    raise ValueError(f"Unknown TUTOR_ADMISSION backend: {backend!r}")
+
+
+_admission = None
+_admission_lock = threading.Lock()
+
+
+def get_admission():
+    """The process-wide admission controller, built from settings on first use."""
+    global _admission
+    if _admission is None:
+        with _admission_lock:
+            if _admission is None:
+                _admission = build_admission()
+    return _admission
+
+
+def reset_admission():
+    global _admission
+    with _admission_lock:
+        _admission = None
+
+
+def _admission_metrics():
+    admission = _admission
+    in_flight = admission.in_flight() if admission is not None else 0
+    queued = admission.queued() if admission is not None else 0
+    return [
+        ('tutor_admission_in_flight', 'gauge', 'Messages holding an LLM slot.', in_flight),
+        ('tutor_admission_queue_depth', 'gauge', 'Messages waiting for an LLM slot.', queued),
+    ]
+
+
+REGISTRY.add_collector(_admission_metrics)
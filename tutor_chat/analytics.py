@@ -0,0 +1,154 @@
+"""
+Per-session learning analytics, kept as one SessionSummary row per session.
+
+record_messages() folds newly saved ChatMessage rows into their sessions'
+summaries and is called in the same transaction as the insert (see
+write_queue.py), so the dashboard only ever reads one small row, however
+long the session's history is. backfill_summaries() rebuilds every summary
+from the ChatMessage table, for existing data or after a bulk import.
+
+Mistakes are grouped into rough categories by keywords in the explanation
+text. The categories are a guide for learners, not a grammar parser: an
+explanation can count towards several, and one that matches none is 'other'.
+"""
+import re
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChatMessage, SessionSummary
+
+# Days of per-day counts kept for the progress chart
+DAILY_DAYS = 30
+
+ERROR_CATEGORIES = [
+    ('subject_verb_agreement', r"agree|subject|third person|with (?:i|you|we|they|he|she|it)\b"
+                               r"|'(?:i|you|we|they|he|she|it)? ?(?:am|is|are|was|were|has|have|do|does|don't|doesn't)'"),
+    ('verb_tense', r"tense|past|present|future|participle|irregular"),
+    ('verb_form', r"infinitive|gerund|-ing\b|auxiliary|modal|verb form"),
+    ('articles', r"\barticles?\b|'an?'|'the'"),
+    ('prepositions', r"preposition"),
+    ('plurals', r"plural|countable"),
+    ('pronouns', r"pronoun"),
+    ('word_order', r"word order|order of"),
+    ('spelling', r"spell|typo"),
+    ('punctuation', r"punctuation|capital|comma|apostrophe"),
+]
+_COMPILED_CATEGORIES = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in ERROR_CATEGORIES]
+
+
+def error_categories(explanation):
+    """The categories an explanation of a mistake falls under."""
+    found = [name for name, pattern in _COMPILED_CATEGORIES if pattern.search(explanation or '')]
+    return found or ['other']
+
+
+class _Totals:
+    """Counts gathered from a run of rows, to be added onto a SessionSummary."""
+
+    def __init__(self):
+        self.messages = self.errors = self.text = self.voice = 0
+        self.first = self.last = None
+        self.categories = {}
+        self.daily = {}
+
+    def add(self, has_errors, input_method, explanation, timestamp):
+        self.messages += 1
+        if input_method == 'voice':
+            self.voice += 1
+        else:
+            self.text += 1
+        day = self.daily.setdefault(timestamp.date().isoformat(), [0, 0])
+        day[0] += 1
+        if has_errors:
+            self.errors += 1
+            day[1] += 1
+            for category in error_categories(explanation):
+                self.categories[category] = self.categories.get(category, 0) + 1
+        self.first = timestamp if self.first is None else min(self.first, timestamp)
+        self.last = timestamp if self.last is None else max(self.last, timestamp)
+
+    def apply(self, summary):
+        summary.message_count += self.messages
+        summary.error_count += self.errors
+        summary.text_count += self.text
+        summary.voice_count += self.voice
+        summary.first_activity = min(filter(None, (summary.first_activity, self.first)))
+        summary.last_activity = max(filter(None, (summary.last_activity, self.last)))
+        for category, count in self.categories.items():
+            summary.error_categories[category] = summary.error_categories.get(category, 0) + count
+        for day, (messages, errors) in self.daily.items():
+            total = summary.daily.setdefault(day, [0, 0])
+            total[0] += messages
+            total[1] += errors
+        summary.daily = dict(sorted(summary.daily.items())[-DAILY_DAYS:])
+        return summary
+
+
+def record_messages(rows):
+    """Add ChatMessage field dicts that were just saved to their sessions' summaries."""
+    per_session = {}
+    now = timezone.now()
+    for fields in rows:
+        totals = per_session.setdefault(fields['session_id'], _Totals())
+        totals.add(fields.get('has_errors', False), fields.get('input_method', 'text'),
+                   fields.get('explanation', ''), fields.get('timestamp') or now)
+    with transaction.atomic():
+        for session_id, totals in per_session.items():
+            summary, _ = SessionSummary.objects.select_for_update().get_or_create(session_id=session_id)
+            totals.apply(summary).save()
+
+
+def forget_sessions(session_ids):
+    SessionSummary.objects.filter(session_id__in=session_ids).delete()
+
+
+def backfill_summaries(batch_size=500):
+    """
+    Rebuild every SessionSummary from ChatMessage in one pass over the rows in
+    session order, writing batch_size summaries at a time; returns the number
+    of sessions.
+    """
+    rows = (ChatMessage.objects.order_by('session_id', 'timestamp')
+            .values_list('session_id', 'has_errors', 'input_method', 'explanation', 'timestamp'))
+    batch, sessions = [], 0
+    current, totals = None, None
+    for session_id, has_errors, input_method, explanation, timestamp in rows.iterator(chunk_size=2000):
+        if session_id != current:
+            if totals is not None:
+                batch.append(totals.apply(SessionSummary(session_id=current)))
+            current, totals = session_id, _Totals()
+            if len(batch) >= batch_size:
+                sessions += _write_summaries(batch)
+                batch = []
+        totals.add(has_errors, input_method, explanation, timestamp)
+    if totals is not None:
+        batch.append(totals.apply(SessionSummary(session_id=current)))
+    return sessions + _write_summaries(batch)
+
+
+def _write_summaries(summaries):
+    SessionSummary.objects.bulk_create(
+        summaries, update_conflicts=True, unique_fields=['session_id'],
+        update_fields=['message_count', 'error_count', 'text_count', 'voice_count', 'first_activity',
+                       'last_activity', 'error_categories', 'daily'])
+    return len(summaries)
+
+
+def dashboard(summary, top=5):
+    """The learner dashboard's JSON for one SessionSummary (or None for a new session)."""
+    if summary is None:
+        summary = SessionSummary()
+    categories = sorted(summary.error_categories.items(), key=lambda item: (-item[1], item[0]))[:top]
+    return {
+        'message_count': summary.message_count,
+        'error_count': summary.error_count,
+        'error_rate': round(summary.error_count / summary.message_count, 4) if summary.message_count else 0.0,
+        'text_count': summary.text_count,
+        'voice_count': summary.voice_count,
+        'first_activity': summary.first_activity.isoformat() if summary.first_activity else None,
+        'last_activity': summary.last_activity.isoformat() if summary.last_activity else None,
+        'top_errors': [{'category': name, 'count': count} for name, count in categories],
+        'daily': [{'date': day, 'messages': messages, 'errors': errors}
+                  for day, (messages, errors) in summary.daily.items()],
+    }
@@ -0,0 +1,194 @@
+"""
+Cache for the grammar-analysis half of a tutor response.
+
+Learners repeat the same short sentences a lot ("I are happy", "how is you").
+Whether a sentence has errors, its corrected form and the explanation do not
+depend on the conversation, so they are cached under a normalized form of the
+message. On a hit only the conversational reply is requested from the model.
+
+Configured by settings.TUTOR_CORRECTION_CACHE:
+    BACKEND      'local' (per-process LRU), 'django' (a Django cache) or 'none'
+    MAX_ENTRIES  LRU size for the local backend
+    TTL          seconds an entry stays valid
+    CACHE_ALIAS  which entry of settings.CACHES the django backend uses
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+CORRECTION_FIELDS = ('corrected_sentence', 'has_errors', 'explanation')
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = re.compile(r'[\s.!?,;:…]+$')
+
+
+def normalize_message(text):
+    """Fold case, collapse whitespace and drop trailing punctuation."""
+    text = _WHITESPACE.sub(' ', text.strip().lower())
+    return _TRAILING_PUNCTUATION.sub('', text)
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+class BaseCorrectionCache:
+    """get/set take the raw user message; subclasses store by normalized key."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    def get(self, message):
+        correction = self._get(normalize_message(message))
+        self.stats.record(correction is not None)
+        return correction
+
+    def set(self, message, ai_result):
+        key = normalize_message(message)
+        if key and all(field in ai_result for field in CORRECTION_FIELDS):
+            self._set(key, {field: ai_result[field] for field in CORRECTION_FIELDS})
+
+    async def aget(self, message):
+        correction = await self._aget(normalize_message(message))
+        self.stats.record(correction is not None)
+        return correction
+
+    async def aset(self, message, ai_result):
+        key = normalize_message(message)
+        if key and all(field in ai_result for field in CORRECTION_FIELDS):
+            await self._aset(key, {field: ai_result[field] for field in CORRECTION_FIELDS})
+
+    # The local backends never block, so the async hooks just reuse the sync ones
+    async def _aget(self, key):
+        return self._get(key)
+
+    async def _aset(self, key, correction):
+        self._set(key, correction)
+
+
+class NullCorrectionCache(BaseCorrectionCache):
+    def _get(self, key):
+        return None
+
+    def _set(self, key, correction):
+        pass
+
+
+class LocalCorrectionCache(BaseCorrectionCache):
+    """In-process LRU with per-entry expiry."""
+
+    def __init__(self, ttl, max_entries):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, correction)
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, correction = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(correction)
+
+    def _set(self, key, correction):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, correction)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCorrectionCache(BaseCorrectionCache):
+    """Shared across workers through one of settings.CACHES (e.g. Redis or memcached)."""
+
+    def __init__(self, ttl, alias='default'):
+        super().__init__(ttl)
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _cache_key(key):
+        # Hash so arbitrary user text is always a valid cache key
+        return 'tutor:correction:' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _get(self, key):
+        return self.cache.get(self._cache_key(key))
+
+    def _set(self, key, correction):
+        self.cache.set(self._cache_key(key), correction, self.ttl)
+
+    async def _aget(self, key):
+        return await self.cache.aget(self._cache_key(key))
+
+    async def _aset(self, key, correction):
+        await self.cache.aset(self._cache_key(key), correction, self.ttl)
+
+
+def build_correction_cache():
+    config = getattr(settings, 'TUTOR_CORRECTION_CACHE', {})
+    backend = config.get('BACKEND', 'local')
+    ttl = config.get('TTL', 24 * 60 * 60)
+    if backend == 'local':
+        return LocalCorrectionCache(ttl, config.get('MAX_ENTRIES', 5000))
+    if backend == 'django':
+        return DjangoCorrectionCache(ttl, config.get('CACHE_ALIAS', 'default'))
+    if backend == 'none':
+        return NullCorrectionCache(ttl)
+    raise ValueError(f"Unknown TUTOR_CORRECTION_CACHE backend: {backend!r}")
+
+
+_correction_cache = None
+_correction_cache_lock = threading.Lock()
+
+
+def get_correction_cache():
+    """The process-wide correction cache, built from settings on first use."""
+    global _correction_cache
+    if _correction_cache is None:
+        with _correction_cache_lock:
+            if _correction_cache is None:
+                _correction_cache = build_correction_cache()
+    return _correction_cache
+
+
+def reset_correction_cache():
+    """Drop the process-wide cache so the next call rebuilds it from settings."""
+    global _correction_cache
+    with _correction_cache_lock:
+        _correction_cache = None
@@ -0,0 +1,150 @@
+"""
+Bulk exports of learner transcripts for teachers, as CSV or JSONL.
+
+Two kinds of export, both built from the same filters (session, date range,
+rows with errors only):
+  - 'messages': one line per ChatMessage, with the correction fields;
+  - 'sessions': one line per session with its message count, has_errors
+    rate and text/voice split, aggregated by the database with GROUP BY.
+Rows are read with .iterator()/.aiterator() and turned into text one at a
+time, so an export of millions of rows streams in constant memory, whether
+it goes to an HTTP response (views.export_chats) or to a file (the
+export_chats management command). export_stats() returns the overall totals
+and the input_method breakdown, also computed in the database.
+"""
+import csv
+import io
+import json
+
+from django.db.models import Count, Max, Min, Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import ChatMessage
+
+FORMATS = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+KINDS = ('messages', 'sessions')
+
+MESSAGE_FIELDS = ('id', 'session_id', 'timestamp', 'input_method', 'user_message', 'corrected_sentence',
+                  'has_errors', 'explanation', 'ai_response')
+SESSION_FIELDS = ('session_id', 'messages', 'errors', 'error_rate', 'text_messages', 'voice_messages',
+                  'first_message', 'last_message')
+
+CHUNK_SIZE = 2000
+
+
+def parse_moment(value, end=False):
+    """A datetime from an ISO date or datetime string; a bare date covers the whole day."""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value!r}")
+        moment = parse_datetime(f"{day.isoformat()}T23:59:59.999999" if end else day.isoformat() + "T00:00")
+    return moment
+
+
+def filtered_messages(session_id=None, since=None, until=None, errors_only=False):
+    messages = ChatMessage.objects.all()
+    if session_id:
+        messages = messages.filter(session_id=session_id)
+    if since is not None:
+        messages = messages.filter(timestamp__gte=since)
+    if until is not None:
+        messages = messages.filter(timestamp__lte=until)
+    if errors_only:
+        messages = messages.filter(has_errors=True)
+    return messages
+
+
+def export_query(messages, kind):
+    """Rows for the export, as dicts keyed by MESSAGE_FIELDS or SESSION_FIELDS."""
+    if kind == 'messages':
+        return messages.order_by('session_id', 'timestamp', 'id').values(*MESSAGE_FIELDS)
+    if kind == 'sessions':
+        return (messages.values('session_id').order_by('session_id').annotate(
+            messages=Count('id'),
+            errors=Count('id', filter=Q(has_errors=True)),
+            text_messages=Count('id', filter=Q(input_method='text')),
+            voice_messages=Count('id', filter=Q(input_method='voice')),
+            first_message=Min('timestamp'),
+            last_message=Max('timestamp'),
+        ))
+    raise ValueError(f"Unknown export kind: {kind!r}")
+
+
+def _prepare(row, kind):
+    if kind == 'sessions':
+        row['error_rate'] = round(row['errors'] / row['messages'], 4) if row['messages'] else 0.0
+    for field, value in row.items():
+        if hasattr(value, 'isoformat'):
+            row[field] = value.isoformat()
+    return row
+
+
+class _LineWriter:
+    """Turns one row at a time into a line of CSV or JSONL text."""
+
+    def __init__(self, fmt, kind):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format: {fmt!r}")
+        self.fmt = fmt
+        self.kind = kind
+        self.fields = MESSAGE_FIELDS if kind == 'messages' else SESSION_FIELDS
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer)
+
+    def header(self):
+        return self._csv_line(self.fields) if self.fmt == 'csv' else ''
+
+    def line(self, row):
+        row = _prepare(row, self.kind)
+        if self.fmt == 'jsonl':
+            return json.dumps({field: row[field] for field in self.fields}, ensure_ascii=False) + '\n'
+        return self._csv_line([row[field] for field in self.fields])
+
+    def _csv_line(self, values):
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._csv.writerow(values)
+        return self._buffer.getvalue()
+
+
+def export_lines(messages, fmt='csv', kind='messages'):
+    """Generator of the export's text, a line at a time."""
+    writer = _LineWriter(fmt, kind)
+    yield writer.header()
+    for row in export_query(messages, kind).iterator(chunk_size=CHUNK_SIZE):
+        yield writer.line(row)
+
+
+async def aexport_lines(messages, fmt='csv', kind='messages'):
+    """Async export_lines(), for streaming responses served under ASGI."""
+    writer = _LineWriter(fmt, kind)
+    yield writer.header()
+    async for row in export_query(messages, kind).aiterator(chunk_size=CHUNK_SIZE):
+        yield writer.line(row)
+
+
+def export_stats(messages):
+    """Totals, has_errors rate and the input_method breakdown, aggregated by the database."""
+    totals = messages.aggregate(
+        messages=Count('id'),
+        errors=Count('id', filter=Q(has_errors=True)),
+        sessions=Count('session_id', distinct=True),
+    )
+    by_method = messages.order_by().values('input_method').annotate(
+        messages=Count('id'), errors=Count('id', filter=Q(has_errors=True)))
+    return {
+        **totals,
+        'error_rate': round(totals['errors'] / totals['messages'], 4) if totals['messages'] else 0.0,
+        'by_input_method': {
+            row['input_method']: {
+                'messages': row['messages'],
+                'errors': row['errors'],
+                'error_rate': round(row['errors'] / row['messages'], 4),
+            }
+            for row in by_method
+        },
+    }
@@ -0,0 +1,150 @@
+"""
+Local, rule-based grammar check that runs before the LLM.
+
+Most learner messages are short. For two kinds of short message the grammar
+analysis can be done on the CPU in microseconds:
+  - well-known mistakes ("I are", "he don't", "I have 25 years old"), which
+    are corrected by rule with a canned explanation;
+  - stock phrases (greetings, thanks, yes/no), which need no correction.
+Everything else, and anything longer than MAX_WORDS, goes to the model as
+before, because a rule can fix one mistake but can't vouch for the rest of a
+long sentence. When the check decides, only the conversational reply is asked
+of the model, or nothing at all in CORRECTION_ONLY mode.
+
+Configured by settings.TUTOR_FAST_PATH:
+    ENABLED          turn the local check on or off
+    MAX_WORDS        longest message the rules are trusted with
+    CORRECTION_ONLY  skip the LLM entirely when the correction is known
+"""
+import re
+import threading
+
+from django.conf import settings
+
+from .correction_cache import normalize_message
+
+# Some pronouns have other uses: "you" and "it" are objects too ("Thank you is
+# enough", "People who like it are nice") and "I" can be a numeral or part of
+# a name ("Chapter I is short"). Those are only taken for the subject at the
+# start of a clause; he, she, we and they are always subjects.
+_CLAUSE_START = r"(^\s*|[.!?,;]\s*)"
+_DONT = "With I, you, we and they we use 'don't', not 'doesn't'."
+_DOESNT = "With he, she and it we use 'doesn't', not 'don't'."
+_IS = "With he, she and it we use 'is', not 'are'."
+_ARE = "With you, we and they we use 'are', not 'is'."
+_WERE = "With you, we and they we use 'were', not 'was'."
+
+# (pattern, replacement, explanation); patterns are matched case-insensitively
+RULES = [
+    (_CLAUSE_START + r"I (?:are|is)\b", r"\1I am", "We say 'I am', not 'I are' or 'I is'."),
+    (_CLAUSE_START + r"I has\b", r"\1I have", "With 'I' we use 'have', not 'has'."),
+    (r"\b(he|she) don't\b", r"\1 doesn't", _DOESNT),
+    (_CLAUSE_START + r"(it) don't\b", r"\1\2 doesn't", _DOESNT),
+    (r"\b(we|they) doesn't\b", r"\1 don't", _DONT),
+    (_CLAUSE_START + r"(I|you) doesn't\b", r"\1\2 don't", _DONT),
+    (r"\b(he|she) are\b", r"\1 is", _IS),
+    (_CLAUSE_START + r"(it) are\b", r"\1\2 is", _IS),
+    (r"\b(we|they) is\b", r"\1 are", _ARE),
+    (_CLAUSE_START + r"(you) is\b", r"\1\2 are", _ARE),
+    (r"\b(how|where|who|what) is (you|they)\b", r"\1 are \2", "We use 'are' with 'you' and 'they'."),
+    (r"\b(we|they) was\b", r"\1 were", _WERE),
+    (_CLAUSE_START + r"(you) was\b", r"\1\2 were", _WERE),
+    (_CLAUSE_START + r"I have (\d+) years? old\b", r"\1I am \2 years old",
+     "In English we say 'I am ... years old', not 'I have ... years old'."),
+]
+_COMPILED_RULES = [(re.compile(pattern, re.IGNORECASE), replacement, explanation)
+                   for pattern, replacement, explanation in RULES]
+
+# Compared after normalize_message(), so case and trailing punctuation don't matter
+CLEAN_PHRASES = frozenset([
+    "hi", "hello", "hey", "hi alex", "hello alex", "hey alex",
+    "good morning", "good afternoon", "good evening", "good night",
+    "how are you", "i am fine", "i'm fine", "i am good", "i'm good", "i am fine thank you",
+    "thanks", "thank you", "thank you so much", "thanks a lot",
+    "yes", "no", "ok", "okay", "sure", "of course", "maybe", "i don't know",
+    "bye", "goodbye", "see you", "see you later", "nice to meet you",
+])
+
+
+def check_locally(text, max_words=8):
+    """
+    Return {'corrected_sentence', 'has_errors', 'explanation'} when the rules
+    are confident, or None to leave the message to the model.
+    """
+    if len(text.split()) > max_words:
+        return None
+    if normalize_message(text) in CLEAN_PHRASES:
+        return {'corrected_sentence': text, 'has_errors': False, 'explanation': ''}
+
+    corrected = text
+    explanations = []
+    for pattern, replacement, explanation in _COMPILED_RULES:
+        corrected, count = pattern.subn(lambda m: _keep_case(m, replacement), corrected)
+        if count and explanation not in explanations:
+            explanations.append(explanation)
+    if not explanations:
+        return None
+    return {'corrected_sentence': corrected, 'has_errors': True, 'explanation': ' '.join(explanations)}
+
+
+def _keep_case(match, replacement):
+    # Keep a capitalized first letter ("He don't" -> "He doesn't")
+    fixed = match.expand(replacement)
+    if match.group(0)[0].isupper():
+        fixed = fixed[0].upper() + fixed[1:]
+    return fixed
+
+
+class FastPathStats:
+    """
+    Share of messages whose grammar analysis skipped the full LLM call, and an
+    estimate of the time saved: the average full-analysis call time minus
+    what the fast-path message still spent on a reply-only call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.messages = 0
+        self.fast_path = 0
+        self._full_calls = 0
+        self._full_seconds = 0.0
+        self._reply_seconds = 0.0
+
+    def record(self, fast_path, full_call_seconds=None, reply_seconds=0.0):
+        """
+        Count one message. full_call_seconds is the time of a full-analysis LLM
+        call, if one was made; reply_seconds is what a fast-path message still
+        spent on the reply-only call.
+        """
+        with self._lock:
+            self.messages += 1
+            if fast_path:
+                self.fast_path += 1
+                self._reply_seconds += reply_seconds
+            if full_call_seconds is not None:
+                self._full_calls += 1
+                self._full_seconds += full_call_seconds
+
+    def snapshot(self):
+        with self._lock:
+            avg_full = self._full_seconds / self._full_calls if self._full_calls else 0.0
+            saved = max(0.0, avg_full * self.fast_path - self._reply_seconds)
+            return {
+                'messages': self.messages,
+                'fast_path': self.fast_path,
+                'fast_path_pct': round(100 * self.fast_path / self.messages, 1) if self.messages else 0.0,
+                'avg_full_call_ms': round(avg_full * 1000, 1),
+                'est_saved_ms': round(saved * 1000, 1),
+            }
+
+
+fast_path_stats = FastPathStats()
+
+
+def fast_path_config():
+    config = getattr(settings, 'TUTOR_FAST_PATH', {})
+    return {
+        'ENABLED': config.get('ENABLED', True),
+        'MAX_WORDS': config.get('MAX_WORDS', 8),
+        'CORRECTION_ONLY': config.get('CORRECTION_ONLY', False),
+    }
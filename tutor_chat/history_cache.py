@@ -0,0 +1,188 @@
+"""
+Per-session cache of the most recent conversation turns.
+
+call_groq needs the last few (user message, AI reply) pairs of a session on
+every turn, and they were written moments earlier by the same process. This
+keeps them in a bounded ring buffer per session: filled from the database on
+a miss, appended to when a message is saved and dropped when the history is
+cleared, so active conversations need no history query at all.
+
+Configured by settings.TUTOR_HISTORY_CACHE:
+    BACKEND       'local' (per-process LRU), 'django' (a Django cache) or 'none'
+    TURNS         turns kept per session (the prompt's history window)
+    MAX_SESSIONS  sessions kept by the local backend
+    TTL           seconds an idle session stays cached
+    CACHE_ALIAS   which entry of settings.CACHES the django backend uses
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class BaseHistoryCache:
+    """
+    Turns are (user_message, ai_response) tuples, oldest first.
+    get() returns None on a miss, which is different from a cached empty history.
+    """
+
+    def __init__(self, turns, ttl):
+        self.turns = turns
+        self.ttl = ttl
+
+    # Only the django backend does I/O; the others reuse the sync methods
+    async def aget(self, session_id):
+        return self.get(session_id)
+
+    async def aset(self, session_id, turns):
+        self.set(session_id, turns)
+
+    async def aappend(self, session_id, user_message, ai_response):
+        self.append(session_id, user_message, ai_response)
+
+    async def adelete(self, session_id):
+        self.delete(session_id)
+
+
+class NullHistoryCache(BaseHistoryCache):
+    def get(self, session_id):
+        return None
+
+    def set(self, session_id, turns):
+        pass
+
+    def append(self, session_id, user_message, ai_response):
+        pass
+
+    def delete(self, session_id):
+        pass
+
+
+class LocalHistoryCache(BaseHistoryCache):
+    """In-process LRU of sessions, each holding a deque(maxlen=turns)."""
+
+    def __init__(self, turns, ttl, max_sessions):
+        super().__init__(turns, ttl)
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> (expires_at, deque of turns)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            expires_at, turns = entry
+            if expires_at < time.monotonic():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return list(turns)
+
+    def set(self, session_id, turns):
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic() + self.ttl, deque(turns, maxlen=self.turns))
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def append(self, session_id, user_message, ai_response):
+        # Only extend a history we already hold; a partial one would hide older DB turns
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return
+            turns = entry[1]
+            turns.append((user_message, ai_response))
+            self._sessions[session_id] = (time.monotonic() + self.ttl, turns)
+            self._sessions.move_to_end(session_id)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class DjangoHistoryCache(BaseHistoryCache):
+    """Shared across workers through one of settings.CACHES (e.g. Redis or memcached)."""
+
+    def __init__(self, turns, ttl, alias='default'):
+        super().__init__(turns, ttl)
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _cache_key(session_id):
+        return f'tutor:history:{session_id}'
+
+    def get(self, session_id):
+        turns = self.cache.get(self._cache_key(session_id))
+        return None if turns is None else [tuple(turn) for turn in turns]
+
+    def set(self, session_id, turns):
+        self.cache.set(self._cache_key(session_id), list(turns)[-self.turns:], self.ttl)
+
+    def append(self, session_id, user_message, ai_response):
+        turns = self.get(session_id)
+        if turns is not None:
+            self.set(session_id, turns + [(user_message, ai_response)])
+
+    def delete(self, session_id):
+        self.cache.delete(self._cache_key(session_id))
+
+    async def aget(self, session_id):
+        turns = await self.cache.aget(self._cache_key(session_id))
+        return None if turns is None else [tuple(turn) for turn in turns]
+
+    async def aset(self, session_id, turns):
+        await self.cache.aset(self._cache_key(session_id), list(turns)[-self.turns:], self.ttl)
+
+    async def aappend(self, session_id, user_message, ai_response):
+        turns = await self.aget(session_id)
+        if turns is not None:
+            await self.aset(session_id, turns + [(user_message, ai_response)])
+
+    async def adelete(self, session_id):
+        await self.cache.adelete(self._cache_key(session_id))
+
+
+def build_history_cache():
+    config = getattr(settings, 'TUTOR_HISTORY_CACHE', {})
+    backend = config.get('BACKEND', 'local')
+    turns = config.get('TURNS', 5)
+    ttl = config.get('TTL', 60 * 60)
+    if backend == 'local':
+        return LocalHistoryCache(turns, ttl, config.get('MAX_SESSIONS', 10000))
+    if backend == 'django':
+        return DjangoHistoryCache(turns, ttl, config.get('CACHE_ALIAS', 'default'))
+    if backend == 'none':
+        return NullHistoryCache(turns, ttl)
+    raise ValueError(f"Unknown TUTOR_HISTORY_CACHE backend: {backend!r}")
+
+
+_history_cache = None
+_history_cache_lock = threading.Lock()
+
+
+def get_history_cache():
+    """The process-wide history cache, built from settings on first use."""
+    global _history_cache
+    if _history_cache is None:
+        with _history_cache_lock:
+            if _history_cache is None:
+                _history_cache = build_history_cache()
+    return _history_cache
+
+
+def reset_history_cache():
+    """Drop the process-wide cache so the next call rebuilds it from settings."""
+    global _history_cache
+    with _history_cache_lock:
+        _history_cache = None
@@ -0,0 +1,316 @@
+"""
+Idempotency keys for /api/message/ and /api/message/stream/.
+
+The chat page sends a fresh Idempotency-Key header with each message it
+submits; other clients may send the header or an "idempotency_key" field. A
+retry of the same request resends the same key. For a given session and key:
+  - while the first request is still running, identical requests wait for it
+    and share its result instead of making their own LLM call (single-flight);
+  - for TTL seconds after it finished, a repeat gets the stored result back,
+    with no new LLM call and no duplicate ChatMessage row.
+Reusing a key for a different message raises IdempotencyConflict (HTTP 422).
+Failed requests aren't stored, so a retry after an error runs again. The
+stream views take part through claim()/complete() and replay a result as a
+single 'done' event.
+
+Waiting for an in-flight request only works within one process. Finished
+results can be shared between workers with the 'django' backend.
+
+Configured by settings.TUTOR_IDEMPOTENCY:
+    BACKEND       'local' (per-process), 'django' (a Django cache) or 'none'
+    TTL           seconds a finished result is replayed
+    MAX_ENTRIES   size limit for the local backend
+    WAIT_TIMEOUT  seconds a duplicate waits for the in-flight request
+    CACHE_ALIAS   which entry of settings.CACHES the django backend uses
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+MAX_KEY_LENGTH = 128
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def idempotency_key(request, data):
+    """The client's key from the header or the JSON body, or None."""
+    key = request.headers.get('Idempotency-Key') or data.get('idempotency_key') or ''
+    return str(key).strip()[:MAX_KEY_LENGTH] or None
+
+
+def fingerprint(message):
+    return hashlib.sha1(message.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.completed = False
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    run()/arun() take a scope (session_id, key), the request's fingerprint and
+    a function producing the response payload; they return (payload, replayed).
+    """
+
+    def __init__(self, ttl, wait_timeout=30):
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._lock = threading.RLock()  # held while _join reads the store, which may lock it again
+        self._in_flight = {}
+
+    def _join(self, scope, fingerprint):
+        """
+        (stored, call, leader): the result stored for scope, or else the
+        in-flight call for scope, starting one if there is none. The store is
+        read again under the lock, so a request finishing between the
+        caller's first lookup and this one is replayed, not run twice.
+        """
+        with self._lock:
+            call = self._in_flight.get(scope)
+            if call is None:
+                stored = self._get(scope)
+                if stored is not None:
+                    return stored, None, False
+                call = self._in_flight[scope] = _Call(fingerprint)
+                return None, call, True
+        if call.fingerprint != fingerprint:
+            raise IdempotencyConflict("Idempotency key reused for a different message")
+        return None, call, False
+
+    async def _ajoin(self, scope, fingerprint):
+        # Local stores never block, so join in place
+        return self._join(scope, fingerprint)
+
+    def _finish(self, scope, call):
+        with self._lock:
+            if self._in_flight.get(scope) is call:
+                del self._in_flight[scope]
+        call.done.set()
+
+    @staticmethod
+    def _check(stored, fingerprint):
+        if stored['fingerprint'] != fingerprint:
+            raise IdempotencyConflict("Idempotency key reused for a different message")
+        return stored['payload'], True
+
+    @staticmethod
+    def _outcome(call):
+        """The leader's result for a duplicate, or None if the leader was cancelled and it should run itself."""
+        if not call.done.is_set():
+            raise TimeoutError("Timed out waiting for the original request")
+        if call.error is not None:
+            raise call.error
+        if not call.completed:
+            return None
+        return call.result, True
+
+    def claim(self, scope, fingerprint):
+        """
+        The first half of run(), for a response sent piece by piece (the
+        stream views). Returns (payload, None) to replay a stored or
+        in-flight result, or (None, call) when the caller is to produce it
+        and then pass the call to complete(), or to abandon() on failure.
+        """
+        stored = self._get(scope)
+        while True:
+            if stored is not None:
+                return self._check(stored, fingerprint)[0], None
+            stored, call, leader = self._join(scope, fingerprint)
+            if leader:
+                return None, call
+            if call is not None:
+                call.done.wait(self.wait_timeout)
+                outcome = self._outcome(call)
+                if outcome is not None:
+                    return outcome[0], None
+
+    async def aclaim(self, scope, fingerprint):
+        stored = await self._aget(scope)
+        while True:
+            if stored is not None:
+                return self._check(stored, fingerprint)[0], None
+            stored, call, leader = await self._ajoin(scope, fingerprint)
+            if leader:
+                return None, call
+            if call is not None:
+                # Duplicates are rare; parking one in a thread keeps the loop free
+                await asyncio.to_thread(call.done.wait, self.wait_timeout)
+                outcome = self._outcome(call)
+                if outcome is not None:
+                    return outcome[0], None
+
+    def complete(self, scope, fingerprint, call, payload):
+        """Store the leader's payload and hand it to the duplicates waiting on call."""
+        try:
+            self._set(scope, {'fingerprint': fingerprint, 'payload': payload})
+            call.result, call.completed = payload, True
+        finally:
+            self._finish(scope, call)
+
+    async def acomplete(self, scope, fingerprint, call, payload):
+        try:
+            await self._aset(scope, {'fingerprint': fingerprint, 'payload': payload})
+            call.result, call.completed = payload, True
+        finally:
+            self._finish(scope, call)
+
+    def abandon(self, scope, call, error=None):
+        """
+        End a call without a result. Waiting duplicates raise error, or
+        without one (the leader was cancelled) run the request themselves.
+        Does nothing once the call has finished.
+        """
+        if not call.done.is_set():
+            call.error = error
+            self._finish(scope, call)
+
+    def run(self, scope, fingerprint, handle):
+        payload, call = self.claim(scope, fingerprint)
+        if call is None:
+            return payload, True
+        try:
+            payload = handle()
+        except Exception as e:
+            self.abandon(scope, call, e)
+            raise
+        except BaseException:
+            self.abandon(scope, call)  # cancelled: the duplicates run it themselves
+            raise
+        self.complete(scope, fingerprint, call, payload)
+        return payload, False
+
+    async def arun(self, scope, fingerprint, handle):
+        """Async run(); handle is a coroutine function."""
+        payload, call = await self.aclaim(scope, fingerprint)
+        if call is None:
+            return payload, True
+        try:
+            payload = await handle()
+        except Exception as e:
+            self.abandon(scope, call, e)
+            raise
+        except BaseException:
+            self.abandon(scope, call)
+            raise
+        await self.acomplete(scope, fingerprint, call, payload)
+        return payload, False
+
+    # Local stores never block, so the async hooks just reuse the sync ones
+    async def _aget(self, scope):
+        return self._get(scope)
+
+    async def _aset(self, scope, entry):
+        self._set(scope, entry)
+
+
+class NullSingleFlight(SingleFlight):
+    """In-flight coalescing only; nothing is replayed afterwards."""
+
+    def _get(self, scope):
+        return None
+
+    def _set(self, scope, entry):
+        pass
+
+
+class LocalSingleFlight(SingleFlight):
+    def __init__(self, ttl, wait_timeout=30, max_entries=10000):
+        super().__init__(ttl, wait_timeout)
+        self.max_entries = max_entries
+        self._results = OrderedDict()  # scope -> (expires_at, entry)
+
+    def _get(self, scope):
+        with self._lock:
+            item = self._results.get(scope)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._results[scope]
+                return None
+            return item[1]
+
+    def _set(self, scope, entry):
+        with self._lock:
+            self._results[scope] = (time.monotonic() + self.ttl, entry)
+            self._results.move_to_end(scope)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+
+class DjangoSingleFlight(SingleFlight):
+    """Finished results shared across workers through one of settings.CACHES."""
+
+    def __init__(self, ttl, wait_timeout=30, alias='default'):
+        super().__init__(ttl, wait_timeout)
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _cache_key(scope):
+        return 'tutor:idempotency:' + hashlib.sha1(repr(scope).encode('utf-8')).hexdigest()
+
+    def _get(self, scope):
+        return self.cache.get(self._cache_key(scope))
+
+    def _set(self, scope, entry):
+        self.cache.set(self._cache_key(scope), entry, self.ttl)
+
+    async def _aget(self, scope):
+        return await self.cache.aget(self._cache_key(scope))
+
+    async def _aset(self, scope, entry):
+        await self.cache.aset(self._cache_key(scope), entry, self.ttl)
+
+    async def _ajoin(self, scope, fingerprint):
+        # _join reads the cache under a thread lock; keep that off the event loop
+        return await sync_to_async(self._join)(scope, fingerprint)
+
+
+def build_single_flight():
+    config = getattr(settings, 'TUTOR_IDEMPOTENCY', {})
+    backend = config.get('BACKEND', 'local')
+    ttl = config.get('TTL', 120)
+    wait_timeout = config.get('WAIT_TIMEOUT', 30)
+    if backend == 'local':
+        return LocalSingleFlight(ttl, wait_timeout, config.get('MAX_ENTRIES', 10000))
+    if backend == 'django':
+        return DjangoSingleFlight(ttl, wait_timeout, config.get('CACHE_ALIAS', 'default'))
+    if backend == 'none':
+        return NullSingleFlight(ttl, wait_timeout)
+    raise ValueError(f"Unknown TUTOR_IDEMPOTENCY backend: {backend!r}")
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """The process-wide idempotency store, built from settings on first use."""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = build_single_flight()
+    return _single_flight
+
+
+def reset_single_flight():
+    global _single_flight
+    with _single_flight_lock:
+        _single_flight = None
@@ -0,0 +1,141 @@
+"""
+Lean request handling for the chat API.
+
+The API views only need the session's 'session_id' UUID, but the stock
+session middleware loads the whole django_session row from the database on
+every request (and saves it when modified). With
+settings.TUTOR_LEAN_API['ENABLED'] on, these drop-in replacements for the
+session, auth and messages middleware handle the paths in PATHS differently:
+
+  - LeanSessionMiddleware copies the session_id into a signed cookie on any
+    normal response. On lean paths, request.session is then a SignedSessionId
+    read from that cookie, with no database query. A request without a valid
+    cookie falls back to the real session (and gets the cookie on its
+    response), so nothing breaks for clients that haven't seen it yet.
+  - LeanAuthenticationMiddleware and LeanMessageMiddleware skip their work
+    on lean paths; none of the API views use request.user or messages.
+
+Everything else, including the export endpoints that need a staff login,
+goes through the normal stack. The cookie is signed with SECRET_KEY, so it
+can't be forged any more than a session key can.
+
+Under ASGI, Django runs a sync middleware's process_request/process_response
+through sync_to_async on the single thread it keeps for thread-sensitive
+code, so every request queues for that thread twice per middleware. On lean
+paths these three don't touch the database and run on the event loop instead.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core import signing
+
+COOKIE_SALT = 'tutor_chat.session_id'
+
+
+def lean_api_config():
+    defaults = {
+        'ENABLED': False,
+        'PATHS': ('/api/message/', '/api/history/', '/api/clear/', '/api/dashboard/'),
+        'COOKIE_NAME': 'tutor_sid',
+    }
+    return {**defaults, **getattr(settings, 'TUTOR_LEAN_API', {})}
+
+
+def is_lean(request):
+    config = lean_api_config()
+    return config['ENABLED'] and request.path.startswith(tuple(config['PATHS']))
+
+
+class SignedSessionId:
+    """Read-only stand-in for request.session holding just the session_id."""
+
+    def __init__(self, session_id):
+        self._data = {'session_id': session_id}
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    async def aget(self, key, default=None):
+        return self._data.get(key, default)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+class LeanSessionMiddleware(SessionMiddleware):
+    async def __acall__(self, request):
+        if not is_lean(request):
+            return await super().__acall__(request)
+        self.process_request(request)  # reads the cookie; a fallback session loads lazily
+        response = await self.get_response(request)
+        if isinstance(request.session, SignedSessionId):
+            return self.process_response(request, response)
+        return await sync_to_async(self.process_response)(request, response)
+
+    def process_request(self, request):
+        if is_lean(request):
+            session_id = self._read_cookie(request)
+            if session_id is not None:
+                request.session = SignedSessionId(session_id)
+                return
+        super().process_request(request)
+
+    def process_response(self, request, response):
+        if isinstance(getattr(request, 'session', None), SignedSessionId):
+            return response
+        response = super().process_response(request, response)
+        if lean_api_config()['ENABLED']:
+            self._write_cookie(request, response)
+        return response
+
+    @staticmethod
+    def _read_cookie(request):
+        try:
+            return request.get_signed_cookie(lean_api_config()['COOKIE_NAME'], salt=COOKIE_SALT,
+                                             max_age=settings.SESSION_COOKIE_AGE)
+        except (KeyError, signing.BadSignature):
+            return None
+
+    def _write_cookie(self, request, response):
+        session = getattr(request, 'session', None)
+        if session is None or not session.accessed:
+            return  # don't load a session just to copy it
+        name = lean_api_config()['COOKIE_NAME']
+        session_id = session.get('session_id')
+        if session_id is None:
+            if name in request.COOKIES:
+                response.delete_cookie(name, path=settings.SESSION_COOKIE_PATH)
+        elif self._read_cookie(request) != session_id:
+            response.set_signed_cookie(
+                name, session_id, salt=COOKIE_SALT, max_age=settings.SESSION_COOKIE_AGE,
+                path=settings.SESSION_COOKIE_PATH, secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True, samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+
+
+class LeanAuthenticationMiddleware(AuthenticationMiddleware):
+    async def __acall__(self, request):
+        if is_lean(request):
+            return await self.get_response(request)
+        return await super().__acall__(request)
+
+    def process_request(self, request):
+        if not is_lean(request):
+            super().process_request(request)
+
+
+class LeanMessageMiddleware(MessageMiddleware):
+    # process_response already skips requests without message storage
+    def process_request(self, request):
+        if not is_lean(request):
+            super().process_request(request)
+
+    async def __acall__(self, request):
+        if is_lean(request):
+            return await self.get_response(request)
+        return await super().__acall__(request)
@@ -0,0 +1,71 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tutor_chat.retention import (archive_chunk, compact, cutoff_for, delete_archived, retention_config,
+                                  stale_sessions)
+
+
+class Command(BaseCommand):
+    help = ("Archive sessions idle for longer than the retention period to gzipped JSONL, "
+            "then delete them from the database. Safe to interrupt and re-run.")
+
+    def add_arguments(self, parser):
+        config = retention_config()
+        parser.add_argument('--days', type=int, default=config['ARCHIVE_DAYS'],
+                            help='archive sessions with no messages for this many days')
+        parser.add_argument('--archive-dir', default=config['ARCHIVE_DIR'])
+        parser.add_argument('--sessions-per-file', type=int, default=config['SESSIONS_PER_FILE'])
+        parser.add_argument('--batch-size', type=int, default=config['BATCH_SIZE'],
+                            help='rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='seconds to sleep between delete batches')
+        parser.add_argument('--max-sessions', type=int, default=None,
+                            help='stop after this many sessions, to spread the work over several runs')
+        parser.add_argument('--dry-run', action='store_true', help='only count what would be archived')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='VACUUM afterwards to shrink the file (locks the database while it runs)')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+        cutoff = cutoff_for(options['days'])
+        archive_dir = options['archive_dir']
+        limit = options['max_sessions']
+        run = timezone.now().strftime('%Y%m%dT%H%M%S')
+        if not options['dry_run']:
+            os.makedirs(archive_dir, exist_ok=True)
+
+        sessions = rows = files = 0
+        after = ''
+        start = time.perf_counter()
+        while limit is None or sessions < limit:
+            chunk_size = options['sessions_per_file'] if limit is None else min(options['sessions_per_file'],
+                                                                                 limit - sessions)
+            session_ids = stale_sessions(cutoff, chunk_size, after)
+            if not session_ids:
+                break
+            after = session_ids[-1]
+            sessions += len(session_ids)
+            if options['dry_run']:
+                continue
+            path = os.path.join(archive_dir, f'chat-{run}-{files:04d}.jsonl.gz')
+            written, max_id = archive_chunk(session_ids, path)
+            deleted = delete_archived(session_ids, max_id, options['batch_size'], options['pause'])
+            rows += written
+            files += 1
+            self.stdout.write(f'{path}: {len(session_ids)} sessions, {written} rows archived, {deleted} deleted')
+
+        if options['dry_run']:
+            self.stdout.write(f'{sessions} sessions idle since before {cutoff:%Y-%m-%d} would be archived')
+            return
+        self.stdout.write(f'Archived {sessions} sessions ({rows} rows) into {files} files '
+                          f'in {time.perf_counter() - start:.1f}s')
+        if options['vacuum'] and rows:
+            start = time.perf_counter()
+            if compact():
+                self.stdout.write(f'VACUUM took {time.perf_counter() - start:.1f}s')
+            else:
+                self.stdout.write('VACUUM skipped: not an SQLite database')
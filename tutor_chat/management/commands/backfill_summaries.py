@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tutor_chat.analytics import backfill_summaries
+from tutor_chat.models import SessionSummary
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the per-session SessionSummary rows from ChatMessage. Messages saved while it runs "
+            "can be counted twice or missed for their session; run it again, or at a quiet time, to settle.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='summaries written per query')
+        parser.add_argument('--clear', action='store_true',
+                            help='delete existing summaries first, including those of sessions with no messages')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['clear']:
+            SessionSummary.objects.all().delete()
+        sessions = backfill_summaries(options['batch_size'])
+        self.stdout.write(f"Rebuilt {sessions} session summaries in {time.perf_counter() - start:.1f}s")
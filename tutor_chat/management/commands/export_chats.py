@@ -0,0 +1,50 @@
+import gzip
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tutor_chat.export import FORMATS, KINDS, export_lines, export_stats, filtered_messages, parse_moment
+
+
+class Command(BaseCommand):
+    help = ("Export chat transcripts (or per-session statistics) as CSV or JSONL, streamed row by row. "
+            "An --output ending in .gz is compressed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--kind', choices=KINDS, default='messages')
+        parser.add_argument('--output', help='file to write; standard output if omitted')
+        parser.add_argument('--session', help='only this session_id')
+        parser.add_argument('--since', help='ISO date or datetime, inclusive')
+        parser.add_argument('--until', help='ISO date or datetime, inclusive')
+        parser.add_argument('--errors-only', action='store_true', help='only messages with grammar errors')
+        parser.add_argument('--stats', action='store_true', help='print the summary statistics instead')
+
+    def handle(self, *args, **options):
+        try:
+            messages = filtered_messages(
+                session_id=options['session'],
+                since=parse_moment(options['since']),
+                until=parse_moment(options['until'], end=True),
+                errors_only=options['errors_only'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['stats']:
+            self.stdout.write(json.dumps(export_stats(messages), indent=2))
+            return
+
+        path = options['output']
+        lines = export_lines(messages, options['format'], options['kind'])
+        if path is None:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        opener = gzip.open if path.endswith('.gz') else open
+        rows = -1  # the first line is the (possibly empty) header
+        with opener(path, 'wt', encoding='utf-8', newline='') as out:
+            for line in lines:
+                out.write(line)
+                rows += 1
+        self.stdout.write(f"Wrote {rows} rows to {path}")
@@ -0,0 +1,47 @@
+"""
+Collects the timing spans recorded while handling a request (utils/metrics.py),
+observes the total time per view, and, if settings.TUTOR_METRICS['SERVER_TIMING']
+is on, reports the per-stage breakdown to the browser on /api/ responses:
+
+    Server-Timing: session;dur=0.4, history;dur=1.2, llm;dur=812.0, parse;dur=0.1, save;dur=3.1, total;dur=820.5
+
+Streamed responses are left alone: their headers go out before the stages run.
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from utils.metrics import REQUEST_SECONDS, collect_timings, server_timing
+
+
+class ServerTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with collect_timings() as timings:
+            response = self.get_response(request)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with collect_timings() as timings:
+            response = await self.get_response(request)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    def _finish(self, request, response, timings, total):
+        match = request.resolver_match
+        REQUEST_SECONDS.observe(total, view=match.view_name if match else 'unmatched')
+        if (settings.TUTOR_METRICS['SERVER_TIMING'] and request.path.startswith('/api/')
+                and not response.streaming):
+            response['Server-Timing'] = server_timing(timings, total)
+        return response
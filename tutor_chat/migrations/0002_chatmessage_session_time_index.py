@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutor_chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session_id', 'timestamp'], name='chat_session_time_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutor_chat', '0002_chatmessage_session_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=100, unique=True)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('text_count', models.PositiveIntegerField(default=0)),
+                ('voice_count', models.PositiveIntegerField(default=0)),
+                ('first_activity', models.DateTimeField(null=True)),
+                ('last_activity', models.DateTimeField(null=True)),
+                ('error_categories', models.JSONField(default=dict)),
+                ('daily', models.JSONField(default=dict)),
+            ],
+            options={
+                'verbose_name': 'Session Summary',
+                'verbose_name_plural': 'Session Summaries',
+            },
+        ),
+    ]
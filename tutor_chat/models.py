@@ -23,8 +23,38 @@ class ChatMessage(models.Model):
     
     class Meta:
         ordering = ['timestamp']  # Order messages by time
+        indexes = [
+            # Every history lookup filters by session and orders by time
+            models.Index(fields=['session_id', 'timestamp'], name='chat_session_time_idx'),
+        ]
         verbose_name = "Chat Message"
         verbose_name_plural = "Chat Messages"
     
     def __str__(self):
         return f"Message at {self.timestamp.strftime('%H:%M:%S')}: {self.user_message[:50]}..."
+
+
+class SessionSummary(models.Model):
+    """
+    Running totals for one session, kept up to date as messages are saved
+    (see tutor_chat/analytics.py), so the learner dashboard never has to scan
+    a session's ChatMessage rows.
+    """
+    session_id = models.CharField(max_length=100, unique=True)
+    message_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    text_count = models.PositiveIntegerField(default=0)
+    voice_count = models.PositiveIntegerField(default=0)
+    first_activity = models.DateTimeField(null=True)
+    last_activity = models.DateTimeField(null=True)
+    # {"verb_tense": 4, ...}: how often each kind of mistake was explained
+    error_categories = models.JSONField(default=dict)
+    # {"2025-01-31": [messages, errors], ...} for the most recent days
+    daily = models.JSONField(default=dict)
+
+    class Meta:
+        verbose_name = "Session Summary"
+        verbose_name_plural = "Session Summaries"
+
+    def __str__(self):
+        return f"{self.session_id}: {self.message_count} messages, {self.error_count} with errors"
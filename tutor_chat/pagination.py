@@ -0,0 +1,85 @@
+"""
+Cursor pagination for a session's chat history.
+
+Pages are walked backwards from the newest message. The cursor is the
+(timestamp, id) of the oldest message already shown, so a page is a plain
+range scan on the (session_id, timestamp) index (SQLite keeps the rowid in
+every index, which settles equal timestamps). Unlike an offset, a cursor stays
+correct while new messages are being added at the other end.
+"""
+import base64
+import hashlib
+
+from django.db.models import Count, Max, Q
+from django.utils.dateparse import parse_datetime
+
+from .models import ChatMessage
+
+# Columns the chat page and the history API send to the browser
+PAGE_FIELDS = ('id', 'user_message', 'ai_response', 'corrected_sentence', 'has_errors', 'explanation', 'timestamp')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(message):
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from encode_cursor's output."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        timestamp, message_id = raw.rsplit('|', 1)
+        timestamp = parse_datetime(timestamp)
+        message_id = int(message_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    if timestamp is None:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    return timestamp, message_id
+
+
+def page_query(session_id, limit, before=None):
+    """
+    Newest first, one row more than the page so the caller can tell whether
+    there is an older page. Pass the rows to make_page().
+    """
+    messages = ChatMessage.objects.filter(session_id=session_id)
+    if before is not None:
+        timestamp, message_id = decode_cursor(before)
+        messages = messages.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+    return messages.only(*PAGE_FIELDS).order_by('-timestamp', '-id')[:limit + 1]
+
+
+def make_page(rows, limit):
+    """(messages oldest first, cursor for the next older page or None) from page_query's rows."""
+    rows = list(rows)
+    has_older = len(rows) > limit
+    messages = rows[:limit][::-1]
+    return messages, encode_cursor(messages[0]) if has_older else None
+
+
+def history_version(session_id):
+    """Changes whenever a session's messages are added or deleted; cheap, answered from the index."""
+    state = ChatMessage.objects.filter(session_id=session_id).aggregate(count=Count('id'), newest=Max('id'))
+    return f"{state['count']}-{state['newest']}"
+
+
+def page_etag(session_id, before, limit):
+    raw = f"{session_id}|{history_version(session_id)}|{before}|{limit}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def serialize_message(message):
+    return {
+        'id': message.id,
+        'user_message': message.user_message,
+        'ai_response': message.ai_response,
+        'corrected_sentence': message.corrected_sentence,
+        'has_errors': message.has_errors,
+        'explanation': message.explanation,
+        'timestamp': message.timestamp.isoformat(),
+    }
@@ -0,0 +1,112 @@
+"""
+Retention for the ChatMessage table: sessions that have been idle for longer
+than the retention period are written to gzip-compressed JSONL files and then
+deleted, so the hot table only holds sessions that might still come back.
+
+The work is done a chunk of sessions at a time (see the archive_chats
+management command):
+  1. stale_sessions() picks the next SESSIONS_PER_FILE idle sessions, in
+     session_id order, from the (session_id, timestamp) index.
+  2. archive_chunk() streams their rows into one .jsonl.gz file, written
+     under a .part name and renamed once complete and synced to disk.
+  3. delete_archived() removes those rows in batches of BATCH_SIZE, each in
+     its own short transaction, so live requests can write in between, and
+     then the sessions' SessionSummary rows.
+Deleting is what marks a session as done, so an interrupted run simply picks
+up where it stopped next time. Only rows up to the highest archived id are
+deleted: a session that comes back mid-run keeps its new messages. A crash
+between a rename and the delete can archive a chunk twice; the rows carry
+their ids, so readers can drop duplicates.
+"""
+import datetime
+import gzip
+import json
+import os
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import ChatMessage, SessionSummary
+
+
+def retention_config():
+    defaults = {
+        'ARCHIVE_DAYS': 90,
+        'ARCHIVE_DIR': os.path.join(settings.BASE_DIR, 'archive'),
+        'SESSIONS_PER_FILE': 1000,
+        'BATCH_SIZE': 500,
+    }
+    return {**defaults, **getattr(settings, 'TUTOR_RETENTION', {})}
+
+
+def archive_row(message):
+    """Every column of a ChatMessage, as written to archives and exports."""
+    return {
+        'id': message.id,
+        'session_id': message.session_id,
+        'timestamp': message.timestamp.isoformat(),
+        'input_method': message.input_method,
+        'user_message': message.user_message,
+        'corrected_sentence': message.corrected_sentence,
+        'has_errors': message.has_errors,
+        'explanation': message.explanation,
+        'ai_response': message.ai_response,
+    }
+
+
+def stale_sessions(cutoff, limit, after=''):
+    """Up to limit session ids, after `after`, whose newest message is older than cutoff."""
+    return list(ChatMessage.objects.filter(session_id__gt=after).values('session_id')
+                .annotate(last=Max('timestamp')).filter(last__lt=cutoff)
+                .order_by('session_id').values_list('session_id', flat=True)[:limit])
+
+
+def archive_chunk(session_ids, path):
+    """Write the sessions' rows to path; returns (rows written, highest id written)."""
+    rows, max_id = 0, 0
+    part = path + '.part'
+    messages = ChatMessage.objects.filter(session_id__in=session_ids).order_by('session_id', 'timestamp', 'id')
+    with open(part, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as out:
+            for message in messages.iterator(chunk_size=2000):
+                out.write(json.dumps(archive_row(message), ensure_ascii=False).encode('utf-8') + b'\n')
+                rows += 1
+                max_id = max(max_id, message.id)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(part, path)
+    return rows, max_id
+
+
+def delete_archived(session_ids, max_id, batch_size, pause=0.0):
+    """Delete the archived rows batch by batch; returns the number deleted."""
+    archived = ChatMessage.objects.filter(session_id__in=session_ids, id__lte=max_id)
+    deleted = 0
+    while True:
+        ids = list(archived.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += ChatMessage.objects.filter(id__in=ids).delete()[0]
+        if pause:
+            time.sleep(pause)  # let queued writers take the lock
+    # Sessions that came back mid-run keep their summaries
+    remaining = ChatMessage.objects.filter(session_id__in=session_ids).values('session_id')
+    SessionSummary.objects.filter(session_id__in=session_ids).exclude(session_id__in=remaining).delete()
+    return deleted
+
+
+def compact():
+    """Give the space freed by deletes back to the filesystem; SQLite only."""
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM')
+        cursor.execute('PRAGMA optimize')
+    return True
+
+
+def cutoff_for(days):
+    return timezone.now() - datetime.timedelta(days=days)
@@ -0,0 +1,56 @@
+"""
+Helpers for streaming tutor replies to the browser as Server-Sent Events:
+sse_event() formats one event, and ClosingStream/AsyncClosingStream wrap a
+view's event generator so its cleanup also runs when the response is closed
+unread. The reply text itself is pulled out of the model's JSON by
+utils.json_stream.JSONFieldStreamer.
+"""
+import json
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class _ClosingStream:
+    def __init__(self, events, *on_close):
+        self._events = events
+        self._on_close = on_close
+        self._closed = False
+
+    def close(self):
+        """
+        Run the on_close callbacks, once. Django calls this when the response
+        is closed, including when the stream was never read (the client went
+        away, or an error upstream), where a generator's own finally never
+        runs. The callbacks must be safe to call after the stream already
+        cleaned up itself.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            close = getattr(self._events, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            for callback in self._on_close:
+                callback()
+
+
+class ClosingStream(_ClosingStream):
+    """The events of a sync StreamingHttpResponse, with callbacks for when it's closed."""
+
+    def __iter__(self):
+        return iter(self._events)
+
+
+class AsyncClosingStream(_ClosingStream):
+    """
+    ClosingStream for an async generator. ASGIHandler calls close() from a
+    worker thread, so the callbacks are sync and may block.
+    """
+
+    def __aiter__(self):
+        return aiter(self._events)
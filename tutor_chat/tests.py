@@ -1,3 +1,1412 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test import AsyncRequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from utils import llm_client, metrics
+from utils.json_stream import JSONFieldStreamer
+from utils.audio_2 import (AudioRingBuffer, StreamingTranscriber, VoiceActivityDetector, save_wav,
+                           transcribe_audio1, trim_silence)
+from utils.prompting import PromptBuilder, count_tokens
+from utils.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResiliencePolicy, reset_policy
+from utils.structured_output import (ResponseFormatError, decode_tutor_response, extract_json_object,
+                                     json_mode_support, salvage_reply)
+from utils.tts import SpeechWorker, split_sentences
+from utils.whisper_registry import get_whisper_model, preload_whisper, reset_whisper_models
+from . import prompts, views
+from .admission import LocalAdmission, Overloaded, RateLimited, get_admission, reset_admission
+from .correction_cache import LocalCorrectionCache, normalize_message, reset_correction_cache
+from .fast_path import check_locally, fast_path_stats
+from .history_cache import LocalHistoryCache, get_history_cache, reset_history_cache
+from .lean_api import (COOKIE_SALT, LeanAuthenticationMiddleware, LeanMessageMiddleware, LeanSessionMiddleware,
+                       SignedSessionId)
+from .idempotency import (IdempotencyConflict, LocalSingleFlight, fingerprint, get_single_flight,
+                          reset_single_flight)
+from .write_queue import ChatMessageWriter, get_writer, save_chat_message, shutdown_writer
+from .models import ChatMessage, SessionSummary
+from .pagination import InvalidCursor, decode_cursor
+from .streaming import AsyncClosingStream, ClosingStream
 
 # Create your tests here.
+
+
+def _completion_body(content):
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "stub",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+    }
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the pool can reuse sockets
+    plain_reply = "Glad to hear it!"
+    reply = json.dumps({
+        "corrected_sentence": "I am happy", "has_errors": True,
+        "explanation": "We say 'I am' not 'I are'",
+        "conversational_response": "Glad to hear it!",
+    })
+
+    reject_json_mode = False
+
+    def do_POST(self):
+        with self.server.active_lock:
+            self.server.active += 1
+        try:
+            self._answer()
+        finally:
+            with self.server.active_lock:
+                self.server.active -= 1
+
+    def _answer(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self.server.requests.append(request)
+        if self.server.delays:
+            time.sleep(self.server.delays.pop(0))
+        if self.server.fail_next > 0:
+            self.server.fail_next -= 1
+            return self._send_error(500, "stub failure")
+        if self.reject_json_mode and "response_format" in request:
+            return self._send_error(400, "response_format is not supported")
+        # Reply-only prompts (correction cache hits) get plain text back
+        reply = self.plain_reply if request["messages"][0]["content"] == prompts.REPLY_SYSTEM_MESSAGE else self.reply
+        if request.get("stream"):
+            return self._send_stream(reply)
+        body = json.dumps(_completion_body(reply)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        body = json.dumps({"error": {"message": message, "type": "invalid_request_error"}}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, reply):
+        events = []
+        for i in range(0, len(reply), 7):
+            chunk = {
+                "id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+                "choices": [{"index": 0, "delta": {"content": reply[i:i + 7]}, "finish_reason": None}],
+            }
+            events.append(f"data: {json.dumps(chunk)}\n\n")
+        events.append("data: [DONE]\n\n")
+        body = "".join(events).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubLLMServerMixin:
+    """Runs a local OpenAI-compatible server for the duration of the test class."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.llm_server = ThreadingHTTPServer(("127.0.0.1", 0), StubLLMHandler)
+        cls.llm_server.requests = []
+        cls.llm_server.delays = []  # seconds to stall each next request
+        cls.llm_server.fail_next = 0  # answer this many next requests with HTTP 500
+        cls.llm_server.handle_error = lambda request, address: None  # clients hanging up on slow replies
+        cls.llm_server.active = 0  # requests still being answered
+        cls.llm_server.active_lock = threading.Lock()
+        cls.llm_url = f"http://127.0.0.1:{cls.llm_server.server_port}/v1"
+        threading.Thread(target=cls.llm_server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        # A request the client gave up on (a hedge, a deadline) may still be sleeping
+        # in the stub; let it finish before the next test sets delays or fail_next
+        deadline = time.monotonic() + 5
+        while self.llm_server.active and time.monotonic() < deadline:
+            time.sleep(0.01)
+        super().tearDown()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.llm_server.shutdown()
+        cls.llm_server.server_close()
+        super().tearDownClass()
+
+
+class StubLLMViewMixin(StubLLMServerMixin):
+    """Points the views' shared LLM client at the stub server."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(llm_client, "GROQ_BASE_URL", self.llm_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(llm_client.shutdown)
+        self.llm_server.requests.clear()
+        self.llm_server.delays.clear()
+        self.llm_server.fail_next = 0
+        reset_correction_cache()
+        self.addCleanup(reset_correction_cache)
+        reset_history_cache()
+        self.addCleanup(reset_history_cache)
+        reset_policy()
+        self.addCleanup(reset_policy)
+        reset_single_flight()
+        self.addCleanup(reset_single_flight)
+        reset_admission()
+        self.addCleanup(reset_admission)
+        session = self.client.session
+        session["session_id"] = "test-session"
+        session.save()
+
+
+class LLMClientPoolTests(StubLLMServerMixin, TestCase):
+    def tearDown(self):
+        llm_client.shutdown()
+        llm_client.connection_stats.reset()
+        super().tearDown()
+
+    def test_client_is_shared(self):
+        first = llm_client.get_client("key", base_url=self.llm_url)
+        self.assertIs(first, llm_client.get_client("key", base_url=self.llm_url))
+        self.assertIsNot(first, llm_client.get_client("other-key", base_url=self.llm_url))
+
+    def test_connections_are_reused(self):
+        client = llm_client.get_client("key", base_url=self.llm_url)
+        for _ in range(3):
+            client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "hi"}])
+        self.assertEqual(llm_client.connection_stats.snapshot(), {
+            "requests": 3, "new_connections": 1, "reused_connections": 2,
+        })
+
+    def test_shutdown_drops_clients(self):
+        first = llm_client.get_client("key", base_url=self.llm_url)
+        llm_client.shutdown()
+        self.assertIsNot(first, llm_client.get_client("key", base_url=self.llm_url))
+
+    def test_measure_llm_time(self):
+        client = llm_client.get_client("key", base_url=self.llm_url)
+        with llm_client.measure_llm_time() as timer:
+            for _ in range(2):
+                client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "hi"}])
+        client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "hi"}])
+        self.assertEqual(timer["requests"], 2)
+        self.assertGreater(timer["seconds"], 0)
+
+
+class JSONFieldStreamerTests(TestCase):
+    def test_extracts_field_across_chunks(self):
+        raw = '```json\n{"conversational_response": "Say \\"hi\\" \\u00e9\\ud83d\\ude00\\nok", "has_errors": false}\n```'
+        streamer = JSONFieldStreamer("conversational_response")
+        pieces = [streamer.feed(ch) for ch in raw]
+        self.assertEqual("".join(pieces), 'Say "hi" \u00e9\U0001F600\nok')
+        self.assertEqual(streamer.text, raw)
+
+    def test_ignores_other_fields(self):
+        streamer = JSONFieldStreamer("conversational_response")
+        delta = streamer.feed('{"explanation": "conversational_response", "conversational_response": "Hi"}')
+        self.assertEqual(delta, "Hi")
+
+
+class ClosingStreamTests(TestCase):
+    def test_callbacks_run_once_when_closed_unread(self):
+        cleaned_up, on_close = [], mock.Mock()
+
+        def events():
+            try:
+                yield "a"
+            finally:
+                cleaned_up.append(True)
+
+        response = StreamingHttpResponse(ClosingStream(events(), on_close))
+        response.close()
+        response.close()
+        on_close.assert_called_once_with()
+        self.assertEqual(cleaned_up, [])  # an unstarted generator's finally never runs
+
+    def test_streams_the_wrapped_events(self):
+        async def events():
+            yield "a"
+            yield "b"
+
+        self.assertEqual(b"".join(StreamingHttpResponse(ClosingStream(iter(["a", "b"]))).streaming_content), b"ab")
+        response = StreamingHttpResponse(AsyncClosingStream(events()))
+        self.assertTrue(response.is_async)
+        self.assertEqual(b"".join(async_to_sync(self._read)(response)), b"ab")
+
+    @staticmethod
+    async def _read(response):
+        return [part async for part in response.streaming_content]
+
+
+class StreamingMessageViewTests(StubLLMViewMixin, TestCase):
+    def test_streams_tokens_then_result(self):
+        response = self.client.post("/api/message/stream/", {"message": "I are happy"},
+                                    content_type="application/json")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = []
+        for block in b"".join(response.streaming_content).decode().strip().split("\n\n"):
+            event, data = block.split("\n")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+
+        tokens = "".join(data["text"] for event, data in events if event == "token")
+        self.assertEqual(tokens, "Glad to hear it!")
+        event, done = events[-1]
+        self.assertEqual(event, "done")
+        self.assertEqual(done["corrected_sentence"], "I am happy")
+        self.assertTrue(done["has_errors"])
+        saved = ChatMessage.objects.get(id=done["message_id"])
+        self.assertEqual(saved.ai_response, "Glad to hear it!")
+        self.assertEqual(saved.session_id, "test-session")
+
+    def test_rejects_empty_message(self):
+        response = self.client.post("/api/message/stream/", {"message": "  "},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncViewTests(StubLLMViewMixin, TestCase):
+    async def _request(self, method, path, body=None):
+        factory = AsyncRequestFactory()
+        if method == "post":
+            request = factory.post(path, body or {}, content_type="application/json")
+        else:
+            request = factory.get(path)
+        request.session = SessionStore()
+        await request.session.aset("session_id", "async-session")
+        return request
+
+    async def test_process_message(self):
+        request = await self._request("post", "/api/message/", {"message": "I are happy"})
+        response = await views.aprocess_message(request)
+        data = json.loads(response.content)
+        self.assertTrue(data["success"])
+        self.assertEqual(data["ai_response"], "Glad to hear it!")
+        saved = await ChatMessage.objects.aget(id=data["message_id"])
+        self.assertEqual(saved.session_id, "async-session")
+
+    async def test_process_message_stream(self):
+        request = await self._request("post", "/api/message/stream/", {"message": "I are happy"})
+        response = await views.aprocess_message_stream(request)
+        self.assertTrue(response.is_async)  # a sync iterator would be buffered under ASGI
+        body = b"".join([part async for part in response.streaming_content]).decode()
+        events = [block.split("\n") for block in body.strip().split("\n\n")]
+        tokens = "".join(json.loads(data[len("data: "):])["text"] for event, data in events if event == "event: token")
+        self.assertEqual(tokens, "Glad to hear it!")
+        event, data = events[-1]
+        self.assertEqual(event, "event: done")
+        saved = await ChatMessage.objects.aget(id=json.loads(data[len("data: "):])["message_id"])
+        self.assertEqual(saved.session_id, "async-session")
+
+    async def test_stream_slot_released_when_response_is_closed_unread(self):
+        body = {"message": "I are happy", "idempotency_key": "key-1"}
+        request = await self._request("post", "/api/message/stream/", body)
+        response = await views.aprocess_message_stream(request)
+        self.assertEqual(get_admission().in_flight(), 1)
+        await sync_to_async(response.close)()  # as ASGIHandler does; the generator never ran
+        self.assertEqual(get_admission().in_flight(), 0)
+        # The key was given up too, so a retry runs instead of waiting for the closed stream
+        payload, call = await get_single_flight().aclaim(("async-session", "key-1"), fingerprint("I are happy"))
+        self.assertIsNotNone(call)
+
+    async def test_clear_history(self):
+        await ChatMessage.objects.acreate(user_message="hi", corrected_sentence="hi",
+                                          ai_response="hello", session_id="async-session")
+        request = await self._request("post", "/api/clear/")
+        response = await views.aclear_history(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(await ChatMessage.objects.filter(session_id="async-session").aexists())
+
+    async def test_chat_interface_renders_history(self):
+        await ChatMessage.objects.acreate(user_message="earlier message", corrected_sentence="earlier message",
+                                          ai_response="hello", session_id="async-session")
+        request = await self._request("get", "/")
+        response = await views.achat_interface(request)
+        self.assertContains(response, "earlier message")
+
+
+class CorrectionCacheTests(TestCase):
+    def test_normalize_message(self):
+        self.assertEqual(normalize_message("  I  ARE happy!!  "), "i are happy")
+        self.assertEqual(normalize_message("How is you?"), normalize_message("how is   you"))
+
+    def test_lru_eviction_and_stats(self):
+        cache = LocalCorrectionCache(ttl=60, max_entries=2)
+        result = {"corrected_sentence": "x", "has_errors": False, "explanation": "", "conversational_response": "y"}
+        cache.set("one", result)
+        cache.set("two", result)
+        cache.get("one")  # touch, so "two" is now least recently used
+        cache.set("three", result)
+        self.assertIsNone(cache.get("two"))
+        self.assertEqual(cache.get("ONE."), {"corrected_sentence": "x", "has_errors": False, "explanation": ""})
+        self.assertEqual(cache.stats.snapshot(), {"hits": 2, "misses": 1, "hit_rate": 0.667})
+
+    def test_ttl_expiry(self):
+        cache = LocalCorrectionCache(ttl=60, max_entries=10)
+        cache.set("hello", {"corrected_sentence": "hello", "has_errors": False, "explanation": ""})
+        with mock.patch("tutor_chat.correction_cache.time.monotonic", return_value=10 ** 9):
+            self.assertIsNone(cache.get("hello"))
+
+
+class CorrectionCacheViewTests(StubLLMViewMixin, TestCase):
+    def post(self, message):
+        response = self.client.post("/api/message/", {"message": message}, content_type="application/json")
+        return json.loads(response.content)
+
+    def test_repeat_message_only_asks_for_reply(self):
+        first = self.post("Me and my brother goes to school.")
+        second = self.post("me and my brother  goes to school")
+        self.assertEqual(len(self.llm_server.requests), 2)
+        self.assertEqual(self.llm_server.requests[1]["messages"][0]["content"], prompts.REPLY_SYSTEM_MESSAGE)
+        for field in ("corrected_sentence", "has_errors", "explanation"):
+            self.assertEqual(first[field], second[field])
+        self.assertEqual(second["ai_response"], "Glad to hear it!")
+
+
+class HistoryCacheTests(TestCase):
+    def test_ring_buffer_keeps_last_turns(self):
+        cache = LocalHistoryCache(turns=2, ttl=60, max_sessions=10)
+        cache.append("s", "ignored", "no entry yet")
+        self.assertIsNone(cache.get("s"))
+        cache.set("s", [])
+        for i in range(3):
+            cache.append("s", f"q{i}", f"a{i}")
+        self.assertEqual(cache.get("s"), [("q1", "a1"), ("q2", "a2")])
+
+    def test_lru_evicts_idle_sessions(self):
+        cache = LocalHistoryCache(turns=2, ttl=60, max_sessions=1)
+        cache.set("old", [])
+        cache.set("new", [])
+        self.assertIsNone(cache.get("old"))
+        self.assertEqual(cache.get("new"), [])
+
+
+class HistoryCacheViewTests(StubLLMViewMixin, TestCase):
+    def post(self, message):
+        return self.client.post("/api/message/", {"message": message}, content_type="application/json")
+
+    def history_queries(self, message):
+        with CaptureQueriesContext(connection) as queries:
+            self.post(message)
+        return [q["sql"] for q in queries if q["sql"].startswith("SELECT") and "tutor_chat_chatmessage" in q["sql"]]
+
+    def test_only_first_turn_reads_history(self):
+        self.assertEqual(len(self.history_queries("first message")), 1)
+        self.assertEqual(self.history_queries("second message"), [])
+        self.assertEqual(get_history_cache().get("test-session"),
+                         [("first message", "Glad to hear it!"), ("second message", "Glad to hear it!")])
+        # The cached turns are what the model sees
+        self.assertEqual(self.llm_server.requests[-1]["messages"][1]["content"], "first message")
+
+    def test_clear_drops_cached_history(self):
+        self.post("first message")
+        self.client.post("/api/clear/")
+        self.assertIsNone(get_history_cache().get("test-session"))
+
+
+class HistoryPaginationTests(TestCase):
+    def setUp(self):
+        session = self.client.session
+        session["session_id"] = "paged"
+        session.save()
+        stamp = timezone.now()
+        # Two rows share each timestamp, so the id has to break ties
+        for i in range(25):
+            ChatMessage.objects.create(user_message=f"message {i}", corrected_sentence="", ai_response="ok",
+                                       session_id="paged", timestamp=stamp + timedelta(seconds=i // 2))
+
+    def test_page_renders_newest_turns(self):
+        with self.settings(TUTOR_HISTORY_PAGE={"INITIAL": 3}):
+            response = self.client.get("/")
+        self.assertEqual([m.user_message for m in response.context["recent_messages"]],
+                         ["message 22", "message 23", "message 24"])
+        self.assertIsNotNone(response.context["older_cursor"])
+
+    def test_cursor_walks_back_through_history(self):
+        seen = []
+        cursor = None
+        while True:
+            url = "/api/history/?limit=10" + (f"&before={cursor}" if cursor else "")
+            data = json.loads(self.client.get(url).content)
+            seen = [m["user_message"] for m in data["messages"]] + seen
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f"message {i}" for i in range(25)])
+
+    def test_etag_returns_304_until_history_changes(self):
+        response = self.client.get("/api/history/")
+        etag = response["ETag"]
+        self.assertEqual(self.client.get("/api/history/", headers={"If-None-Match": etag}).status_code, 304)
+        ChatMessage.objects.create(user_message="new", corrected_sentence="", ai_response="ok", session_id="paged")
+        self.assertEqual(self.client.get("/api/history/", headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_bad_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            decode_cursor("not-a-cursor")
+        self.assertEqual(self.client.get("/api/history/?before=not-a-cursor").status_code, 400)
+
+
+class ArchiveCommandTests(TestCase):
+    def test_archives_and_deletes_idle_sessions(self):
+        old = timezone.now() - timedelta(days=100)
+        for session_id in ("idle-a", "idle-b", "idle-c"):
+            for i in range(3):
+                ChatMessage.objects.create(user_message=f"{session_id} {i}", corrected_sentence="", ai_response="ok",
+                                           session_id=session_id, timestamp=old)
+        ChatMessage.objects.create(user_message="recent", corrected_sentence="", ai_response="ok",
+                                   session_id="active", timestamp=old)
+        ChatMessage.objects.create(user_message="recent", corrected_sentence="", ai_response="ok",
+                                   session_id="active")
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            call_command("archive_chats", days=30, archive_dir=archive_dir, sessions_per_file=2, batch_size=2,
+                         stdout=io.StringIO())
+            rows = []
+            for name in sorted(os.listdir(archive_dir)):
+                with gzip.open(os.path.join(archive_dir, name), "rt") as archive:
+                    rows.extend(json.loads(line) for line in archive)
+
+        self.assertEqual(len(rows), 9)
+        self.assertEqual({row["session_id"] for row in rows}, {"idle-a", "idle-b", "idle-c"})
+        self.assertEqual(set(ChatMessage.objects.values_list("session_id", flat=True)), {"active"})
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        for session_id, has_errors, method in (("s1", True, "text"), ("s1", False, "voice"), ("s2", True, "voice")):
+            ChatMessage.objects.create(user_message="I are happy", corrected_sentence="I am happy", ai_response="ok",
+                                       has_errors=has_errors, input_method=method, session_id=session_id)
+        staff = User.objects.create_user("teacher", password="pw", is_staff=True)
+        self.client.force_login(staff)
+
+    def test_streams_csv_and_jsonl(self):
+        response = self.client.get("/api/export/?format=csv&errors_only=1")
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "session_id", "timestamp"])
+        self.assertEqual(len(lines), 3)
+
+        response = self.client.get("/api/export/?format=jsonl&kind=sessions")
+        sessions = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(s["session_id"], s["messages"], s["error_rate"], s["voice_messages"]) for s in sessions],
+                         [("s1", 2, 0.5, 1), ("s2", 1, 1.0, 1)])
+
+    def test_stats_and_permissions(self):
+        stats = json.loads(self.client.get("/api/export/stats/?session=s1").content)
+        self.assertEqual((stats["messages"], stats["errors"], stats["error_rate"]), (2, 1, 0.5))
+        self.assertEqual(stats["by_input_method"]["voice"], {"messages": 1, "errors": 0, "error_rate": 0.0})
+        self.assertEqual(self.client.get("/api/export/?since=yesterday").status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get("/api/export/").status_code, 302)  # to the admin login
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "export.jsonl.gz")
+            call_command("export_chats", format="jsonl", output=path, session="s2", stdout=io.StringIO())
+            with gzip.open(path, "rt") as export:
+                rows = [json.loads(line) for line in export]
+        self.assertEqual([(row["session_id"], row["input_method"]) for row in rows], [("s2", "voice")])
+
+
+class SessionSummaryTests(StubLLMViewMixin, TestCase):
+    def test_messages_update_summary_and_dashboard(self):
+        self.client.post("/api/message/", {"message": "I are happy", "input_method": "voice"},
+                         content_type="application/json")
+        self.client.post("/api/message/", {"message": "The weather is nice today", "input_method": "text"},
+                         content_type="application/json")
+        with self.assertNumQueries(1):  # just the summary row; the session id comes from the signed cookie
+            data = json.loads(self.client.get("/api/dashboard/").content)
+        self.assertEqual((data["message_count"], data["voice_count"], data["text_count"]), (2, 1, 1))
+        self.assertEqual(data["error_count"], 2)  # the stub LLM always reports an error
+        self.assertEqual(data["top_errors"][0], {"category": "subject_verb_agreement", "count": 2})
+        self.assertEqual(data["daily"][0]["messages"], 2)
+
+        self.client.post("/api/clear/")
+        self.assertEqual(json.loads(self.client.get("/api/dashboard/").content)["message_count"], 0)
+
+    def test_backfill_matches_incremental_updates(self):
+        for i in range(3):
+            save_chat_message({"user_message": "hi", "corrected_sentence": "hi", "ai_response": "ok",
+                               "has_errors": i > 0, "explanation": "Use the past tense here.",
+                               "session_id": f"s{i % 2}"})
+        live = {s.session_id: (s.message_count, s.error_count, s.error_categories)
+                for s in SessionSummary.objects.all()}
+        call_command("backfill_summaries", clear=True, stdout=io.StringIO())
+        rebuilt = {s.session_id: (s.message_count, s.error_count, s.error_categories)
+                   for s in SessionSummary.objects.all()}
+        self.assertEqual(rebuilt, live)
+        self.assertEqual(live["s0"], (2, 1, {"verb_tense": 1}))
+
+
+class LeanAPITests(StubLLMViewMixin, TestCase):
+    def test_api_reads_session_id_from_signed_cookie(self):
+        self.client.get("/api/dashboard/")  # falls back to the database session and sets the cookie
+        self.assertIn("tutor_sid", self.client.cookies)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/api/message/", {"message": "I are happy"}, content_type="application/json")
+        self.assertEqual(ChatMessage.objects.get(id=json.loads(response.content)["message_id"]).session_id,
+                         "test-session")
+        self.assertFalse(any("django_session" in query["sql"] for query in queries))
+
+    def test_forged_cookie_is_ignored(self):
+        self.client.cookies["tutor_sid"] = "someone-else"
+        self.client.post("/api/message/", {"message": "I are happy"}, content_type="application/json")
+        self.assertEqual(ChatMessage.objects.get().session_id, "test-session")
+
+    async def test_lean_paths_stay_on_the_event_loop(self):
+        async def view(request):
+            self.assertIsInstance(request.session, SignedSessionId)
+            return JsonResponse({"session_id": await request.session.aget("session_id")})
+
+        signed = HttpResponse()
+        signed.set_signed_cookie("tutor_sid", "cookie-session", salt=COOKIE_SALT)
+        request = AsyncRequestFactory().post("/api/message/")
+        request.COOKIES["tutor_sid"] = signed.cookies["tutor_sid"].value
+        handler = LeanSessionMiddleware(LeanAuthenticationMiddleware(LeanMessageMiddleware(view)))
+        with mock.patch("django.utils.deprecation.sync_to_async", side_effect=sync_to_async) as hop:
+            response = await handler(request)
+        self.assertEqual(json.loads(response.content), {"session_id": "cookie-session"})
+        hop.assert_not_called()  # no queueing for the thread-sensitive thread
+
+    def test_disabled(self):
+        with self.settings(TUTOR_LEAN_API={"ENABLED": False}):
+            self.client.get("/api/dashboard/")
+        self.assertNotIn("tutor_sid", self.client.cookies)
+
+
+def synthetic_utterance(*parts, sample_rate=16000):
+    """Concatenated (kind, seconds) parts: 's' is a voiced tone, anything else background noise."""
+    rng = np.random.default_rng(0)
+    chunks = []
+    for kind, seconds in parts:
+        t = np.arange(int(seconds * sample_rate)) / sample_rate
+        chunk = rng.normal(0, 0.002, len(t))
+        if kind == "s":
+            chunk += 0.1 * np.sin(2 * np.pi * 180 * t)
+        chunks.append(chunk)
+    return np.concatenate(chunks).astype(np.float32)
+
+
+class FakeEngine:
+    created = 0
+
+    def __init__(self):
+        FakeEngine.created += 1
+        self.spoken = []
+        self._queued = []
+        self._callbacks = []
+
+    def getProperty(self, name):
+        return [SimpleNamespace(id="v0", name="first"), SimpleNamespace(id="v1", name="second")]
+
+    def setProperty(self, name, value):
+        pass
+
+    def connect(self, topic, callback):
+        self._callbacks.append(callback)
+
+    def say(self, text):
+        self._queued.append(text)
+
+    def runAndWait(self):
+        for text in self._queued:
+            for callback in self._callbacks:
+                callback("utterance")
+            self.spoken.append(text)
+        self._queued = []
+
+    def stop(self):
+        pass
+
+
+class SpeechTests(TestCase):
+    def test_split_sentences_keeps_the_unfinished_rest(self):
+        sentences, rest = split_sentences("", "Oh! That is right. We say 'I am")
+        self.assertEqual(sentences, ["Oh! That is right."])
+        self.assertEqual(rest, "We say 'I am")
+        self.assertEqual(split_sentences(rest, "', not 'I is'. And")[0], ["We say 'I am', not 'I is'."])
+
+    def test_worker_keeps_one_engine(self):
+        FakeEngine.created = 0
+        engines = []
+        worker = SpeechWorker(engine_factory=lambda: engines.append(FakeEngine()) or engines[-1]).start()
+        self.addCleanup(worker.close)
+        first, second = worker.say("One."), worker.say("Two.")
+        worker.wait()
+        self.assertEqual(FakeEngine.created, 1)
+        self.assertEqual(engines[0].spoken, ["One.", "Two."])
+        self.assertEqual(worker.voice_id, "v1")
+        self.assertTrue(first.done.is_set() and second.done.is_set())
+        self.assertLessEqual(first.started_at, second.started_at)
+
+    def test_worker_without_engine_completes_at_once(self):
+        def broken():
+            raise ImportError("no pyttsx3")
+
+        def no_voices():
+            engine = FakeEngine()
+            engine.getProperty = mock.Mock(side_effect=RuntimeError("no voices"))  # fails after the factory
+            return engine
+
+        for factory in (broken, no_voices):
+            worker = SpeechWorker(engine_factory=factory).start()  # returns, rather than waiting forever
+            self.assertFalse(worker.available)
+            self.assertTrue(worker.say("Hello.").done.is_set())
+
+    def feed(self, reply, chunk=7):
+        from Final_Version import ResponseSpeaker
+
+        said, content = [], json.dumps(reply)
+        speaker = ResponseSpeaker(said.append)
+        for start in range(0, len(content), chunk):
+            speaker.feed(content[start:start + chunk])
+            if said and not hasattr(self, "first_at"):
+                self.first_at = start
+        speaker.finish()
+        return said, len(content)
+
+    def test_explanation_is_spoken_before_the_completion_ends(self):
+        said, length = self.feed({"corrected_sentence": "I am happy.", "has_errors": True,
+                                  "explanation": "We say 'I am'. 'Are' goes with you.",
+                                  "conversational_response": "Great! What makes you happy today?"})
+        self.assertEqual(said, ["We say 'I am'.", "'Are' goes with you.", "Great! What makes you happy today?"])
+        self.assertLess(self.first_at, length / 2)
+
+    def test_reply_waits_for_the_explanation_and_prefix_without_errors(self):
+        said, _ = self.feed({"conversational_response": "Nice. Tell me more about it.", "has_errors": True,
+                             "explanation": "Use 'am' with 'I'."})
+        self.assertEqual(said, ["Use 'am' with 'I'.", "Nice. Tell me more about it."])
+        said, _ = self.feed({"has_errors": False, "explanation": "", "conversational_response": "Tell me more."})
+        self.assertEqual(said, ["That's perfectly said!", "Tell me more."])
+
+    def test_broken_stream_drops_fragments_and_says_the_fallback(self):
+        from Final_Version import ResponseSpeaker
+
+        said = []
+        speaker = ResponseSpeaker(said.append)
+        speaker.feed('{"has_errors": true, "explanation": "Use \'am\' with \'I\'. It is the ')
+        speaker.abort("Let's talk about something else.")
+        speaker.finish()
+        self.assertEqual(said, ["Use 'am' with 'I'.", "Let's talk about something else."])
+
+        said = []
+        speaker = ResponseSpeaker(said.append)
+        speaker.feed('{"has_errors": false, "explanation": "", "conversational_response": "Nice work today. Tell me mo')
+        speaker.abort("Nice work today. Tell me mo")  # the salvaged reply is already being said
+        speaker.finish()
+        self.assertEqual(said, ["That's perfectly said!", "Nice work today."])
+
+
+class WordModel:
+    """Stands in for Whisper: each second of audio is the word w<DC offset * 100>."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def transcribe(self, audio, initial_prompt=None, **options):
+        self.prompts.append(initial_prompt)
+        segments = []
+        for start in range(0, len(audio), 16000):
+            second = audio[start:start + 16000]
+            if np.sqrt(np.mean(second ** 2)) > 0.02:
+                segments.append({"start": start / 16000, "end": (start + len(second)) / 16000,
+                                 "text": f" w{round(float(np.median(second)) * 100)}"})
+        return {"text": "".join(s["text"] for s in segments), "segments": segments}
+
+
+class StreamingTranscriptionTests(TestCase):
+    def test_chunks_commit_settled_words_and_tail_finishes(self):
+        t = np.arange(16000) / 16000
+        words = [0.1 * np.sin(2 * np.pi * 180 * t) + i / 100 for i in range(14)]
+        audio = np.concatenate(words + [np.zeros(16000)]).astype(np.float32)
+        buffer, model = AudioRingBuffer(initial_seconds=5, max_seconds=None), WordModel()
+        streamer = StreamingTranscriber(model, buffer, chunk_seconds=6, overlap_seconds=1).start()
+
+        def wait_for_passes(n):
+            deadline = time.monotonic() + 5
+            while streamer.passes < n and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        buffer.write(audio[:7 * 16000])
+        wait_for_passes(1)
+        buffer.write(audio[7 * 16000:])
+        wait_for_passes(2)
+        text, result = streamer.finish()
+
+        self.assertEqual(text, " ".join(f"w{i}" for i in range(14)))
+        self.assertEqual(result["passes"], 3)  # 0-6s settles w0-w4, 5-11s settles w5-w9, then the tail
+        self.assertIsNone(model.prompts[0])
+        self.assertTrue(model.prompts[-1].endswith("w9"))
+
+    def test_capped_buffer_is_refused(self):
+        with self.assertRaises(ValueError):
+            StreamingTranscriber(WordModel(), AudioRingBuffer(max_seconds=10))
+
+
+class VoiceActivityTests(TestCase):
+    def test_trim_keeps_speech_and_shortens_pauses(self):
+        audio = synthetic_utterance(("n", 2), ("s", 1), ("n", 2), ("s", 1), ("n", 3))
+        speech = trim_silence(audio, pad_seconds=0.2, max_pause=0.5)
+        self.assertAlmostEqual(len(speech) / 16000, 0.2 + 1 + 0.5 + 1 + 0.2, delta=0.1)
+        self.assertIsNone(trim_silence(synthetic_utterance(("n", 2))))
+
+    def test_detector_stops_after_trailing_silence(self):
+        audio = synthetic_utterance(("n", 1), ("s", 1.5), ("n", 3))
+        vad = VoiceActivityDetector(silence_seconds=0.8)
+        for start in range(0, len(audio), 1024):
+            if vad.feed(audio[start:start + 1024]):
+                break
+        self.assertTrue(vad.done)
+        self.assertAlmostEqual(vad.speech_start / 16000, 1.0, delta=0.05)
+        self.assertAlmostEqual((start + 1024) / 16000, 2.5 + 0.8, delta=0.1)
+
+    def test_silence_is_not_transcribed(self):
+        model = mock.Mock()
+        self.assertEqual(transcribe_audio1(synthetic_utterance(("n", 2)), model), ("", {}))
+        model.transcribe.assert_not_called()
+
+
+class AudioRingBufferTests(TestCase):
+    def test_grows_and_returns_a_view(self):
+        buffer = AudioRingBuffer(sample_rate=10, initial_seconds=1)
+        for start in range(0, 35, 5):
+            buffer.write(np.arange(start, start + 5, dtype=np.float32).reshape(5, 1))
+        audio = buffer.get()
+        np.testing.assert_array_equal(audio, np.arange(35, dtype=np.float32))
+        self.assertEqual(len(buffer._data), 40)
+        self.assertTrue(np.shares_memory(audio, buffer._data))
+
+    def test_max_seconds_keeps_most_recent_audio(self):
+        buffer = AudioRingBuffer(sample_rate=10, initial_seconds=1, max_seconds=2)
+        for start in range(0, 35, 5):
+            buffer.write(np.arange(start, start + 5, dtype=np.float32))
+        np.testing.assert_array_equal(buffer.get(), np.arange(15, 35, dtype=np.float32))
+        buffer.clear()
+        self.assertEqual(len(buffer.get()), 0)
+
+    def test_transcribes_array_without_files_and_reads_debug_wav(self):
+        audio = np.linspace(-0.5, 0.5, 1600, dtype=np.float32)
+        model = mock.Mock()
+        model.transcribe.return_value = {"text": " hello "}
+        with mock.patch("tempfile.NamedTemporaryFile") as temp_file:
+            self.assertEqual(transcribe_audio1(audio, model, trim=False)[0], "hello")
+        temp_file.assert_not_called()
+        self.assertIs(model.transcribe.call_args[0][0], audio)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "take.wav")
+            save_wav(path, audio, 16000)
+            transcribe_audio1(path, model, trim=False)
+            self.assertFalse(os.path.exists(path))
+        np.testing.assert_allclose(model.transcribe.call_args[0][0], audio, atol=1e-4)
+
+
+class WhisperRegistryTests(TestCase):
+    def setUp(self):
+        reset_whisper_models()
+        self.addCleanup(reset_whisper_models)
+
+    def test_cli_import_is_cheap(self):
+        import Final_Version
+        self.assertNotIn("whisper", sys.modules)
+        self.assertNotIn("sounddevice", sys.modules)
+        self.assertTrue(callable(Final_Version.run_conversation))
+
+    def test_model_loaded_once_and_preload_shared(self):
+        fake_whisper = mock.Mock()
+        fake_whisper.load_model.side_effect = lambda name: time.sleep(0.1) or f"model-{name}"
+        with mock.patch.dict(sys.modules, {"whisper": fake_whisper}):
+            preload_whisper("tiny")
+            self.assertEqual(get_whisper_model("tiny"), "model-tiny")  # waits for the preload
+            self.assertEqual(get_whisper_model("tiny"), "model-tiny")
+        fake_whisper.load_model.assert_called_once_with("tiny")
+
+
+class PromptBuilderTests(TestCase):
+    def test_system_prefix_is_identical_across_requests(self):
+        first = prompts.TUTOR_PROMPT.build("I are happy")
+        second = prompts.TUTOR_PROMPT.build("something else", [("hi", "hello")])
+        self.assertIs(first.messages[0], second.messages[0])
+        self.assertEqual(first.messages[0]["content"], prompts.SYSTEM_MESSAGE)
+
+    def test_prompt_size_is_recorded(self):
+        before = metrics.PROMPT_TOKENS.count(prompt="reply")
+        prompts.build_reply_conversation("I am happy", [("hi", "hello")])
+        self.assertEqual(metrics.PROMPT_TOKENS.count(prompt="reply"), before + 1)
+
+    def test_history_trimmed_to_budget_newest_first(self):
+        builder = PromptBuilder("system", token_budget=40, max_user_tokens=100)
+        turns = [("old " * 20, "reply"), ("recent", "reply")]
+        prompt = builder.build("hello", turns)
+        self.assertEqual(prompt.history_turns, 1)
+        self.assertEqual(prompt.messages[1]["content"], "recent")
+        self.assertLessEqual(prompt.prompt_tokens, 40)
+
+    def test_long_user_message_is_clipped(self):
+        builder = PromptBuilder("system", token_budget=1000, max_user_tokens=10)
+        prompt = builder.build("word " * 500)
+        self.assertLessEqual(count_tokens(prompt.messages[-1]["content"]), 10)
+
+
+class FastPathTests(TestCase):
+    def test_corrects_known_patterns(self):
+        self.assertEqual(check_locally("He don't like it")["corrected_sentence"], "He doesn't like it")
+        self.assertEqual(check_locally("i are happy")["corrected_sentence"], "I am happy")
+        result = check_locally("I have 25 years old.")
+        self.assertTrue(result["has_errors"])
+        self.assertEqual(result["corrected_sentence"], "I am 25 years old.")
+
+    def test_you_as_object_is_not_the_subject(self):
+        self.assertIsNone(check_locally("Thank you is enough"))
+        self.assertIsNone(check_locally("Saying thank you was polite."))
+        self.assertIsNone(check_locally("I told you is fine"))
+        self.assertEqual(check_locally("You was late")["corrected_sentence"], "You were late")
+        self.assertEqual(check_locally("Sorry, you is right.")["corrected_sentence"], "Sorry, you are right.")
+
+    def test_it_as_object_and_i_as_numeral_are_not_the_subject(self):
+        self.assertIsNone(check_locally("People who like it are nice"))
+        self.assertIsNone(check_locally("The dogs that chase it are loud"))
+        self.assertIsNone(check_locally("Those who try it don't regret"))
+        self.assertIsNone(check_locally("Chapter I is short"))
+        self.assertIsNone(check_locally("King Henry I has a castle"))
+        self.assertEqual(check_locally("It are cold. I is tired")["corrected_sentence"], "It is cold. I am tired")
+
+    def test_stock_phrases_are_clean(self):
+        self.assertEqual(check_locally("Good morning!"),
+                         {"corrected_sentence": "Good morning!", "has_errors": False, "explanation": ""})
+
+    def test_leaves_everything_else_to_the_model(self):
+        self.assertIsNone(check_locally("the movie was amazing and i loved it"))
+        self.assertIsNone(check_locally("I are happy because " + "very " * 10 + "much"))
+
+
+class FastPathViewTests(StubLLMViewMixin, TestCase):
+    def post(self, message):
+        response = self.client.post("/api/message/", {"message": message}, content_type="application/json")
+        return json.loads(response.content)
+
+    def test_fast_path_only_asks_for_reply(self):
+        before = fast_path_stats.snapshot()["fast_path"]
+        data = self.post("he don't know")
+        self.assertEqual(data["corrected_sentence"], "he doesn't know")
+        self.assertEqual(self.llm_server.requests[-1]["messages"][0]["content"], prompts.REPLY_SYSTEM_MESSAGE)
+        self.assertEqual(fast_path_stats.snapshot()["fast_path"], before + 1)
+
+    def test_correction_only_mode_skips_llm(self):
+        with self.settings(TUTOR_FAST_PATH={"ENABLED": True, "MAX_WORDS": 8, "CORRECTION_ONLY": True}):
+            data = self.post("hello")
+        self.assertEqual(self.llm_server.requests, [])
+        self.assertFalse(data["has_errors"])
+        self.assertEqual(data["ai_response"], views.CORRECTION_ONLY_RESPONSE)
+
+
+class WriteBehindTests(TestCase):
+    fields = {"user_message": "hi", "corrected_sentence": "hi", "ai_response": "hello", "session_id": "wb"}
+
+    def test_writer_batches_rows(self):
+        writer = ChatMessageWriter(batch_size=2, flush_interval=3600)
+        self.addCleanup(writer.stop)
+        for _ in range(3):
+            self.assertTrue(writer.enqueue(dict(self.fields)))
+        writer.flush()
+        self.assertEqual(ChatMessage.objects.filter(session_id="wb").count(), 3)
+        self.assertEqual((writer.written, writer.batches), (3, 2))
+
+    def test_failed_batch_is_saved_row_by_row(self):
+        writer = ChatMessageWriter(batch_size=3, flush_interval=3600)
+        self.addCleanup(writer.stop)
+        dropped = metrics.WRITE_BEHIND_DROPS.value()
+        writer.enqueue(dict(self.fields))
+        writer.enqueue({**self.fields, "no_such_field": 1})  # fails the bulk insert, then on its own
+        writer.enqueue(dict(self.fields))
+        writer.flush()
+        self.assertEqual(ChatMessage.objects.filter(session_id="wb").count(), 2)
+        self.assertEqual((writer.written, writer.dropped), (2, 1))
+        self.assertEqual(metrics.WRITE_BEHIND_DROPS.value(), dropped + 1)
+
+    def test_save_is_queued_when_enabled(self):
+        config = {"ENABLED": True, "BATCH_SIZE": 100, "FLUSH_INTERVAL": 3600, "MAX_QUEUE": 1}
+        with self.settings(TUTOR_WRITE_BEHIND=config):
+            self.addCleanup(shutdown_writer)
+            self.assertIsNone(save_chat_message(dict(self.fields)))
+            # Queue full: falls back to a direct insert
+            self.assertIsNotNone(save_chat_message(dict(self.fields)))
+            self.assertEqual(get_writer().pending(), 1)
+
+
+class SingleFlightTests(TestCase):
+    def test_concurrent_duplicates_share_one_call(self):
+        single_flight = LocalSingleFlight(ttl=60)
+        calls = []
+        release = threading.Event()
+
+        def handle():
+            calls.append(1)
+            release.wait(5)
+            return {"answer": 42}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight.run(("s", "k"), "fp", handle)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(replayed for _, replayed in results), [False, True, True, True])
+        self.assertTrue(all(payload == {"answer": 42} for payload, _ in results))
+
+    def test_result_stored_after_first_lookup_is_replayed(self):
+        single_flight = LocalSingleFlight(ttl=60)
+        single_flight.run(("s", "k"), "fp", lambda: "first")
+        stored = single_flight._get(("s", "k"))
+        # The original finishes between the lock-free lookup and _join's
+        with mock.patch.object(single_flight, "_get", side_effect=[None, stored]):
+            self.assertEqual(single_flight.run(("s", "k"), "fp", lambda: "second"), ("first", True))
+
+    def test_duplicate_runs_itself_when_the_leader_is_cancelled(self):
+        single_flight = LocalSingleFlight(ttl=60)
+
+        async def scenario():
+            async def hang():
+                await asyncio.sleep(10)
+
+            async def answer():
+                return {"answer": 42}
+
+            leader = asyncio.create_task(single_flight.arun(("s", "k"), "fp", hang))
+            await asyncio.sleep(0.05)
+            duplicate = asyncio.create_task(single_flight.arun(("s", "k"), "fp", answer))
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            return await duplicate
+
+        self.assertEqual(asyncio.run(scenario()), ({"answer": 42}, False))
+
+    def test_run_goes_through_claim_complete_and_abandon(self):
+        single_flight = LocalSingleFlight(ttl=60)
+        hooks = {name: mock.patch.object(single_flight, name, wraps=getattr(single_flight, name)).start()
+                 for name in ("claim", "aclaim", "complete", "acomplete", "abandon")}
+        self.addCleanup(mock.patch.stopall)
+        single_flight.run(("s", "a"), "fp", lambda: "ok")
+        hooks["claim"].assert_called_once_with(("s", "a"), "fp")
+        hooks["complete"].assert_called_once()
+
+        async def cancelled_leader():
+            async def hang():
+                await asyncio.sleep(10)
+
+            leader = asyncio.create_task(single_flight.arun(("s", "b"), "fp", hang))
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            await asyncio.gather(leader, return_exceptions=True)
+
+        asyncio.run(cancelled_leader())
+        hooks["aclaim"].assert_called_once_with(("s", "b"), "fp")
+        scope, call = hooks["abandon"].call_args.args
+        self.assertEqual(scope, ("s", "b"))
+        self.assertTrue(call.done.is_set() and not call.completed and call.error is None)
+        hooks["acomplete"].assert_not_called()
+
+    def test_failures_are_not_stored(self):
+        single_flight = LocalSingleFlight(ttl=60)
+        with self.assertRaises(RuntimeError):
+            single_flight.run(("s", "k"), "fp", mock.Mock(side_effect=RuntimeError("boom")))
+        self.assertEqual(single_flight.run(("s", "k"), "fp", lambda: "ok"), ("ok", False))
+        with self.assertRaises(IdempotencyConflict):
+            single_flight.run(("s", "k"), "other", lambda: "no")
+
+    def test_results_expire(self):
+        single_flight = LocalSingleFlight(ttl=0)
+        single_flight.run(("s", "k"), "fp", lambda: "first")
+        self.assertEqual(single_flight.run(("s", "k"), "fp", lambda: "second"), ("second", False))
+
+
+class IdempotencyViewTests(StubLLMViewMixin, TestCase):
+    def _post(self, message, key):
+        return self.client.post("/api/message/", {"message": message}, content_type="application/json",
+                                headers={"Idempotency-Key": key})
+
+    def test_repeat_returns_stored_result(self):
+        first = self._post("I are happy", "key-1")
+        second = self._post("I are happy", "key-1")
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(json.loads(first.content), json.loads(second.content))
+        self.assertEqual(len(self.llm_server.requests), 1)
+        self.assertEqual(ChatMessage.objects.filter(session_id="test-session").count(), 1)
+
+    def test_stream_repeat_replays_done_event(self):
+        def stream(key):
+            return self.client.post("/api/message/stream/", {"message": "I are happy"},
+                                    content_type="application/json", headers={"Idempotency-Key": key})
+
+        body = b"".join(stream("key-1").streaming_content).decode()
+        done = json.loads(body.strip().split("\n\n")[-1].split("\n")[1][len("data: "):])
+        repeat = stream("key-1")
+        self.assertEqual(repeat["Idempotent-Replayed"], "true")
+        event, data = repeat.content.decode().strip().split("\n")
+        self.assertEqual((event, json.loads(data[len("data: "):])), ("event: done", done))
+        self.assertEqual(len(self.llm_server.requests), 1)
+        self.assertEqual(ChatMessage.objects.filter(session_id="test-session").count(), 1)
+
+    def test_key_reused_for_other_message(self):
+        self._post("I are happy", "key-1")
+        self.assertEqual(self._post("She go to school", "key-1").status_code, 422)
+        self.assertEqual(self._post("She go to school", "key-2").status_code, 200)
+
+
+class AdmissionTests(TestCase):
+    def test_token_bucket(self):
+        admission = LocalAdmission(rate=1.0, burst=2)
+        for _ in range(2):
+            with admission.admit("s1"):
+                pass
+        with self.assertRaises(RateLimited) as caught:
+            with admission.admit("s1"):
+                pass
+        self.assertEqual(caught.exception.retry_after, 1)
+        with admission.admit("s2"):  # buckets are per session
+            pass
+
+    def test_queue_and_overload(self):
+        admission = LocalAdmission(burst=10, max_concurrent=1, max_queue=1, max_wait=0.2)
+        with admission.admit("a"):
+            results = []
+
+            def queued():
+                try:
+                    with admission.admit("b"):
+                        results.append("admitted")
+                except Overloaded:
+                    results.append("overloaded")
+
+            waiter = threading.Thread(target=queued)
+            waiter.start()
+            time.sleep(0.05)
+            self.assertEqual(admission.queued(), 1)
+            with self.assertRaises(Overloaded):  # the queue is full
+                with admission.admit("c"):
+                    pass
+            waiter.join()
+        self.assertEqual(results, ["overloaded"])  # waited longer than max_wait
+        self.assertEqual((admission.in_flight(), admission.queued()), (0, 0))
+        with admission.admit("d"):
+            self.assertEqual(admission.in_flight(), 1)
+
+    def test_overloaded_request_gets_its_token_back(self):
+        admission = LocalAdmission(rate=0.01, burst=1, max_concurrent=1, max_queue=0)
+        with admission.admit("a"):
+            with self.assertRaises(Overloaded):
+                with admission.admit("b"):
+                    pass
+        with admission.admit("b"):  # not RateLimited: the rejected attempt didn't spend the token
+            pass
+
+
+class AdmissionViewTests(StubLLMViewMixin, TestCase):
+    def test_rate_limited_with_retry_after(self):
+        config = {"BACKEND": "local", "RATE": 0.1, "BURST": 1}
+        with self.settings(TUTOR_ADMISSION=config):
+            reset_admission()
+            self.client.post("/api/message/", {"message": "I are happy"}, content_type="application/json")
+            response = self.client.post("/api/message/stream/", {"message": "I are happy"},
+                                        content_type="application/json")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "10")
+        self.assertEqual(len(self.llm_server.requests), 1)
+        self.assertIn('tutor_admission_rejections_total{reason="rate_limited"}',
+                      self.client.get("/metrics/").content.decode())
+
+
+class MetricsTests(TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = metrics.Histogram("test_seconds", "Test.", ["stage"], buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.5, 5.0):
+            histogram.observe(seconds, stage="llm")
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{stage="llm",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="llm",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="llm",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{stage="llm"} 3', lines)
+
+    def test_spans_are_collected_per_block(self):
+        with metrics.collect_timings() as timings:
+            with metrics.span("history"):
+                pass
+            with metrics.span("history"):
+                pass
+        with metrics.span("outside"):
+            pass
+        self.assertEqual([stage for stage, _ in timings], ["history", "history"])
+        self.assertRegex(metrics.server_timing(timings, 0.5), r"^history;dur=\d+\.\d, total;dur=500\.0$")
+
+
+class MetricsViewTests(StubLLMViewMixin, TestCase):
+    def test_server_timing_header_lists_stages(self):
+        with self.settings(TUTOR_METRICS={"ENDPOINT": True, "SERVER_TIMING": True}):
+            response = self.client.post("/api/message/", {"message": "Yesterday I goed to the park with my dog"},
+                                        content_type="application/json")
+        stages = [item.split(";")[0] for item in response["Server-Timing"].split(", ")]
+        self.assertEqual(stages, ["session", "history", "correction_lookup", "prompt", "llm", "parse", "save", "total"])
+
+    def test_no_server_timing_when_disabled(self):
+        with self.settings(TUTOR_METRICS={"ENDPOINT": True, "SERVER_TIMING": False}):
+            response = self.client.post("/api/message/", {"message": "hello"}, content_type="application/json")
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_metrics_endpoint(self):
+        before = metrics.FALLBACK_RESPONSES.value()
+        with mock.patch.object(llm_client, "GROQ_BASE_URL", "http://127.0.0.1:1/v1"), \
+                mock.patch.object(llm_client, "LLM_MAX_RETRIES", 0):
+            llm_client.shutdown()
+            self.client.post("/api/message/", {"message": "Yesterday I goed to the park with my dog"},
+                             content_type="application/json")
+        self.assertEqual(metrics.FALLBACK_RESPONSES.value(), before + 1)
+
+        response = self.client.get("/metrics/")
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        self.assertIn('tutor_llm_failures_total{call="full"}', body)
+        self.assertIn('tutor_stage_seconds_count{stage="history"}', body)
+        self.assertIn('tutor_request_seconds_count{view="tutor_chat:process_message"}', body)
+
+        with self.settings(TUTOR_METRICS={"ENDPOINT": False, "SERVER_TIMING": False}):
+            self.assertEqual(self.client.get("/metrics/").status_code, 404)
+
+
+class StructuredOutputTests(TestCase):
+    def test_extracts_object_from_surrounding_text(self):
+        for text in (
+            '```json\n{"a": 1}\n```',
+            'Sure! Here is the analysis: {"a": 1} Hope that helps.',
+            'Use {name} for names. {"a": 1}',
+        ):
+            self.assertEqual(extract_json_object(text), {"a": 1})
+        self.assertEqual(extract_json_object('{"a": "a } and a \\" quote", "b": {"c": 2}}'),
+                         {"a": 'a } and a " quote', "b": {"c": 2}})
+
+    def test_unusable_output_raises(self):
+        for text in ("no json here", '{"conversational_response": "cut off', "[1, 2]"):
+            with self.assertRaises(ResponseFormatError):
+                extract_json_object(text)
+
+    def test_validation_fills_defaults_and_checks_types(self):
+        result = decode_tutor_response('{"conversational_response": "Nice!", "has_errors": "false", "x": 1}', "hi")
+        self.assertEqual(result, {"corrected_sentence": "hi", "has_errors": False, "explanation": "",
+                                  "conversational_response": "Nice!"})
+        for bad in ('{"corrected_sentence": "hi"}', '{"conversational_response": "Hi", "has_errors": "maybe"}',
+                    '{"conversational_response": ["Hi"]}'):
+            with self.assertRaises(ResponseFormatError):
+                decode_tutor_response(bad, "hi")
+
+    def test_salvage_reply(self):
+        self.assertEqual(salvage_reply("  That sounds fun!  "), "That sounds fun!")
+        self.assertIsNone(salvage_reply('{"conversational_response": "cut'))
+        self.assertIsNone(salvage_reply(""))
+
+
+class StructuredOutputViewTests(StubLLMViewMixin, TestCase):
+    message = "Yesterday I goed to the park with my dog"
+
+    def setUp(self):
+        super().setUp()
+        json_mode_support.reset()
+        self.addCleanup(json_mode_support.reset)
+
+    def post(self):
+        response = self.client.post("/api/message/", {"message": self.message}, content_type="application/json")
+        return json.loads(response.content)
+
+    def test_requests_json_mode_and_tolerates_prose(self):
+        wrapped = "Here you go:\n" + StubLLMHandler.reply + "\nLet me know!"
+        with mock.patch.object(StubLLMHandler, "reply", wrapped):
+            data = self.post()
+        self.assertEqual(self.llm_server.requests[0]["response_format"], {"type": "json_object"})
+        self.assertEqual(data["ai_response"], "Glad to hear it!")
+        self.assertTrue(data["has_errors"])
+
+    def test_unparseable_output_counts_and_falls_back(self):
+        before = metrics.PARSE_FAILURES.value(model=views.GROQ_MODEL)
+        with mock.patch.object(StubLLMHandler, "reply", '{"conversational_response": "Glad'):
+            data = self.post()
+        self.assertEqual(data["ai_response"], views.FALLBACK_RESPONSE)
+        self.assertEqual(metrics.PARSE_FAILURES.value(model=views.GROQ_MODEL), before + 1)
+        # Not cached: the next identical message asks the model again
+        self.post()
+        self.assertEqual(len(self.llm_server.requests), 2)
+
+    def test_plain_prose_is_kept_as_reply(self):
+        with mock.patch.object(StubLLMHandler, "reply", "What a lovely day for it!"):
+            data = self.post()
+        self.assertEqual(data["ai_response"], "What a lovely day for it!")
+        self.assertFalse(data["has_errors"])
+
+    def test_json_mode_rejection_is_remembered(self):
+        with mock.patch.object(StubLLMHandler, "reject_json_mode", True):
+            data = self.post()
+            self.assertEqual(data["ai_response"], "Glad to hear it!")
+            reset_correction_cache()
+            self.post()
+        with_format = ["response_format" in request for request in self.llm_server.requests]
+        self.assertEqual(with_format, [True, False, False])
+
+
+class ResilienceTests(StubLLMServerMixin, TestCase):
+    def setUp(self):
+        self.llm_server.requests.clear()
+        self.llm_server.delays.clear()
+        self.llm_server.fail_next = 0
+        self.client_ = llm_client.get_client("key", base_url=self.llm_url, max_retries=0)
+        self.addCleanup(llm_client.shutdown)
+
+    def attempt(self, timeout):
+        return self.client_.chat.completions.create(
+            model="stub", messages=[{"role": "user", "content": "hi"}], timeout=timeout)
+
+    def test_retries_transient_failures(self):
+        self.llm_server.fail_next = 1
+        policy = ResiliencePolicy(deadline=5, attempts=2, backoff=0.01)
+        policy.call(self.attempt)
+        self.assertEqual(len(self.llm_server.requests), 2)
+        self.assertEqual(policy.breaker.state, "closed")
+
+    def test_deadline_bounds_slow_calls(self):
+        self.llm_server.delays[:] = [1.0]
+        policy = ResiliencePolicy(deadline=0.3, attempts=3, backoff=0.01)
+        start = time.monotonic()
+        with self.assertRaises(Exception):
+            policy.call(self.attempt)
+        self.assertLess(time.monotonic() - start, 0.9)
+
+    def test_breaker_opens_and_recovers(self):
+        self.llm_server.fail_next = 2
+        policy = ResiliencePolicy(deadline=5, attempts=1, failure_threshold=2, reset_timeout=0.2)
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                policy.call(self.attempt)
+        self.assertEqual(policy.breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            policy.call(self.attempt)
+        self.assertEqual(len(self.llm_server.requests), 2)  # refused without a request
+
+        time.sleep(0.25)
+        self.assertEqual(policy.breaker.state, "half_open")
+        policy.call(self.attempt)
+        self.assertEqual(policy.breaker.state, "closed")
+
+    def test_half_open_failure_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        for _ in range(4):
+            breaker.record_failure()
+        self.assertTrue(breaker.allow())  # reset_timeout=0: straight to half-open, one trial
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+
+    def test_cancelled_half_open_trial_frees_the_slot(self):
+        policy = ResiliencePolicy(deadline=5, attempts=1, failure_threshold=1, reset_timeout=0, hedge=False)
+        policy.breaker.record_failure()
+        self.assertEqual(policy.breaker.state, "half_open")
+
+        async def hang(timeout):
+            await asyncio.sleep(10)
+
+        async def ok(timeout):
+            return "ok"
+
+        async def scenario():
+            trial = asyncio.ensure_future(policy.acall(hang))
+            await asyncio.sleep(0.05)
+            trial.cancel()  # e.g. the ASGI client disconnected
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+            return await policy.acall(ok)
+
+        self.assertEqual(asyncio.run(scenario()), "ok")
+        self.assertEqual(policy.breaker.state, "closed")
+
+    def test_hedges_slow_attempt(self):
+        self.llm_server.delays[:] = [1.0]
+        policy = ResiliencePolicy(deadline=5, attempts=1, hedge=True, hedge_min_delay=0.05)
+        for _ in range(20):
+            policy.latency.add(0.01)
+        before = metrics.LLM_HEDGES.value()
+        start = time.monotonic()
+        policy.call(self.attempt)
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertEqual(metrics.LLM_HEDGES.value(), before + 1)
+        self.assertEqual(len(self.llm_server.requests), 2)
+
+    def test_hedged_call_keeps_the_deadline(self):
+        policy = ResiliencePolicy(deadline=1.0, attempts=1, hedge=True, hedge_min_delay=0.5)
+        for _ in range(20):
+            policy.latency.add(0.01)
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            policy.call(lambda timeout: time.sleep(2))  # ignores its timeout
+        self.assertLess(time.monotonic() - start, 1.3)  # not deadline + hedge delay
+
+    def test_async_hedge_cancels_slow_attempt(self):
+        async def run():
+            client = llm_client.get_async_client("key", base_url=self.llm_url, max_retries=0)
+            policy = ResiliencePolicy(deadline=5, attempts=1, hedge=True, hedge_min_delay=0.05)
+            for _ in range(20):
+                policy.latency.add(0.01)
+            try:
+                return await policy.acall(lambda timeout: client.chat.completions.create(
+                    model="stub", messages=[{"role": "user", "content": "hi"}], timeout=timeout))
+            finally:
+                await llm_client.ashutdown()
+
+        self.llm_server.delays[:] = [1.0]
+        start = time.monotonic()
+        asyncio.run(run())
+        self.assertLess(time.monotonic() - start, 0.8)
+
+
+class ResilienceViewTests(StubLLMViewMixin, TestCase):
+    def test_open_breaker_serves_fallback_without_calling_llm(self):
+        from utils.resilience import get_policy
+        for _ in range(get_policy().breaker.failure_threshold):
+            get_policy().breaker.record_failure()
+        response = self.client.post("/api/message/", {"message": "Yesterday I goed to the park with my dog"},
+                                    content_type="application/json")
+        self.assertEqual(json.loads(response.content)["ai_response"], views.FALLBACK_RESPONSE)
+        self.assertEqual(self.llm_server.requests, [])
+        self.assertIn("tutor_llm_circuit_state 2", self.client.get("/metrics/").content.decode())
@@ -1,14 +1,35 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 # App name for URL namespacing
 app_name = 'tutor_chat'
 
+# Under ASGI the async views let one worker serve many slow LLM calls at once;
+# under WSGI the sync views avoid spinning up an event loop per request.
+if settings.TUTOR_ASYNC_VIEWS:
+    chat_interface, process_message, clear_history = views.achat_interface, views.aprocess_message, views.aclear_history
+    process_message_stream = views.aprocess_message_stream
+else:
+    chat_interface, process_message, clear_history = views.chat_interface, views.process_message, views.clear_history
+    process_message_stream = views.process_message_stream
+
 urlpatterns = [
     # Main chat interface
-    path('', views.chat_interface, name='chat_interface'),
+    path('', chat_interface, name='chat_interface'),
     # Process chat messages
-    path('api/message/', views.process_message, name='process_message'),
+    path('api/message/', process_message, name='process_message'),
+    # Same as above, streamed as Server-Sent Events
+    path('api/message/stream/', process_message_stream, name='process_message_stream'),
     
-    path('api/clear/', views.clear_history, name='clear_history'),
+    path('api/clear/', clear_history, name='clear_history'),
+    # Older history, a page at a time, for the chat page's lazy loading
+    path('api/history/', views.history_api, name='history_api'),
+    # The learner's error rate, common mistakes and progress
+    path('api/dashboard/', views.learner_dashboard, name='learner_dashboard'),
+    # Transcript exports and error statistics for teachers (staff login required)
+    path('api/export/', views.export_chats, name='export_chats'),
+    path('api/export/stats/', views.export_summary, name='export_summary'),
+    # Prometheus scrape target
+    path('metrics/', views.metrics, name='metrics'),
 ]
@@ -1,11 +1,35 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from openai import OpenAI
+from django.views.decorators.http import condition
 import json
 # Audio processing imports removed - now using browser Web Speech API
+import time
 import uuid
-from .models import ChatMessage
+from .admission import AdmissionRejected, get_admission
+from .analytics import dashboard, forget_sessions
+from .correction_cache import get_correction_cache
+from .export import FORMATS as EXPORT_FORMATS, KINDS as EXPORT_KINDS
+from .export import aexport_lines, export_lines, export_stats, filtered_messages, parse_moment
+from .fast_path import check_locally, fast_path_config, fast_path_stats
+from .history_cache import get_history_cache
+from .idempotency import IdempotencyConflict, fingerprint, get_single_flight, idempotency_key
+from .models import ChatMessage, SessionSummary
+from .pagination import make_page, page_etag, page_query, serialize_message
+from .prompts import build_conversation, build_reply_conversation
+from .streaming import AsyncClosingStream, ClosingStream, sse_event
+from .write_queue import asave_chat_message, flush_pending_writes, save_chat_message
+from .write_queue import get_writer
+from utils.json_stream import JSONFieldStreamer
+from utils.llm_client import connection_stats, get_client, get_async_client
+from utils.metrics import (CACHE_LOOKUPS, FALLBACK_RESPONSES, FAST_PATH_HITS, IDEMPOTENT_REPLAYS, LLM_FAILURES,
+                           PARSE_FAILURES, REGISTRY, STAGE_SECONDS, span)
+from utils.resilience import get_policy
+from utils.structured_output import (FailedGeneration, ResponseFormatError, ajson_completion,
+                                     decode_tutor_response, json_completion, salvage_reply)
 import warnings
 warnings.filterwarnings("ignore", message="FP16 is not supported on CPU; using FP32 instead")
 
@@ -25,98 +49,500 @@ def chat_interface(request):
     if 'session_id' not in request.session:
         request.session['session_id'] = str(uuid.uuid4())
     
-    # Get recent chat history for this session
+    # Get recent chat history for this session; older turns are fetched from
+    # history_api as the user scrolls up
     session_id = request.session['session_id']
-    recent_messages = ChatMessage.objects.filter(session_id=session_id).order_by('timestamp')[:50]
+    recent_messages, older_cursor = make_page(page_history_query(session_id), history_page_config()['INITIAL'])
     
     context = {
         'session_id': session_id,
         'recent_messages': recent_messages,
+        'older_cursor': older_cursor,
     }
     
     return render(request, 'tutor_chat/chat_interface.html', context)
 
 
+FALLBACK_RESPONSE = "I'm having a little trouble connecting right now. Let's talk about something else."
+# Reply used in correction-only mode, when the LLM is skipped entirely
+CORRECTION_ONLY_RESPONSE = "Let's keep practicing!"
+
+
+def history_page_config():
+    return {'INITIAL': 10, 'PAGE_SIZE': 20, 'MAX_PAGE_SIZE': 100, **getattr(settings, 'TUTOR_HISTORY_PAGE', {})}
+
+
+def page_history_query(session_id):
+    # The newest few turns, for the first render; see pagination.page_query
+    return page_query(session_id, history_page_config()['INITIAL'])
+
+
+def history_etag(request):
+    config = history_page_config()
+    return page_etag(request.session.get('session_id'), request.GET.get('before'),
+                     request.GET.get('limit', config['PAGE_SIZE']))
+
+
+@condition(etag_func=history_etag)
+def history_api(request):
+    """
+    One page of this session's history, oldest first:
+    {"messages": [...], "next_cursor": "..."}. Pass next_cursor back as
+    ?before= for the page before it; it is null on the oldest page. Answers
+    304 when If-None-Match still matches, i.e. nothing was added or deleted.
+    """
+    config = history_page_config()
+    session_id = request.session.get('session_id')
+    try:
+        limit = min(max(int(request.GET.get('limit', config['PAGE_SIZE'])), 1), config['MAX_PAGE_SIZE'])
+        messages, next_cursor = make_page(page_query(session_id, limit, request.GET.get('before')), limit)
+    except ValueError as e:  # includes InvalidCursor
+        return JsonResponse({'error': str(e)}, status=400)
+    response = JsonResponse({'messages': [serialize_message(m) for m in messages], 'next_cursor': next_cursor})
+    response['Cache-Control'] = 'private, no-cache'  # keep it, but revalidate with the ETag
+    return response
+
+
+def recent_history_query(session_id, turns):
+    # Newest first; callers reverse it into chronological order.
+    # Only the two columns the prompt needs are loaded.
+    return (ChatMessage.objects.filter(session_id=session_id).order_by('-timestamp')
+            .values_list('user_message', 'ai_response')[:turns])
+
+
+def get_recent_history(session_id):
+    """Last few (user_message, ai_response) turns, oldest first; the DB is only read on a cache miss."""
+    history_cache = get_history_cache()
+    turns = history_cache.get(session_id) if session_id else None
+    CACHE_LOOKUPS.inc(cache="history", result="miss" if turns is None else "hit")
+    if turns is None:
+        turns = list(reversed(recent_history_query(session_id, history_cache.turns)))
+        if session_id:
+            history_cache.set(session_id, turns)
+    return turns
+
+
+async def aget_recent_history(session_id):
+    history_cache = get_history_cache()
+    turns = await history_cache.aget(session_id) if session_id else None
+    CACHE_LOOKUPS.inc(cache="history", result="miss" if turns is None else "hit")
+    if turns is None:
+        turns = list(reversed([turn async for turn in recent_history_query(session_id, history_cache.turns)]))
+        if session_id:
+            await history_cache.aset(session_id, turns)
+    return turns
+
+
+def parse_ai_content(content, user_text, reply_so_far=None):
+    """
+    Returns (ai_result, valid). If the completion can't be decoded, ai_result
+    is a fallback that keeps whatever reply can be recovered (reply_so_far, the
+    part already streamed to the user, or the model's prose) and valid is False.
+    """
+    try:
+        return decode_tutor_response(content, user_text), True
+    except ResponseFormatError as e:
+        PARSE_FAILURES.inc(model=GROQ_MODEL)
+        print(f"Could not decode LLM output ({e}): {content!r}")
+    reply = reply_so_far or salvage_reply(content)
+    if not reply:
+        FALLBACK_RESPONSES.inc()
+    return fallback_response(user_text, reply or FALLBACK_RESPONSE), False
+
+
+def analysis_content(client, messages):
+    """
+    Text of a full-analysis completion, requested in JSON mode when enabled,
+    under the deadline, retry and circuit breaker rules of utils/resilience.py.
+    """
+    def attempt(timeout):
+        try:
+            response = json_completion(
+                    client, json_mode=settings.TUTOR_LLM_JSON_MODE,
+                    model = GROQ_MODEL,
+                    messages = messages,
+                    temperature = 0.3,
+                    max_tokens = 500,
+                    timeout = timeout
+                )
+            return response.choices[0].message.content
+        except FailedGeneration as e:
+            return e.content  # rejected by the provider's JSON check; the tolerant parser may still manage
+    return get_policy().call(attempt)
+
+
+async def aanalysis_content(client, messages):
+    async def attempt(timeout):
+        try:
+            response = await ajson_completion(
+                    client, json_mode=settings.TUTOR_LLM_JSON_MODE,
+                    model = GROQ_MODEL,
+                    messages = messages,
+                    temperature = 0.3,
+                    max_tokens = 500,
+                    timeout = timeout
+                )
+            return response.choices[0].message.content
+        except FailedGeneration as e:
+            return e.content
+    return await get_policy().acall(attempt)
+
+
+def fallback_response(user_text, conversational_response=FALLBACK_RESPONSE):
+    return {
+        "corrected_sentence": user_text, "has_errors": False, "explanation": "",
+        "conversational_response": conversational_response
+    }
+
+
+def message_fields(user_message, input_method, ai_response, session_id):
+    """Field values for saving one exchange as a ChatMessage."""
+    return {
+        'user_message': user_message,
+        'input_method': input_method,
+        'corrected_sentence': ai_response['corrected_sentence'],
+        'has_errors': ai_response['has_errors'],
+        'explanation': ai_response['explanation'],
+        'ai_response': ai_response['conversational_response'],
+        'session_id': session_id,
+    }
+
+
+def response_payload(transcription, ai_response, message_id):
+    return {
+        'success': True,
+        'transcription': transcription,
+        'ai_response': ai_response['conversational_response'],
+        'corrected_sentence': ai_response['corrected_sentence'],
+        'has_errors': ai_response['has_errors'],
+        'explanation': ai_response['explanation'],
+        'message_id': message_id
+    }
+
+
+def find_correction(user_text):
+    """
+    Grammar analysis without the full LLM call: the local rules first, then
+    the correction cache. Returns (correction or None, took_fast_path).
+    """
+    config = fast_path_config()
+    if config['ENABLED']:
+        correction = check_locally(user_text, config['MAX_WORDS'])
+        if correction is not None:
+            FAST_PATH_HITS.inc()
+            return correction, True
+    correction = get_correction_cache().get(user_text)
+    CACHE_LOOKUPS.inc(cache="correction", result="miss" if correction is None else "hit")
+    return correction, False
+
+
+async def afind_correction(user_text):
+    config = fast_path_config()
+    if config['ENABLED']:
+        correction = check_locally(user_text, config['MAX_WORDS'])
+        if correction is not None:
+            FAST_PATH_HITS.inc()
+            return correction, True
+    correction = await get_correction_cache().aget(user_text)
+    CACHE_LOOKUPS.inc(cache="correction", result="miss" if correction is None else "hit")
+    return correction, False
+
+
 def call_groq(user_text, session_id):
-    client = OpenAI(
-        api_key=GROQ_API_KEY,
-        base_url="https://api.groq.com/openai/v1",
-    )
-    system_message = """You are Alex, a friendly English conversation partner. You help with REAL grammar mistakes while having natural conversations.
+    client = get_client(GROQ_API_KEY, max_retries=0)  # retries are left to get_policy()
+    with span("history"):
+        recent_turns = get_recent_history(session_id)
 
-FOCUS: Only fix grammar errors that actually sound wrong when spoken.
+    with span("correction_lookup"):
+        correction, fast_path = find_correction(user_text)
+    if correction is not None:
+        if fast_path_config()['CORRECTION_ONLY']:
+            fast_path_stats.record(fast_path)
+            return {**correction, "conversational_response": CORRECTION_ONLY_RESPONSE}
+        start = time.perf_counter()
+        ai_result = call_groq_reply(client, user_text, recent_turns, correction)
+        fast_path_stats.record(fast_path, reply_seconds=time.perf_counter() - start)
+        return ai_result
 
-CORRECT these errors:
-- "I are happy" → "I am happy" (wrong verb)
-- "He don't know" → "He doesn't know" (wrong verb form)
-- "I have 25 years old" → "I am 25 years old" (wrong verb)
+    with span("prompt"):
+        conversation_messages = build_conversation(user_text, recent_turns).messages
 
-DO NOT correct these (they're natural speech):
-- Missing punctuation or capitalization
-- Natural conversation flow
-- Casual phrasing
-- Incomplete sentences that make sense in context
+    try:
+        start = time.perf_counter()
+        with span("llm"):
+            content = analysis_content(client, conversation_messages)  # Now includes conversation history!
+        fast_path_stats.record(False, full_call_seconds=time.perf_counter() - start)
+    except Exception as e:
+        print(f"Groq API error: {e}")
+        LLM_FAILURES.inc(call="full")
+        FALLBACK_RESPONSES.inc()
+        return fallback_response(user_text)
 
-Be conversational and engaging. Only mark has_errors=true for real grammar mistakes.
+    with span("parse"):
+        ai_result, valid = parse_ai_content(content, user_text)
+    if valid:
+        get_correction_cache().set(user_text, ai_result)
+    return ai_result
 
-Return JSON:
-{
-    "corrected_sentence": "corrected version if needed",
-    "has_errors": true_or_false,
-    "explanation": "brief friendly explanation if error exists",
-    "conversational_response": "engaging response to continue conversation"
-}"""
-    user_message = f"""USER'S MESSAGE: "{user_text}"
 
-EXAMPLES:
-User: "I are very sad"
-Output: {{"corrected_sentence": "I am very sad", "has_errors": true, "explanation": "We say 'I am' not 'I are'", "conversational_response": "I'm sorry to hear you're feeling sad. What's bothering you?"}}
+def call_groq_reply(client, user_text, recent_turns, correction):
+    """The correction is already known, so only ask the model for the reply."""
+    with span("prompt"):
+        messages = build_reply_conversation(user_text, recent_turns).messages
+    try:
+        with span("llm_reply"):
+            response = get_policy().call(lambda timeout: client.chat.completions.create(
+                    model = GROQ_MODEL,
+                    messages = messages,
+                    temperature = 0.3,
+                    max_tokens = 200,
+                    timeout = timeout
+                ))
+        reply = response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"Groq API error: {e}")
+        LLM_FAILURES.inc(call="reply")
+        FALLBACK_RESPONSES.inc()
+        reply = FALLBACK_RESPONSE
+    return {**correction, "conversational_response": reply}
 
-User: "the movie was amazing and i loved it"
-Output: {{"corrected_sentence": "the movie was amazing and i loved it", "has_errors": false, "explanation": "", "conversational_response": "That's wonderful! What movie was it? I'd love to hear what you enjoyed about it."}}
 
-User: "favourite scene is when batman fights joker"  
-Output: {{"corrected_sentence": "favourite scene is when batman fights joker", "has_errors": false, "explanation": "", "conversational_response": "Great choice! That's such an intense scene. The chemistry between those characters is incredible."}}
+def stream_groq(user_text, session_id):
+    """
+    Streaming variant of call_groq.
+    Yields ('token', text) for each piece of the conversational response as it
+    arrives, then ('result', ai_result) once the whole completion is parsed.
+    """
+    client = get_client(GROQ_API_KEY, max_retries=0)
+    with span("history"):
+        recent_turns = get_recent_history(session_id)
 
-Now analyze and return JSON."""
+    with span("correction_lookup"):
+        correction, fast_path = find_correction(user_text)
+    if correction is not None:
+        if fast_path_config()['CORRECTION_ONLY']:
+            fast_path_stats.record(fast_path)
+            yield 'token', CORRECTION_ONLY_RESPONSE
+            yield 'result', {**correction, "conversational_response": CORRECTION_ONLY_RESPONSE}
+            return
+        start = time.perf_counter()
+        yield from stream_groq_reply(client, user_text, recent_turns, correction)
+        reply_seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(reply_seconds, stage="llm_reply")
+        fast_path_stats.record(fast_path, reply_seconds=reply_seconds)
+        return
 
-    # Get conversation history from database for context (like Final_Version.py)
-    recent_messages = ChatMessage.objects.filter(session_id=session_id).order_by('-timestamp')[:5]
-    recent_messages = list(reversed(recent_messages))  # Convert to list and reverse to get chronological order
+    with span("prompt"):
+        conversation_messages = build_conversation(user_text, recent_turns).messages
+    streamer = JSONFieldStreamer('conversational_response')
 
-    # Build conversation history for AI
-    conversation_messages = [{"role": "system", "content": system_message}]
+    # No JSON mode here: not every provider allows it with stream=True, and
+    # the tolerant parser copes with whatever surrounds the object
+    try:
+        start = time.perf_counter()
+        # Retried only until the response starts; a stream can't be hedged
+        stream = get_policy().call(lambda timeout: client.chat.completions.create(
+                model = GROQ_MODEL,
+                messages = conversation_messages,
+                temperature = 0.3,
+                max_tokens = 500,
+                stream = True,
+                timeout = timeout
+            ), hedge=False)
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = streamer.feed(chunk.choices[0].delta.content or "")
+            if delta:
+                yield 'token', delta
+        # Not a span: the stream was interleaved with sending tokens to the browser
+        llm_seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(llm_seconds, stage="llm")
+        fast_path_stats.record(False, full_call_seconds=llm_seconds)
+    except Exception as e:
+        print(f"Groq API error: {e}")
+        LLM_FAILURES.inc(call="full")
+        if not streamer.value:
+            FALLBACK_RESPONSES.inc()
+        # Keep whatever reply already reached the user rather than contradicting it
+        yield 'result', fallback_response(user_text, streamer.value or FALLBACK_RESPONSE)
+        return
 
-    # Add recent conversation history
-    for msg in recent_messages:
-        conversation_messages.append({"role": "user", "content": msg.user_message})
-        conversation_messages.append({"role": "assistant", "content": msg.ai_response})
+    with span("parse"):
+        ai_result, valid = parse_ai_content(streamer.text, user_text, reply_so_far=streamer.value)
+    if valid:
+        get_correction_cache().set(user_text, ai_result)
+    yield 'result', ai_result
 
-    # Add current message
-    conversation_messages.append({"role": "user", "content": user_message})
 
+def stream_groq_reply(client, user_text, recent_turns, correction):
+    """Streaming counterpart of call_groq_reply; the reply is plain text, so chunks pass straight through."""
+    reply = ""
     try:
-        response = client.chat.completions.create(
+        messages = build_reply_conversation(user_text, recent_turns).messages
+        stream = get_policy().call(lambda timeout: client.chat.completions.create(
                 model = GROQ_MODEL,
-                messages = conversation_messages,  # Now includes conversation history!
+                messages = messages,
                 temperature = 0.3,
-                max_tokens = 500
-            )
-        content = response.choices[0].message.content.strip()
-        
-        if content.startswith("```json"):
-            content = content[7:-3].strip()
-        elif content.startswith("```"):
-            content = content[3:-3].strip()
-        
-        ai_result = json.loads(content)
-        return ai_result
+                max_tokens = 200,
+                stream = True,
+                timeout = timeout
+            ), hedge=False)
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if delta:
+                reply += delta
+                yield 'token', delta
+    except Exception as e:
+        print(f"Groq API error: {e}")
+        LLM_FAILURES.inc(call="reply")
+    if not reply.strip():
+        FALLBACK_RESPONSES.inc()
+    yield 'result', {**correction, "conversational_response": reply.strip() or FALLBACK_RESPONSE}
+
+
+async def astream_groq(user_text, session_id):
+    """Async variant of stream_groq, for aprocess_message_stream."""
+    client = get_async_client(GROQ_API_KEY, max_retries=0)
+    with span("history"):
+        recent_turns = await aget_recent_history(session_id)
+
+    with span("correction_lookup"):
+        correction, fast_path = await afind_correction(user_text)
+    if correction is not None:
+        if fast_path_config()['CORRECTION_ONLY']:
+            fast_path_stats.record(fast_path)
+            yield 'token', CORRECTION_ONLY_RESPONSE
+            yield 'result', {**correction, "conversational_response": CORRECTION_ONLY_RESPONSE}
+            return
+        start = time.perf_counter()
+        async for event in astream_groq_reply(client, user_text, recent_turns, correction):
+            yield event
+        reply_seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(reply_seconds, stage="llm_reply")
+        fast_path_stats.record(fast_path, reply_seconds=reply_seconds)
+        return
+
+    with span("prompt"):
+        conversation_messages = build_conversation(user_text, recent_turns).messages
+    streamer = JSONFieldStreamer('conversational_response')
+
+    try:
+        start = time.perf_counter()
+        stream = await get_policy().acall(lambda timeout: client.chat.completions.create(
+                model = GROQ_MODEL,
+                messages = conversation_messages,
+                temperature = 0.3,
+                max_tokens = 500,
+                stream = True,
+                timeout = timeout
+            ), hedge=False)
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = streamer.feed(chunk.choices[0].delta.content or "")
+            if delta:
+                yield 'token', delta
+        llm_seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(llm_seconds, stage="llm")
+        fast_path_stats.record(False, full_call_seconds=llm_seconds)
     except Exception as e:
         print(f"Groq API error: {e}")
-        return {
-            "corrected_sentence": user_text, "has_errors": False, "explanation": "",
-            "conversational_response": "I'm having a little trouble connecting right now. Let's talk about something else."
-        }
+        LLM_FAILURES.inc(call="full")
+        if not streamer.value:
+            FALLBACK_RESPONSES.inc()
+        yield 'result', fallback_response(user_text, streamer.value or FALLBACK_RESPONSE)
+        return
+
+    with span("parse"):
+        ai_result, valid = parse_ai_content(streamer.text, user_text, reply_so_far=streamer.value)
+    if valid:
+        await get_correction_cache().aset(user_text, ai_result)
+    yield 'result', ai_result
+
+
+async def astream_groq_reply(client, user_text, recent_turns, correction):
+    """Async variant of stream_groq_reply."""
+    reply = ""
+    try:
+        messages = build_reply_conversation(user_text, recent_turns).messages
+        stream = await get_policy().acall(lambda timeout: client.chat.completions.create(
+                model = GROQ_MODEL,
+                messages = messages,
+                temperature = 0.3,
+                max_tokens = 200,
+                stream = True,
+                timeout = timeout
+            ), hedge=False)
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if delta:
+                reply += delta
+                yield 'token', delta
+    except Exception as e:
+        print(f"Groq API error: {e}")
+        LLM_FAILURES.inc(call="reply")
+    if not reply.strip():
+        FALLBACK_RESPONSES.inc()
+    yield 'result', {**correction, "conversational_response": reply.strip() or FALLBACK_RESPONSE}
+
+
+async def acall_groq(user_text, session_id):
+    """Async variant of call_groq: awaits the history query, the cache and the LLM call."""
+    client = get_async_client(GROQ_API_KEY, max_retries=0)
+    with span("history"):
+        recent_turns = await aget_recent_history(session_id)
+
+    with span("correction_lookup"):
+        correction, fast_path = await afind_correction(user_text)
+    if correction is not None:
+        if fast_path_config()['CORRECTION_ONLY']:
+            fast_path_stats.record(fast_path)
+            return {**correction, "conversational_response": CORRECTION_ONLY_RESPONSE}
+        start = time.perf_counter()
+        with span("prompt"):
+            messages = build_reply_conversation(user_text, recent_turns).messages
+        try:
+            with span("llm_reply"):
+                response = await get_policy().acall(lambda timeout: client.chat.completions.create(
+                        model = GROQ_MODEL,
+                        messages = messages,
+                        temperature = 0.3,
+                        max_tokens = 200,
+                        timeout = timeout
+                    ))
+            reply = response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"Groq API error: {e}")
+            LLM_FAILURES.inc(call="reply")
+            FALLBACK_RESPONSES.inc()
+            reply = FALLBACK_RESPONSE
+        fast_path_stats.record(fast_path, reply_seconds=time.perf_counter() - start)
+        return {**correction, "conversational_response": reply}
+
+    with span("prompt"):
+        conversation_messages = build_conversation(user_text, recent_turns).messages
+
+    try:
+        start = time.perf_counter()
+        with span("llm"):
+            content = await aanalysis_content(client, conversation_messages)
+        fast_path_stats.record(False, full_call_seconds=time.perf_counter() - start)
+    except Exception as e:
+        print(f"Groq API error: {e}")
+        LLM_FAILURES.inc(call="full")
+        FALLBACK_RESPONSES.inc()
+        return fallback_response(user_text)
+
+    with span("parse"):
+        ai_result, valid = parse_ai_content(content, user_text)
+    if valid:
+        await get_correction_cache().aset(user_text, ai_result)
+    return ai_result
 
 
 @csrf_exempt
@@ -125,7 +551,10 @@ def clear_history(request):
         try:
             session_id = request.session.get('session_id')
             if session_id:
+                flush_pending_writes()  # or queued rows would reappear after the delete
                 ChatMessage.objects.filter(session_id=session_id).delete()
+                forget_sessions([session_id])
+                get_history_cache().delete(session_id)
                 print(f"Cleared chat history for session {session_id}")
             return JsonResponse({'success': True,'message': 'Chat history cleared'})
         except Exception as e:
@@ -134,6 +563,28 @@ def clear_history(request):
     return JsonResponse({'error': 'Only POST method allowed'}, status=405)
 
 
+def rejected_response(error):
+    response = JsonResponse({'error': str(error)}, status=429)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def replayed_event(payload):
+    """A stream view's answer to a repeated Idempotency-Key: just the 'done' event."""
+    IDEMPOTENT_REPLAYS.inc()
+    response = HttpResponse(sse_event('done', payload), content_type='text/event-stream')
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent_response(payload, replayed):
+    response = JsonResponse(payload)
+    if replayed:
+        IDEMPOTENT_REPLAYS.inc()
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+
 @csrf_exempt
 def process_message(request):
     """
@@ -144,41 +595,348 @@ def process_message(request):
         try:
             data = json.loads(request.body)
             input_method = data.get('input_method','text')
-            session_id = request.session.get('session_id')
+            with span("session"):
+                session_id = request.session.get('session_id')
             # Both voice and text now use the same message field (browser handles voice transcription)
             user_message = data.get('message', '').strip()
             if not user_message:
                 return JsonResponse({'error': 'Message cannot be empty'}, status=400)
             
             transcription = user_message  # For voice, this is already transcribed by browser
-            
-            
-            ai_response = call_groq(user_message, session_id)
-            
-            # Save message to database
-            chat_message = ChatMessage.objects.create(
-                user_message=user_message,
-                input_method=input_method,
-                corrected_sentence=ai_response['corrected_sentence'],
-                has_errors=ai_response['has_errors'],
-                explanation=ai_response['explanation'],
-                ai_response=ai_response['conversational_response'],
-                session_id=session_id
-            )
-            
-            return JsonResponse({
-                'success': True,
-                'transcription': transcription,
-                'ai_response': ai_response['conversational_response'],
-                'corrected_sentence': ai_response['corrected_sentence'],
-                'has_errors': ai_response['has_errors'],
-                'explanation': ai_response['explanation'],
-                'message_id': chat_message.id
-            })
-            
+
+            def handle():
+                with get_admission().admit(session_id):
+                    ai_response = call_groq(user_message, session_id)
+
+                # Save message to database
+                with span("save"):
+                    message_id = save_chat_message(message_fields(user_message, input_method, ai_response, session_id))
+                    get_history_cache().append(session_id, user_message, ai_response['conversational_response'])
+                return response_payload(transcription, ai_response, message_id)
+
+            key = idempotency_key(request, data)
+            if key is None:
+                return JsonResponse(handle())
+            payload, replayed = get_single_flight().run((session_id, key), fingerprint(user_message), handle)
+            return idempotent_response(payload, replayed)
+
         except json.JSONDecodeError:
             return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+        except IdempotencyConflict as e:
+            return JsonResponse({'error': str(e)}, status=422)
+        except AdmissionRejected as e:
+            return rejected_response(e)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
     
     return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+
+
+@csrf_exempt
+def process_message_stream(request):
+    """
+    Streaming version of process_message.
+    Sends the conversational response as Server-Sent 'token' events while the
+    model is still generating, then one 'done' event carrying the grammar
+    correction fields. The ChatMessage row is saved once the stream finishes.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+    input_method = data.get('input_method','text')
+    with span("session"):
+        session_id = request.session.get('session_id')
+    user_message = data.get('message', '').strip()
+    if not user_message:
+        return JsonResponse({'error': 'Message cannot be empty'}, status=400)
+
+    # A repeated key gets the stored (or in-flight) result as one 'done' event
+    single_flight = get_single_flight()
+    key = idempotency_key(request, data)
+    scope, message_fingerprint, call = (session_id, key), fingerprint(user_message), None
+    if key is not None:
+        try:
+            payload, call = single_flight.claim(scope, message_fingerprint)
+        except IdempotencyConflict as e:
+            return JsonResponse({'error': str(e)}, status=422)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+        if call is None:
+            return replayed_event(payload)
+
+    # Admit before the response starts so a rejection can still be a 429;
+    # the slot is held until the stream finishes
+    try:
+        slot = get_admission().acquire(session_id)
+    except AdmissionRejected as e:
+        if call is not None:
+            single_flight.abandon(scope, call)
+        return rejected_response(e)
+
+    def event_stream():
+        try:
+            try:
+                for kind, value in stream_groq(user_message, session_id):
+                    if kind == 'token':
+                        yield sse_event('token', {'text': value})
+                        continue
+                    ai_response = value
+                    break
+            finally:
+                slot.release()
+            with span("save"):
+                message_id = save_chat_message(message_fields(user_message, input_method, ai_response, session_id))
+                get_history_cache().append(session_id, user_message, ai_response['conversational_response'])
+            payload = response_payload(user_message, ai_response, message_id)
+            if call is not None:
+                single_flight.complete(scope, message_fingerprint, call, payload)
+            yield sse_event('done', payload)
+        except Exception as e:
+            print(f"Error streaming message: {e}")
+            yield sse_event('error', {'error': str(e)})
+        finally:
+            if call is not None:
+                single_flight.abandon(scope, call)  # nothing to replay; a retry runs again
+
+    # Also released on close, in case the generator never gets to run (client gone, or an error upstream)
+    on_close = [slot.release] if call is None else [slot.release, lambda: single_flight.abandon(scope, call)]
+    response = StreamingHttpResponse(ClosingStream(event_stream(), *on_close), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
+
+def learner_dashboard(request):
+    """This session's error rate, most common kinds of mistake and daily progress, from its SessionSummary."""
+    session_id = request.session.get('session_id')
+    summary = SessionSummary.objects.filter(session_id=session_id).first() if session_id else None
+    return JsonResponse(dashboard(summary))
+
+
+def export_filters(request):
+    """The filtered ChatMessage queryset for an export request's query string."""
+    params = request.GET
+    return filtered_messages(
+        session_id=params.get('session'),
+        since=parse_moment(params.get('since')),
+        until=parse_moment(params.get('until'), end=True),
+        errors_only=params.get('errors_only') in ('1', 'true'),
+    )
+
+
+@staff_member_required
+def export_chats(request):
+    """
+    Stream an export for teachers: ?format=csv|jsonl, ?kind=messages|sessions,
+    filtered by ?session=, ?since=, ?until= (ISO dates) and ?errors_only=1.
+    """
+    fmt = request.GET.get('format', 'csv')
+    kind = request.GET.get('kind', 'messages')
+    try:
+        messages = export_filters(request)
+        if fmt not in EXPORT_FORMATS or kind not in EXPORT_KINDS:
+            raise ValueError(f"format must be one of {sorted(EXPORT_FORMATS)}, kind one of {list(EXPORT_KINDS)}")
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    # Under ASGI a sync generator would be read into memory in full before sending
+    lines = aexport_lines(messages, fmt, kind) if settings.TUTOR_ASYNC_VIEWS else export_lines(messages, fmt, kind)
+    response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="chat-{kind}.{fmt}"'
+    return response
+
+
+@staff_member_required
+def export_summary(request):
+    """Message and session counts, has_errors rates and the text/voice split for the same filters."""
+    try:
+        messages = export_filters(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(export_stats(messages))
+
+
+def pipeline_metrics():
+    """Numbers kept by other parts of the pipeline, for the /metrics/ page."""
+    llm = connection_stats.snapshot()
+    fast_path = fast_path_stats.snapshot()
+    writer = get_writer()
+    return [
+        ('tutor_llm_requests_total', 'counter', 'HTTP requests sent to the LLM provider.', llm['requests']),
+        ('tutor_llm_new_connections_total', 'counter', 'LLM requests that opened a new connection.',
+         llm['new_connections']),
+        ('tutor_fast_path_saved_seconds', 'gauge', 'Estimated LLM time saved by the local grammar rules.',
+         fast_path['est_saved_ms'] / 1000),
+        ('tutor_write_queue_pending', 'gauge', 'ChatMessage rows waiting for the write-behind thread.',
+         writer.pending() if writer is not None else 0),
+    ]
+
+
+REGISTRY.add_collector(pipeline_metrics)
+
+
+def metrics(request):
+    """Counters and latency histograms in the Prometheus text format."""
+    if not settings.TUTOR_METRICS['ENDPOINT']:
+        raise Http404
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Async versions of the views above, routed instead of the sync ones when
+# settings.TUTOR_ASYNC_VIEWS is on (the default under asgi.py). While one
+# request waits on Groq the event loop serves others, so a single worker
+# process can keep many conversations in flight.
+
+async def achat_interface(request):
+    """Async version of chat_interface."""
+    session_id = await request.session.aget('session_id')
+    if not session_id:
+        session_id = str(uuid.uuid4())
+        await request.session.aset('session_id', session_id)
+
+    # Evaluate the queryset here; the template must not query from the event loop
+    rows = [msg async for msg in page_history_query(session_id)]
+    recent_messages, older_cursor = make_page(rows, history_page_config()['INITIAL'])
+
+    context = {
+        'session_id': session_id,
+        'recent_messages': recent_messages,
+        'older_cursor': older_cursor,
+    }
+
+    return render(request, 'tutor_chat/chat_interface.html', context)
+
+
+@csrf_exempt
+async def aclear_history(request):
+    """Async version of clear_history."""
+    if request.method == 'POST':
+        try:
+            session_id = await request.session.aget('session_id')
+            if session_id:
+                await sync_to_async(flush_pending_writes)()
+                await ChatMessage.objects.filter(session_id=session_id).adelete()
+                await sync_to_async(forget_sessions)([session_id])
+                await get_history_cache().adelete(session_id)
+                print(f"Cleared chat history for session {session_id}")
+            return JsonResponse({'success': True,'message': 'Chat history cleared'})
+        except Exception as e:
+            print(f"Error clearing chat history: {e}")
+            return JsonResponse({'success': False,'message': 'Failed to clear chat history'}, status=500)
+    return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+
+
+@csrf_exempt
+async def aprocess_message(request):
+    """Async version of process_message."""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            input_method = data.get('input_method','text')
+            with span("session"):
+                session_id = await request.session.aget('session_id')
+            user_message = data.get('message', '').strip()
+            if not user_message:
+                return JsonResponse({'error': 'Message cannot be empty'}, status=400)
+
+            async def handle():
+                async with get_admission().aadmit(session_id):
+                    ai_response = await acall_groq(user_message, session_id)
+
+                with span("save"):
+                    message_id = await asave_chat_message(message_fields(user_message, input_method, ai_response, session_id))
+                    await get_history_cache().aappend(session_id, user_message, ai_response['conversational_response'])
+                return response_payload(user_message, ai_response, message_id)
+
+            key = idempotency_key(request, data)
+            if key is None:
+                return JsonResponse(await handle())
+            payload, replayed = await get_single_flight().arun((session_id, key), fingerprint(user_message), handle)
+            return idempotent_response(payload, replayed)
+
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+        except IdempotencyConflict as e:
+            return JsonResponse({'error': str(e)}, status=422)
+        except AdmissionRejected as e:
+            return rejected_response(e)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+
+    return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+
+
+@csrf_exempt
+async def aprocess_message_stream(request):
+    """
+    Async version of process_message_stream. Its events come from an async
+    generator, which ASGI sends as they are produced; a sync generator would
+    be read to the end before the first byte went out.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+    input_method = data.get('input_method','text')
+    with span("session"):
+        session_id = await request.session.aget('session_id')
+    user_message = data.get('message', '').strip()
+    if not user_message:
+        return JsonResponse({'error': 'Message cannot be empty'}, status=400)
+
+    single_flight = get_single_flight()
+    key = idempotency_key(request, data)
+    scope, message_fingerprint, call = (session_id, key), fingerprint(user_message), None
+    if key is not None:
+        try:
+            payload, call = await single_flight.aclaim(scope, message_fingerprint)
+        except IdempotencyConflict as e:
+            return JsonResponse({'error': str(e)}, status=422)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+        if call is None:
+            return replayed_event(payload)
+
+    try:
+        slot = await get_admission().aacquire(session_id)
+    except AdmissionRejected as e:
+        if call is not None:
+            single_flight.abandon(scope, call)
+        return rejected_response(e)
+
+    async def event_stream():
+        try:
+            try:
+                async for kind, value in astream_groq(user_message, session_id):
+                    if kind == 'token':
+                        yield sse_event('token', {'text': value})
+                    else:
+                        ai_response = value
+            finally:
+                await slot.arelease()
+            with span("save"):
+                message_id = await asave_chat_message(message_fields(user_message, input_method, ai_response, session_id))
+                await get_history_cache().aappend(session_id, user_message, ai_response['conversational_response'])
+            payload = response_payload(user_message, ai_response, message_id)
+            if call is not None:
+                await single_flight.acomplete(scope, message_fingerprint, call, payload)
+            yield sse_event('done', payload)
+        except Exception as e:
+            print(f"Error streaming message: {e}")
+            yield sse_event('error', {'error': str(e)})
+        finally:
+            if call is not None:
+                single_flight.abandon(scope, call)
+
+    on_close = [slot.release] if call is None else [slot.release, lambda: single_flight.abandon(scope, call)]
+    response = StreamingHttpResponse(AsyncClosingStream(event_stream(), *on_close),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,171 @@
+"""
+Write-behind queue for ChatMessage inserts.
+
+With SQLite only one connection can write at a time, so under load every
+request queues up behind the others' single-row INSERT transactions. When
+settings.TUTOR_WRITE_BEHIND['ENABLED'] is on, views hand the row to a
+background thread instead. That thread saves rows in one bulk_create
+transaction each time BATCH_SIZE rows are waiting or FLUSH_INTERVAL seconds
+have passed. If the batch fails, its rows are saved one at a time; any row
+that still can't be saved is dropped and counted in
+tutor_write_behind_dropped_total.
+
+Trade-offs: the response can't include the new row's id, and rows still
+waiting in the queue are lost if the process is killed. An orderly exit
+flushes them. If the queue is full, save_chat_message falls back to a normal
+synchronous insert.
+"""
+import atexit
+import queue
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from utils.metrics import WRITE_BEHIND_DROPS
+
+from .analytics import record_messages
+from .models import ChatMessage
+
+
+class ChatMessageWriter:
+    def __init__(self, batch_size=50, flush_interval=0.5, max_queue=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._flush_lock = threading.Lock()  # one bulk_create at a time
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="chat-message-writer", daemon=True)
+        self._thread.start()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+
+    def enqueue(self, fields):
+        """Queue one row's field dict; returns False if the queue is full."""
+        try:
+            self._queue.put_nowait(fields)
+            return True
+        except queue.Full:
+            return False
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        """Write everything queued so far, from the calling thread."""
+        with self._flush_lock:
+            while True:
+                batch = self._drain(self.batch_size)
+                if not batch:
+                    return
+                self._write(batch)
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create([ChatMessage(**fields) for fields in batch])
+                record_messages(batch)
+            self.written += len(batch)
+            self.batches += 1
+            return
+        except Exception as e:
+            print(f"Error writing {len(batch)} chat messages: {e}; saving them one at a time")
+        # One bad row or a passing lock error shouldn't cost the whole batch
+        for fields in batch:
+            try:
+                _insert(fields)
+                self.written += 1
+            except Exception as e:
+                self.dropped += 1
+                WRITE_BEHIND_DROPS.inc()
+                print(f"Dropped a chat message for session {fields.get('session_id')}: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            # Sleep until the batch is full or the interval is up
+            while self._queue.qsize() < self.batch_size and time.monotonic() < deadline:
+                if self._stop.wait(min(0.05, self.flush_interval)):
+                    return  # stop() writes what's left from the stopping thread
+            self.flush()
+            close_old_connections()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """The process-wide writer, or None when write-behind is disabled."""
+    global _writer
+    config = getattr(settings, 'TUTOR_WRITE_BEHIND', {})
+    if not config.get('ENABLED'):
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ChatMessageWriter(
+                    batch_size=config.get('BATCH_SIZE', 50),
+                    flush_interval=config.get('FLUSH_INTERVAL', 0.5),
+                    max_queue=config.get('MAX_QUEUE', 10000),
+                )
+    return _writer
+
+
+def shutdown_writer():
+    """Stop the background thread after writing out everything still queued."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+
+atexit.register(shutdown_writer)
+
+
+def _insert(fields):
+    # The session's summary is updated in the same transaction as the insert
+    with transaction.atomic():
+        message_id = ChatMessage.objects.create(**fields).id
+        record_messages([fields])
+    return message_id
+
+
+def save_chat_message(fields):
+    """Save a ChatMessage; returns its id, or None if it was queued for write-behind."""
+    writer = get_writer()
+    if writer is not None and writer.enqueue(fields):
+        return None
+    return _insert(fields)
+
+
+async def asave_chat_message(fields):
+    writer = get_writer()
+    if writer is not None and writer.enqueue(fields):
+        return None
+    return await sync_to_async(_insert)(fields)
+
+
+def flush_pending_writes():
+    """Make queued rows visible, e.g. before deleting a session's history."""
+    writer = get_writer()
+    if writer is not None:
+        writer.flush()
@@ -1,35 +1,279 @@
 # utils/audio_utils.py
-import sounddevice as sd
-import soundfile as sf
+"""
+Microphone recording for the CLI tutor.
+
+Audio is captured straight into an AudioRingBuffer: one preallocated float32
+array that PortAudio blocks are copied into as they arrive. When the
+recording stops, the samples are handed to Whisper as a view of that array,
+with no queue of blocks, no concatenation, no int16 round trip and no temp
+WAV file. Pass debug_wav= to also save the take to disk.
+
+record_until_silence() needs no key presses: a VoiceActivityDetector
+watches the blocks as they arrive, recording starts on speech and stops after
+VAD_SILENCE_SECONDS of silence. Speech is told from background noise by the
+energy of 30 ms frames against an estimated noise floor, with a lower bar for
+frames with a high zero-crossing rate (fricatives such as "s" and "f").
+Before transcription, trim_silence() cuts leading and trailing silence and
+shortens long pauses, so Whisper only processes the speech.
+
+transcribe_streaming() transcribes while the learner is still speaking: a
+StreamingTranscriber thread takes STREAM_CHUNK_SECONDS of audio from the
+recording buffer at a time, commits the segments Whisper finishes before the
+last STREAM_OVERLAP_SECONDS (that audio is transcribed again with the next
+chunk), and passes the text so far as the prompt. When recording stops only
+the tail is left to transcribe, so the wait after speaking no longer grows
+with the length of the utterance.
+
+record_press_enter1() and a path argument to transcribe_audio1() still work
+the old way, for callers that want a file.
+
+Tuning is done through environment variables:
+    AUDIO_BUFFER_SECONDS  seconds preallocated per recording (default 30)
+    AUDIO_MAX_SECONDS     cap on a recording; past it only the most recent
+                          audio is kept (default 0, no cap)
+    AUDIO_DEBUG_WAV       if set, each take is also written to this path
+    AUDIO_VAD             1 to record with voice-activity detection, 0 for
+                          press-ENTER-to-stop (default 1)
+    VAD_SILENCE_SECONDS   silence that ends an utterance (default 0.8)
+    VAD_MARGIN_DB         how far above the noise floor speech must be
+                          (default 10)
+    VAD_PAD_SECONDS       silence kept around speech when trimming (default 0.2)
+    VAD_MAX_PAUSE         pauses inside an utterance are cut to this many
+                          seconds (default 0.5)
+    AUDIO_STREAMING       1 for the CLI tutor to transcribe while recording
+                          (default 1)
+    STREAM_CHUNK_SECONDS  audio per background transcription pass (default 6)
+    STREAM_OVERLAP_SECONDS  end of each chunk left for the next pass, so words
+                          cut at the chunk edge are heard whole (default 1)
+"""
+import os
 import tempfile
-import queue
 import threading
-import numpy as np
 import time
-import os
 
-def _record_worker(q, sample_rate, channels, stop_event):
+import numpy as np
+
+from utils.metrics import span
+
+AUDIO_BUFFER_SECONDS = float(os.environ.get("AUDIO_BUFFER_SECONDS", "30"))
+AUDIO_MAX_SECONDS = float(os.environ.get("AUDIO_MAX_SECONDS", "0"))
+AUDIO_DEBUG_WAV = os.environ.get("AUDIO_DEBUG_WAV") or None
+AUDIO_VAD = os.environ.get("AUDIO_VAD", "1") == "1"
+VAD_SILENCE_SECONDS = float(os.environ.get("VAD_SILENCE_SECONDS", "0.8"))
+VAD_MARGIN_DB = float(os.environ.get("VAD_MARGIN_DB", "10"))
+VAD_PAD_SECONDS = float(os.environ.get("VAD_PAD_SECONDS", "0.2"))
+VAD_MAX_PAUSE = float(os.environ.get("VAD_MAX_PAUSE", "0.5"))
+AUDIO_STREAMING = os.environ.get("AUDIO_STREAMING", "1") == "1"
+STREAM_CHUNK_SECONDS = float(os.environ.get("STREAM_CHUNK_SECONDS", "6"))
+STREAM_OVERLAP_SECONDS = float(os.environ.get("STREAM_OVERLAP_SECONDS", "1"))
+PROMPT_CHARS = 200  # committed text passed to Whisper as initial_prompt
+
+VAD_FRAME_MS = 30
+NOISE_CEILING_DB = -40.0  # the noise floor is never assumed to be louder than this
+FRICATIVE_ZCR = 0.25      # zero crossings per sample above which quieter frames still count
+
+
+class AudioRingBuffer:
     """
-    Background worker that pushes numpy frames into a queue until stop_event is set.
+    Mono float32 samples, preallocated for initial_seconds and doubled as
+    needed. With max_seconds set it stops growing there and keeps only the
+    most recent max_seconds, overwriting the oldest samples.
     """
-    def callback(indata, frames, time_info, status):
-        # copy to avoid overwrite by PortAudio
-        q.put(indata.copy())
 
-    try:
-        with sd.InputStream(samplerate=sample_rate, channels=channels, dtype='float32',
-                            callback=callback):
-            while not stop_event.is_set():
-                time.sleep(0.05)
-    except Exception as e:
-        # push an exception placeholder so caller knows something failed
-        q.put(("__ERROR__", str(e)))
+    def __init__(self, sample_rate=16000, initial_seconds=AUDIO_BUFFER_SECONDS, max_seconds=AUDIO_MAX_SECONDS):
+        self.sample_rate = sample_rate
+        self.max_samples = int(max_seconds * sample_rate) if max_seconds else None
+        capacity = int(initial_seconds * sample_rate)
+        if self.max_samples:
+            capacity = min(capacity, self.max_samples)
+        self._data = np.zeros(max(capacity, 1), dtype=np.float32)
+        self._end = 0        # write position
+        self._filled = 0     # valid samples, at most len(self._data)
+        self._lock = threading.Lock()
 
-def record_press_enter1(sample_rate=16000, channels=1):
+    def __len__(self):
+        return self._filled
+
+    @property
+    def seconds(self):
+        return self._filled / self.sample_rate
+
+    def write(self, block):
+        """Append a block of samples; 2-D (frames, channels) blocks keep the first channel."""
+        samples = block[:, 0] if block.ndim == 2 else block
+        with self._lock:
+            needed = self._filled + len(samples)
+            # Only grow while nothing has been overwritten yet (samples still in order)
+            if needed > len(self._data) and self._end == self._filled % len(self._data):
+                self._grow(needed)
+            size = len(self._data)
+            if len(samples) >= size:
+                # A block bigger than the whole (maxed-out) buffer: keep its tail
+                self._data[:] = samples[-size:]
+                self._end, self._filled = 0, size
+                return
+            first = min(len(samples), size - self._end)
+            self._data[self._end:self._end + first] = samples[:first]
+            self._data[:len(samples) - first] = samples[first:]
+            self._end = (self._end + len(samples)) % size
+            self._filled = min(size, self._filled + len(samples))
+
+    def _grow(self, needed):
+        size = len(self._data)
+        while size < needed:
+            size *= 2
+        if self.max_samples:
+            size = min(size, self.max_samples)
+        if size > len(self._data):
+            grown = np.zeros(size, dtype=np.float32)
+            grown[:self._filled] = self._data[:self._filled]
+            self._data = grown
+            self._end = self._filled
+
+    def get(self):
+        """The samples oldest first: a view of the buffer, or one copy once it has wrapped."""
+        with self._lock:
+            if self._filled < len(self._data) or self._end == 0:
+                return self._data[:self._filled]
+            return np.concatenate((self._data[self._end:], self._data[:self._end]))
+
+    def clear(self):
+        with self._lock:
+            self._end = self._filled = 0
+
+
+def frame_levels(frames):
+    """Level in dBFS and zero-crossing rate of each row of a (n_frames, frame_len) array."""
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    db = 20 * np.log10(np.maximum(rms, 1e-10))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frames.shape[1]
+    return db, zcr
+
+
+def is_speech(db, zcr, floor_db, margin_db=VAD_MARGIN_DB):
+    """Per-frame speech flags: loud enough, or a little quieter but noisy like a fricative."""
+    threshold = min(floor_db, NOISE_CEILING_DB) + margin_db
+    return (db > threshold) | ((db > threshold - margin_db / 2) & (zcr > FRICATIVE_ZCR))
+
+
+def _frames(audio, frame_len):
+    n = len(audio) // frame_len
+    return audio[:n * frame_len].reshape(n, frame_len)
+
+
+def speech_mask(audio, sample_rate=16000, margin_db=VAD_MARGIN_DB):
+    """Speech flags for each VAD_FRAME_MS frame of a whole recording."""
+    frame_len = int(sample_rate * VAD_FRAME_MS / 1000)
+    frames = _frames(audio, frame_len)
+    if len(frames) == 0:
+        return np.zeros(0, dtype=bool)
+    db, zcr = frame_levels(frames)
+    return is_speech(db, zcr, np.percentile(db, 10), margin_db)
+
+
+def trim_silence(audio, sample_rate=16000, pad_seconds=VAD_PAD_SECONDS, max_pause=VAD_MAX_PAUSE,
+                 margin_db=VAD_MARGIN_DB):
+    """
+    The speech in audio, keeping pad_seconds of context around it and cutting
+    longer pauses to max_pause. Returns a view when nothing inside needs
+    cutting, or None if there is no speech at all.
+    """
+    frame_len = int(sample_rate * VAD_FRAME_MS / 1000)
+    mask = speech_mask(audio, sample_rate, margin_db)
+    if not mask.any():
+        return None
+    frame_s = VAD_FRAME_MS / 1000
+    pad = int(np.ceil(pad_seconds / frame_s))
+    if pad:
+        mask = np.convolve(mask, np.ones(2 * pad + 1), mode="same") > 0
+    # Runs of kept frames, as [start, stop) frame indexes
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+    starts, stops = edges[::2], edges[1::2]
+    keep_gap = max(0, int(max_pause / frame_s) - 2 * pad)  # the padding on both sides counts towards it
+    segments = [[starts[0], stops[0]]]
+    for start, stop in zip(starts[1:], stops[1:]):
+        if start - segments[-1][1] <= keep_gap:
+            segments[-1][1] = stop
+        else:
+            segments[-1][1] += keep_gap  # keep the start of a long pause
+            segments.append([start, stop])
+    if stops[-1] == len(mask):
+        segments[-1][1] = None  # the samples after the last whole frame too
+    slices = [audio[a * frame_len:(b * frame_len if b is not None else None)] for a, b in segments]
+    return slices[0] if len(slices) == 1 else np.concatenate(slices)
+
+
+class VoiceActivityDetector:
+    """
+    Streaming end-of-utterance detection. feed() takes blocks as they arrive
+    and returns True once speech has started and then been followed by
+    silence_seconds of silence. The noise floor is estimated from the first
+    frames and follows the frames that aren't speech.
+    """
+
+    def __init__(self, sample_rate=16000, silence_seconds=VAD_SILENCE_SECONDS, margin_db=VAD_MARGIN_DB,
+                 min_speech_seconds=0.15):
+        self.frame_len = int(sample_rate * VAD_FRAME_MS / 1000)
+        self.margin_db = margin_db
+        self.silence_frames = max(1, int(silence_seconds * 1000 / VAD_FRAME_MS))
+        self.min_speech_frames = max(1, int(min_speech_seconds * 1000 / VAD_FRAME_MS))
+        self.floor_db = None
+        self.speech_start = None  # sample offset where speech began
+        self.done = False
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._seen = 0            # samples consumed into whole frames
+        self._speech_run = 0
+        self._silence_run = 0
+
+    @property
+    def speaking(self):
+        return self.speech_start is not None
+
+    def feed(self, block):
+        samples = block[:, 0] if block.ndim == 2 else block
+        if len(self._pending):
+            samples = np.concatenate((self._pending, samples))
+        frames = _frames(samples, self.frame_len)
+        self._pending = samples[len(frames) * self.frame_len:].copy()
+        if self.done or len(frames) == 0:
+            self._seen += len(frames) * self.frame_len
+            return self.done
+        db, zcr = frame_levels(frames)
+        if self.floor_db is None:
+            self.floor_db = float(db.min())
+        speech = is_speech(db, zcr, self.floor_db, self.margin_db)
+        for i, voiced in enumerate(speech):
+            if voiced:
+                self._speech_run += 1
+                self._silence_run = 0
+                if not self.speaking and self._speech_run >= self.min_speech_frames:
+                    self.speech_start = self._seen + (i + 1 - self._speech_run) * self.frame_len
+            else:
+                self.floor_db = 0.95 * self.floor_db + 0.05 * float(db[i])
+                self._speech_run = 0
+                self._silence_run += 1
+                if self.speaking and self._silence_run >= self.silence_frames:
+                    self.done = True
+                    break
+        self._seen += len(frames) * self.frame_len
+        return self.done
+
+
+def save_wav(path, audio, sample_rate):
+    """Write float32 samples as a 16-bit PCM WAV, e.g. to keep a take for debugging."""
+    import soundfile as sf
+
+    sf.write(path, audio, sample_rate, subtype='PCM_16')  # soundfile clips and scales to int16
+
+
+def record_until_enter(sample_rate=16000, channels=1, debug_wav=AUDIO_DEBUG_WAV, buffer=None):
     """
     CLI-friendly: Press ENTER to start recording, press ENTER again to stop.
-    Returns: path to a WAV file (16-bit PCM) saved to a temp file.
+    Returns: mono float32 samples, ready for transcribe_audio1(), or None.
     """
+    import sounddevice as sd
+
     print("\nPress ENTER to start recording (or Ctrl+C to cancel)...")
     try:
         input()
@@ -37,97 +281,289 @@ def record_press_enter1(sample_rate=16000, channels=1):
         print("Recording cancelled by user.")
         return None
 
-    q = queue.Queue()
-    stop_event = threading.Event()
-    worker = threading.Thread(target=_record_worker, args=(q, sample_rate, channels, stop_event), daemon=True)
-    worker.start()
+    buffer = buffer if buffer is not None else AudioRingBuffer(sample_rate)
+    buffer.clear()
+
+    def callback(indata, frames, time_info, status):
+        # PortAudio reuses indata, so it is copied into the buffer right away
+        buffer.write(indata)
 
-    print("Recording... Press ENTER again to stop.")
-    frames = []
     try:
-        # Wait for Enter to stop recording
-        input()
-        # signal the worker to stop and give it a tiny moment
-        stop_event.set()
-        time.sleep(0.05)
-    except KeyboardInterrupt:
-        print("Interrupted by user while recording.")
-        stop_event.set()
-
-    # Drain queue
-    while not q.empty():
-        item = q.get()
-        if isinstance(item, tuple) and item[0] == "__ERROR__":
-            print("Audio device error:", item[1])
-            return None
-        frames.append(item)
-
-    # concatenate frames
-    if frames:
-        audio = np.concatenate(frames, axis=0)
-    else:
-        audio = np.zeros((0, channels), dtype=np.float32)
-
-    # Convert float32 [-1,1] -> int16
-    # If audio is empty, create a 0.1s silent buffer to avoid empty-file issues
-    if audio.shape[0] == 0:
-        audio = np.zeros((int(0.1 * sample_rate), channels), dtype=np.float32)
-
-    int16_audio = (audio * 32767).astype('int16')
-
-    # write to temp WAV file
+        with sd.InputStream(samplerate=sample_rate, channels=channels, dtype='float32', callback=callback):
+            print("Recording... Press ENTER again to stop.")
+            try:
+                input()
+            except KeyboardInterrupt:
+                print("Interrupted by user while recording.")
+    except Exception as e:
+        print("Audio device error:", e)
+        return None
+
+    audio = buffer.get()
+    if len(audio) == 0:
+        # A 0.1s silent buffer avoids empty-input issues downstream
+        audio = np.zeros(int(0.1 * sample_rate), dtype=np.float32)
+    print(f"Recorded {len(audio) / sample_rate:.1f}s of audio")
+    if debug_wav:
+        save_wav(debug_wav, audio, sample_rate)
+        print("Recording saved to:", debug_wav)
+    return audio
+
+
+def record_until_silence(sample_rate=16000, channels=1, debug_wav=AUDIO_DEBUG_WAV, buffer=None,
+                         silence_seconds=VAD_SILENCE_SECONDS, start_timeout=10.0, max_seconds=60.0):
+    """
+    CLI-friendly: starts listening at once, records from the first speech and
+    stops after silence_seconds of silence (or Ctrl+C, or max_seconds).
+    Returns: mono float32 samples with silence trimmed, or None if no speech
+    was heard within start_timeout seconds.
+    """
+    import sounddevice as sd
+
+    buffer = buffer if buffer is not None else AudioRingBuffer(sample_rate)
+    buffer.clear()
+    vad = VoiceActivityDetector(sample_rate, silence_seconds)
+    finished = threading.Event()
+
+    def callback(indata, frames, time_info, status):
+        buffer.write(indata)
+        if vad.feed(indata):
+            finished.set()
+
+    print("\nListening... start speaking (Ctrl+C to cancel).")
+    started = time.monotonic()
+    try:
+        with sd.InputStream(samplerate=sample_rate, channels=channels, dtype='float32', callback=callback):
+            try:
+                while not finished.wait(0.05):
+                    elapsed = time.monotonic() - started
+                    if not vad.speaking and elapsed > start_timeout:
+                        print("No speech detected.")
+                        return None
+                    if elapsed > max_seconds:
+                        print("Maximum recording length reached.")
+                        break
+            except KeyboardInterrupt:
+                if not vad.speaking:
+                    print("Recording cancelled by user.")
+                    return None
+                print("Stopped by user.")
+    except Exception as e:
+        print("Audio device error:", e)
+        return None
+
+    audio = buffer.get()
+    if debug_wav:
+        save_wav(debug_wav, audio, sample_rate)
+        print("Recording saved to:", debug_wav)
+    speech = trim_silence(audio, sample_rate)
+    if speech is None:
+        print("No speech detected.")
+        return None
+    print(f"Recorded {len(audio) / sample_rate:.1f}s of audio, {len(speech) / sample_rate:.1f}s of speech")
+    return speech
+
+
+def record_press_enter1(sample_rate=16000, channels=1):
+    """
+    Like record_until_enter(), but saves the take to a temp WAV file and
+    returns its path, for callers that want a file.
+    """
+    audio = record_until_enter(sample_rate, channels, debug_wav=None)
+    if audio is None:
+        return None
     tmpf = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
+    tmpf.close()
     try:
-        sf.write(tmpf.name, int16_audio, sample_rate, subtype='PCM_16')
+        save_wav(tmpf.name, audio, sample_rate)
     except Exception as e:
         print("Failed to write WAV file:", e)
         try:
-            tmpf.close()
             os.unlink(tmpf.name)
-        except:
+        except OSError:
             pass
         return None
-
     print("Recording saved to:", tmpf.name)
     return tmpf.name
 
 
-# Keep your transcribe helper (copied and slightly hardened)
-def transcribe_audio1(audio_path, model, expected_sample_rate=16000):
+def transcribe_audio1(audio, model, expected_sample_rate=16000, trim=True):
     """
-    Transcribe using Whisper model instance (same behaviour as your original utils).
+    Transcribe with a Whisper model instance. audio is float32 samples at
+    expected_sample_rate (from record_until_enter) or the path of an audio
+    file, which is deleted afterwards. With trim on, silence is cut first and
+    a recording without speech isn't sent to Whisper at all.
     Returns: (text, full_result_dict)
     """
-    import soundfile as sf_local
-    audio_array = None
-    res = {}
-    try:
-        data, sr = sf_local.read(audio_path, dtype='float32')
-        # Ensure mono
-        if hasattr(data, 'ndim') and data.ndim == 2:
-            data = data[:, 0]
-        audio_array = data
-        if sr != expected_sample_rate:
-            print(f"Warning: sample rate {sr} != {expected_sample_rate}. Proceeding without resample.")
-    except Exception as e:
-        print("Failed to load audio with soundfile, falling back to path for Whisper:", e)
+    audio_path = None
+    if isinstance(audio, (str, os.PathLike)):
+        audio_path, audio = audio, _read_audio_file(audio, expected_sample_rate)
+
+    if trim and audio is not None:
+        speech = trim_silence(audio, expected_sample_rate)
+        if speech is None:
+            print("No speech detected; skipping transcription.")
+            _remove(audio_path)
+            return "", {}
+        audio = speech
 
+    start = time.perf_counter()
     try:
-        if audio_array is not None:
-            res = model.transcribe(audio_array, task="transcribe", language="en")
-        else:
-            res = model.transcribe(audio_path, task="transcribe", language="en")
+        res = model.transcribe(audio if audio is not None else audio_path, task="transcribe", language="en")
     except Exception as e:
         print("Whisper transcription failed:", e)
         return "", {}
 
     text = res.get("text", "").strip()
-    print(f"Transcription: {text}")
+    print(f"Transcription ({time.perf_counter() - start:.2f}s): {text}")
 
     # Clean up temp file where appropriate
-    try:
-        os.remove(audio_path)
-    except Exception:
-        pass
+    _remove(audio_path)
+    return text, res
+
 
+def transcribe_streaming(model, sample_rate=16000, record=None, buffer=None, **record_kwargs):
+    """
+    Record one utterance with record (record_until_silence, or
+    record_until_enter with AUDIO_VAD=0) and transcribe it while it is being
+    spoken. model may also be a function returning the model, which is then
+    first called on the background thread, so a model still loading doesn't
+    hold up the recording. buffer, if given, must not have max_seconds set.
+    Only the work left after recording stops counts as the "transcribe" stage.
+    Returns: (text, full_result_dict)
+    """
+    record = record or (record_until_silence if AUDIO_VAD else record_until_enter)
+    buffer = buffer if buffer is not None else AudioRingBuffer(sample_rate, max_seconds=None)
+    buffer.clear()
+    streamer = StreamingTranscriber(model, buffer, sample_rate).start()
+    try:
+        audio = record(sample_rate, buffer=buffer, **record_kwargs)
+    except BaseException:
+        streamer.cancel()
+        raise
+    if audio is None:
+        streamer.cancel()
+        return "", {}
+    start = time.perf_counter()
+    with span("transcribe"):
+        text, res = streamer.finish()
+    print(f"Transcription ({time.perf_counter() - start:.2f}s after recording, {res['passes']} passes): {text}")
     return text, res
+
+
+class StreamingTranscriber:
+    """
+    Transcribes a recording buffer (an AudioRingBuffer without max_seconds,
+    so sample offsets stay put) on a background thread while it fills.
+
+        streamer = StreamingTranscriber(model, buffer).start()
+        ...record into buffer...
+        text, result = streamer.finish()
+
+    Each pass transcribes the next chunk_seconds after the committed offset
+    and commits the segments that end before its last overlap_seconds.
+    Chunks without speech are committed without calling Whisper. finish()
+    waits for the pass in flight, then transcribes what is left.
+    """
+
+    def __init__(self, model, buffer, sample_rate=16000, chunk_seconds=STREAM_CHUNK_SECONDS,
+                 overlap_seconds=STREAM_OVERLAP_SECONDS):
+        self.model = model
+        self.buffer = buffer
+        self.sample_rate = sample_rate
+        self.chunk = int(chunk_seconds * sample_rate)
+        self.overlap = min(int(overlap_seconds * sample_rate), self.chunk // 2)
+        if buffer.max_samples:
+            raise ValueError("StreamingTranscriber needs a buffer without max_seconds")
+        self.committed = 0     # samples transcribed for good
+        self.segments = []     # committed Whisper segments, times relative to the recording
+        self.passes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def text(self):
+        return "".join(segment["text"] for segment in self.segments).strip()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="whisper-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            audio = self.buffer.get()
+            if len(audio) - self.committed < self.chunk:
+                self._stop.wait(0.05)
+                continue
+            try:
+                self._commit(audio[self.committed:self.committed + self.chunk], final=False)
+            except Exception as e:
+                print("Streaming transcription failed; the rest will be transcribed at the end:", e)
+                return
+
+    def _commit(self, audio, final):
+        """Transcribe audio (starting at the committed offset) and commit what is settled."""
+        self.passes += 1
+        if trim_silence(audio, self.sample_rate) is None:
+            self.committed += len(audio) if final else len(audio) - self.overlap
+            return
+        # A Whisper model is a torch Module and so callable itself; tell them apart by transcribe()
+        model = self.model if hasattr(self.model, "transcribe") else self.model()
+        res = model.transcribe(audio, task="transcribe", language="en",
+                               initial_prompt=self.text[-PROMPT_CHARS:] or None)
+        segments = res.get("segments") or [{"start": 0.0, "end": len(audio) / self.sample_rate,
+                                            "text": res.get("text", "")}]
+        if not final:
+            settled = (len(audio) - self.overlap) / self.sample_rate
+            done = [segment for segment in segments if segment["end"] <= settled]
+            # A single segment running into the overlap is committed anyway, so each pass makes progress
+            segments = done or segments[:-1] or segments
+        offset = self.committed / self.sample_rate
+        for segment in segments:
+            self.segments.append({**segment, "start": segment["start"] + offset, "end": segment["end"] + offset})
+        end = min(int(segments[-1]["end"] * self.sample_rate), len(audio)) if segments else 0
+        self.committed += len(audio) if final or end <= 0 else end
+
+    def cancel(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def finish(self, trim=True):
+        """Stop streaming and transcribe the tail. Returns: (text, result_dict)"""
+        self.cancel()
+        tail = self.buffer.get()[self.committed:]
+        if trim:
+            tail = trim_silence(tail, self.sample_rate)
+        if tail is not None and len(tail):
+            try:
+                self._commit(tail, final=True)
+            except Exception as e:
+                print("Whisper transcription failed:", e)
+        text = self.text
+        return text, {"text": text, "segments": self.segments, "passes": self.passes}
+
+
+def _remove(audio_path):
+    if audio_path is not None:
+        try:
+            os.remove(audio_path)
+        except Exception:
+            pass
+
+
+def _read_audio_file(audio_path, expected_sample_rate):
+    """Mono float32 samples from a file, or None to let Whisper read the path itself."""
+    try:
+        import soundfile as sf
+
+        data, sr = sf.read(audio_path, dtype='float32')
+    except Exception as e:
+        print("Failed to load audio with soundfile, falling back to path for Whisper:", e)
+        return None
+    if data.ndim == 2:
+        data = data[:, 0]
+    if sr != expected_sample_rate:
+        print(f"Warning: sample rate {sr} != {expected_sample_rate}. Proceeding without resample.")
+    return data
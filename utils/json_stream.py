@@ -0,0 +1,92 @@
+# utils/json_stream.py
+"""
+Incremental extraction of one string field from JSON that is still arriving,
+shared by the Django stream views and the CLI tutor.
+
+The model answers with one JSON object, so the conversational reply arrives as
+a JSON string value spread over many completion chunks. JSONFieldStreamer pulls
+the decoded text of that one field out of the raw stream as it arrives, so the
+reply can be shown (or spoken) before the closing brace has been generated.
+"""
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class JSONFieldStreamer:
+    """
+    Feed raw JSON text chunk by chunk; feed() returns the newly decoded part
+    of the string value stored under `field` (empty string if none yet).
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self.text = ""            # everything fed so far, for the final json parse
+        self.value = ""           # decoded value of `field` so far
+        self.done = False         # the value's closing quote has been read
+        self._in_string = False
+        self._capturing = False
+        self._escape = False
+        self._unicode = None      # hex digits of a pending \uXXXX escape
+        self._high_surrogate = None
+        self._current = []        # chars of the string being read (keys only)
+        self._last_string = None
+        self._value_key = None    # key whose value comes next
+
+    def feed(self, chunk):
+        self.text += chunk
+        out = []
+        for ch in chunk:
+            if self._in_string:
+                decoded = self._read_string_char(ch)
+                if decoded is None:
+                    continue
+                if self._capturing:
+                    out.append(decoded)
+                else:
+                    self._current.append(decoded)
+            elif ch == '"':
+                self._in_string = True
+                self._capturing = self._value_key == self.field
+                self._current = []
+            elif ch == ':':
+                self._value_key = self._last_string
+            elif ch in ',{}[':
+                self._value_key = None
+        delta = "".join(out)
+        self.value += delta
+        return delta
+
+    def _read_string_char(self, ch):
+        """Return the decoded character, '' for nothing to emit, or None at the closing quote."""
+        if self._unicode is not None:
+            self._unicode += ch
+            if len(self._unicode) < 4:
+                return ""
+            code = int(self._unicode, 16)
+            self._unicode = None
+            if 0xD800 <= code < 0xDC00:
+                self._high_surrogate = code
+                return ""
+            if 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+                code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+            self._high_surrogate = None
+            return chr(code)
+        if self._escape:
+            self._escape = False
+            if ch == 'u':
+                self._unicode = ""
+                return ""
+            return _ESCAPES.get(ch, ch)
+        if ch == '\\':
+            self._escape = True
+            return ""
+        if ch == '"':
+            self._in_string = False
+            if self._capturing:
+                self._capturing = False
+                self._value_key = None
+                self.done = True
+            else:
+                self._last_string = "".join(self._current)
+            return None
+        return ch
@@ -0,0 +1,258 @@
+# utils/llm_client.py
+"""
+Process-wide LLM clients shared by the Django views and the CLI tutor.
+
+Building a new OpenAI(...) client per message means a fresh connection pool and
+a new TLS handshake every time. Instead we keep one client per (api_key, base_url)
+for the life of the process, backed by a keep-alive HTTP pool, and count how
+many requests reused a pooled connection versus opened a new one.
+measure_llm_time() adds up the time spent waiting on the provider within a block,
+e.g. one web request.
+get_async_client() does the same for async views; its pool is tied to the
+running event loop, so there is one async client per loop.
+
+Tuning is done through environment variables:
+    GROQ_BASE_URL          provider endpoint (default: Groq's OpenAI-compatible API)
+    LLM_POOL_SIZE          max open connections per client (default 20)
+    LLM_KEEPALIVE          max idle connections kept warm (default 10)
+    LLM_KEEPALIVE_EXPIRY   seconds an idle connection stays in the pool (default 60)
+    LLM_CONNECT_TIMEOUT    seconds to establish a connection (default 5)
+    LLM_READ_TIMEOUT       seconds to wait for the completion (default 30)
+    LLM_MAX_RETRIES        SDK-level retries (default 2)
+"""
+import asyncio
+import atexit
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI, DefaultHttpxClient
+
+try:
+    import httpx
+except ImportError:  # newer openai releases are built on the httpx2 fork
+    import httpx2 as httpx
+
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "20"))
+LLM_KEEPALIVE = int(os.environ.get("LLM_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+
+# httpcore emits one of these trace events only when it has to open a socket
+_NEW_CONNECTION_EVENTS = ("connection.connect_tcp.started", "connection.connect_unix_socket.started")
+
+
+class ConnectionStats:
+    """
+    Thread-safe counters: every HTTP request to the provider is recorded
+    either as a reused pooled connection or as a new connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.new_connections = 0
+            self.reused_connections = 0
+
+    def record(self, new_connection):
+        with self._lock:
+            self.requests += 1
+            if new_connection:
+                self.new_connections += 1
+            else:
+                self.reused_connections += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+            }
+
+
+connection_stats = ConnectionStats()
+
+# Set by measure_llm_time(); a mutable dict so the total survives sync_to_async/async_to_sync hops
+_llm_timer = contextvars.ContextVar("llm_timer", default=None)
+
+
+@contextlib.contextmanager
+def measure_llm_time():
+    """
+    Yield a dict whose 'seconds' is the time provider requests made inside the
+    block took to return their response headers. A streamed body still being read
+    after that isn't counted.
+    """
+    timer = {"seconds": 0.0, "requests": 0}
+    token = _llm_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _llm_timer.reset(token)
+
+
+def _on_request(request):
+    state = {"new_connection": False, "started": time.perf_counter(), "timer": _llm_timer.get()}
+
+    def trace(event_name, info):
+        if event_name in _NEW_CONNECTION_EVENTS:
+            state["new_connection"] = True
+
+    request.extensions["trace"] = trace
+    request.extensions["llm_connection_state"] = state
+
+
+def _on_response(response):
+    state = response.request.extensions.get("llm_connection_state")
+    if state is not None:
+        connection_stats.record(state["new_connection"])
+        if state["timer"] is not None:
+            state["timer"]["seconds"] += time.perf_counter() - state["started"]
+            state["timer"]["requests"] += 1
+
+
+async def _aon_request(request):
+    state = {"new_connection": False, "started": time.perf_counter(), "timer": _llm_timer.get()}
+
+    async def trace(event_name, info):
+        if event_name in _NEW_CONNECTION_EVENTS:
+            state["new_connection"] = True
+
+    request.extensions["trace"] = trace
+    request.extensions["llm_connection_state"] = state
+
+
+async def _aon_response(response):
+    _on_response(response)
+
+
+def _limits(pool_size, keepalive):
+    return httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=keepalive,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+
+
+def _build_http_client(pool_size, keepalive, timeout):
+    return DefaultHttpxClient(
+        limits=_limits(pool_size, keepalive),
+        timeout=timeout,
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+
+
+def _build_async_http_client(pool_size, keepalive, timeout):
+    return DefaultAsyncHttpxClient(
+        limits=_limits(pool_size, keepalive),
+        timeout=timeout,
+        event_hooks={"request": [_aon_request], "response": [_aon_response]},
+    )
+
+
+_clients = {}
+_async_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key, base_url=None, pool_size=LLM_POOL_SIZE,
+               keepalive=LLM_KEEPALIVE, connect_timeout=LLM_CONNECT_TIMEOUT,
+               read_timeout=LLM_READ_TIMEOUT, max_retries=None):
+    """
+    Return the shared OpenAI client for this api_key/base_url, creating it on first use.
+    Pool size and timeouts only apply when the client is first created.
+    max_retries (default LLM_MAX_RETRIES) is part of the key: pass 0 when the
+    caller does its own retrying (utils/resilience.py).
+    """
+    base_url = base_url or GROQ_BASE_URL
+    max_retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+    key = (api_key, base_url, max_retries)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=timeout,
+                max_retries=max_retries,
+                http_client=_build_http_client(pool_size, keepalive, timeout),
+            )
+            _clients[key] = client
+    return client
+
+
+def get_async_client(api_key, base_url=None, pool_size=LLM_POOL_SIZE,
+                     keepalive=LLM_KEEPALIVE, connect_timeout=LLM_CONNECT_TIMEOUT,
+                     read_timeout=LLM_READ_TIMEOUT, max_retries=None):
+    """
+    Async counterpart of get_client(). Must be called from a running event loop;
+    the client is shared by everything running on that loop.
+    """
+    base_url = base_url or GROQ_BASE_URL
+    max_retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+    key = (api_key, base_url, max_retries, asyncio.get_running_loop())
+    client = _async_clients.get(key)
+    if client is not None:
+        return client
+    timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+    client = AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=timeout,
+        max_retries=max_retries,
+        http_client=_build_async_http_client(pool_size, keepalive, timeout),
+    )
+    with _clients_lock:
+        # Forget clients whose loop is gone (e.g. async_to_sync under WSGI)
+        for stale in [stale for stale in _async_clients if stale[-1].is_closed()]:
+            del _async_clients[stale]
+        _async_clients[key] = client
+    return client
+
+
+async def ashutdown():
+    """Close the async clients that belong to the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        keys = [key for key in _async_clients if key[-1] is loop]
+        clients = [_async_clients.pop(key) for key in keys]
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"Error closing async LLM client: {e}")
+
+
+def shutdown():
+    """
+    Close every pooled client and its keep-alive connections.
+    Safe to call more than once; registered with atexit.
+    Async clients can only be closed from their own loop (see ashutdown),
+    so here they are just dropped.
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        _async_clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            print(f"Error closing LLM client: {e}")
+
+
+atexit.register(shutdown)
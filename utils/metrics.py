@@ -0,0 +1,233 @@
+# utils/metrics.py
+"""
+In-process timing spans, counters and latency histograms, shared by the Django
+views and the CLI tutor, rendered in the Prometheus text format.
+
+    with span("llm"):
+        response = client.chat.completions.create(...)
+    LLM_FAILURES.inc(call="full")
+
+Every span is observed into the tutor_stage_seconds histogram. Inside
+collect_timings() the spans are also listed per request (or per CLI turn), so
+the web app can send them back as a Server-Timing header. The collected list
+is shared with sync_to_async/async_to_sync hops through a context variable.
+
+Metrics live in process memory: with several worker processes each one
+reports its own numbers.
+"""
+import contextlib
+import contextvars
+import threading
+import time
+
+# Seconds; suits both sub-millisecond cache lookups and multi-second LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = (f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, seconds, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += seconds
+
+    def count(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            return sum(series[:-1]) if series else 0
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), series[:-1]):
+                    cumulative += count
+                    labels = _label_text((*self.labelnames, "le"), (*key, bound))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _label_text(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    The metrics of one process. Collectors are callables returning
+    (name, type, help, value) tuples for numbers kept elsewhere, e.g. the LLM
+    client's connection counters; they are read at render time.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def reset(self):
+        for metric in self._metrics:
+            metric.reset()
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help_text, value in collector():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {_format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "tutor_stage_seconds", "Time spent in each stage of handling a message.", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "tutor_request_seconds", "Time to produce a response, by view.", ["view"])
+PROMPT_TOKENS = REGISTRY.histogram(
+    "tutor_prompt_tokens", "Estimated size of the prompts sent to the LLM, in tokens.", ["prompt"],
+    buckets=(64, 128, 256, 512, 768, 1024, 1536, 2048, 4096))
+CACHE_LOOKUPS = REGISTRY.counter(
+    "tutor_cache_lookups_total", "Correction and history cache lookups.", ["cache", "result"])
+FAST_PATH_HITS = REGISTRY.counter(
+    "tutor_fast_path_total", "Messages whose grammar was checked by the local rules.")
+LLM_FAILURES = REGISTRY.counter(
+    "tutor_llm_failures_total", "LLM calls that failed with an error.", ["call"])
+LLM_RETRIES = REGISTRY.counter(
+    "tutor_llm_retries_total", "LLM attempts retried after a transient failure.")
+LLM_HEDGES = REGISTRY.counter(
+    "tutor_llm_hedged_requests_total", "Second LLM requests started because the first was slow.")
+CIRCUIT_REJECTIONS = REGISTRY.counter(
+    "tutor_llm_circuit_rejections_total", "LLM calls refused because the circuit breaker was open.")
+PARSE_FAILURES = REGISTRY.counter(
+    "tutor_llm_parse_failures_total", "Completions whose JSON analysis could not be decoded.", ["model"])
+FALLBACK_RESPONSES = REGISTRY.counter(
+    "tutor_fallback_responses_total", "Replies that fell back to the canned response.")
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    "tutor_admission_rejections_total", "Messages turned away with a 429, by reason.", ["reason"])
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "tutor_admission_wait_seconds", "Time messages spent queued for an LLM slot.")
+WRITE_BEHIND_DROPS = REGISTRY.counter(
+    "tutor_write_behind_dropped_total", "Queued ChatMessage rows that could not be saved.")
+IDEMPOTENT_REPLAYS = REGISTRY.counter(
+    "tutor_idempotent_replays_total", "Repeated messages answered from an earlier or in-flight request.")
+
+_timings = contextvars.ContextVar("metrics_timings", default=None)
+
+
+@contextlib.contextmanager
+def collect_timings():
+    """Yield a list that gets a (stage, seconds) entry for each span finished inside the block."""
+    timings = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextlib.contextmanager
+def span(stage):
+    """Time the block as one pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((stage, seconds))
+
+
+def server_timing(timings, total=None):
+    """Server-Timing header value; repeated stages are summed, durations in ms."""
+    merged = {}
+    for stage, seconds in timings:
+        merged[stage] = merged.get(stage, 0.0) + seconds
+    if total is not None:
+        merged["total"] = total
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in merged.items())
+
+
+def format_timings(timings):
+    """One-line summary for console output, e.g. 'history 0.4ms, llm 812.0ms'."""
+    return ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in timings)
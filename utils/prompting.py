@@ -0,0 +1,80 @@
+# utils/prompting.py
+"""
+Token-budgeted prompt assembly shared by the Django views and the CLI tutor.
+
+The system prompt (instructions plus few-shot examples) is fixed when the
+PromptBuilder is created, normally at import, and the same system message is
+sent byte-for-byte on every call so provider-side prompt caching can match the
+prefix. Per request, the learner's text is clipped to max_user_tokens and
+history turns are added newest-first until the token budget is used up.
+
+Token counts come from tiktoken when it is installed, and from a
+characters-per-token estimate otherwise. Neither is exactly the provider's
+Llama tokenizer, so keep some headroom in the budget.
+"""
+import math
+from collections import namedtuple
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # not installed, or no encoding data available offline
+    _ENCODING = None
+
+CHARS_PER_TOKEN = 4
+# Chat formatting adds a few tokens per message (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+Prompt = namedtuple("Prompt", ["messages", "prompt_tokens", "history_turns"])
+
+
+def count_tokens(text):
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def clip_to_tokens(text, max_tokens):
+    """Cut text down to roughly max_tokens tokens."""
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text)
+        return text if len(tokens) <= max_tokens else _ENCODING.decode(tokens[:max_tokens])
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+class PromptBuilder:
+    """
+    Builds [system, *history, user] message lists within a token budget.
+
+    user_template is formatted with text=<learner's message>; history turns
+    are (user_message, assistant_message) pairs, oldest first.
+    """
+
+    def __init__(self, system_prompt, user_template="{text}", token_budget=2000, max_user_tokens=300):
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.user_template = user_template
+        self.token_budget = token_budget
+        self.max_user_tokens = max_user_tokens
+        self.prefix_tokens = count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        self.template_tokens = count_tokens(user_template.format(text="")) + MESSAGE_OVERHEAD_TOKENS
+
+    def build(self, user_text, history_turns=()):
+        user_text = clip_to_tokens(user_text, self.max_user_tokens)
+        user_message = {"role": "user", "content": self.user_template.format(text=user_text)}
+        used = self.prefix_tokens + self.template_tokens + count_tokens(user_text)
+
+        kept = []
+        for past_message, past_response in reversed(list(history_turns)):
+            turn_tokens = count_tokens(past_message) + count_tokens(past_response) + 2 * MESSAGE_OVERHEAD_TOKENS
+            if used + turn_tokens > self.token_budget:
+                break
+            used += turn_tokens
+            kept.append((past_message, past_response))
+        kept.reverse()
+
+        messages = [self.system_message]
+        for past_message, past_response in kept:
+            messages.append({"role": "user", "content": past_message})
+            messages.append({"role": "assistant", "content": past_response})
+        messages.append(user_message)
+        return Prompt(messages, used, len(kept))
@@ -0,0 +1,371 @@
+# utils/resilience.py
+"""
+Deadline, retries, hedging and a circuit breaker around LLM calls, shared by
+the Django views and the CLI tutor.
+
+    response = get_policy().call(lambda timeout: client.chat.completions.create(..., timeout=timeout))
+
+A call gets one overall deadline. Each attempt is given whatever time is
+left as its HTTP timeout, so the SDK's own retries should be turned off
+(get_client(..., max_retries=0)). Transient failures (connection errors,
+timeouts, 429 and 5xx) are retried after a jittered backoff while the
+deadline allows. With hedging on, an attempt still running after the
+recent p95 latency gets a second copy started next to it, and whichever
+answers first wins.
+
+Every transient failure counts towards the circuit breaker. After
+LLM_BREAKER_THRESHOLD failures in a row it opens, and calls fail at once
+with CircuitOpenError instead of tying up a worker until the deadline.
+After LLM_BREAKER_RESET seconds one trial call is let through (half-open):
+success closes the breaker, failure opens it again.
+
+Tuning is done through environment variables:
+    LLM_DEADLINE            seconds for the whole call, retries included (default 10)
+    LLM_ATTEMPTS            attempts per call (default 2)
+    LLM_BACKOFF             base retry backoff in seconds, jittered and doubled per retry (default 0.25)
+    LLM_BREAKER_THRESHOLD   consecutive failures that open the breaker (default 5)
+    LLM_BREAKER_RESET       seconds the breaker stays open (default 30)
+    LLM_HEDGE               1 to enable hedged requests (default 0)
+    LLM_HEDGE_MIN_DELAY     never hedge sooner than this, in seconds (default 0.5)
+"""
+import asyncio
+import collections
+import concurrent.futures
+import contextvars
+import os
+import random
+import threading
+import time
+
+import openai
+
+from .metrics import CIRCUIT_REJECTIONS, LLM_HEDGES, LLM_RETRIES, REGISTRY
+
+LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE", "10"))
+LLM_ATTEMPTS = int(os.environ.get("LLM_ATTEMPTS", "2"))
+LLM_BACKOFF = float(os.environ.get("LLM_BACKOFF", "0.25"))
+LLM_BREAKER_THRESHOLD = int(os.environ.get("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.environ.get("LLM_BREAKER_RESET", "30"))
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", "0.5"))
+
+# Fewer samples than this and the p95 isn't trusted for hedging
+HEDGE_MIN_SAMPLES = 20
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def is_transient(error):
+    """Worth retrying, and a sign the provider is unhealthy."""
+    if isinstance(error, (openai.APIConnectionError, DeadlineExceeded, TimeoutError)):
+        return True  # APITimeoutError is an APIConnectionError
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def allow(self):
+        """
+        Whether a call may go ahead; in half-open state only one trial at a
+        time, and HALF_OPEN (also truthy) is returned to the caller running it.
+        """
+        with self._lock:
+            state = self._state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return HALF_OPEN
+            return False
+
+    def abandon_trial(self):
+        """The trial call ended without a result (e.g. it was cancelled): let another one try."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def reset(self):
+        self.record_success()
+
+
+class LatencyWindow:
+    """The last `size` successful attempt durations, for the hedge delay."""
+
+    def __init__(self, size=200):
+        self._lock = threading.Lock()
+        self._samples = collections.deque(maxlen=size)
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+# Hedged sync attempts run here so the caller can wait on whichever finishes first
+_hedge_pool = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+def _close_abandoned(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    close = getattr(future.result(), "close", None)  # e.g. a stream nobody will read
+    if callable(close):
+        close()
+
+
+class ResiliencePolicy:
+    def __init__(self, deadline=LLM_DEADLINE, attempts=LLM_ATTEMPTS, backoff=LLM_BACKOFF,
+                 failure_threshold=LLM_BREAKER_THRESHOLD, reset_timeout=LLM_BREAKER_RESET,
+                 hedge=LLM_HEDGE, hedge_min_delay=LLM_HEDGE_MIN_DELAY, hedge_percentile=95):
+        self.deadline = deadline
+        self.attempts = attempts
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_percentile = hedge_percentile
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = LatencyWindow()
+
+    def reset(self):
+        self.breaker.reset()
+        self.latency.reset()
+
+    def _hedge_delay(self, hedge):
+        if not (self.hedge and hedge):
+            return None
+        p95 = self.latency.percentile(self.hedge_percentile)
+        return None if p95 is None else max(self.hedge_min_delay, p95)
+
+    def _backoff(self, retry, remaining):
+        return min(remaining, random.uniform(0, self.backoff * 2 ** retry))
+
+    def _finish_attempt(self, error):
+        """Update the breaker; True if the error may be retried."""
+        if error is None or not is_transient(error):
+            self.breaker.record_success()  # the provider answered, even if with a 4xx
+            return False
+        self.breaker.record_failure()
+        return True
+
+    def call(self, attempt, hedge=True):
+        """
+        Run attempt(timeout) under the deadline, retry and breaker rules and
+        return its result. hedge=False for calls that can't be duplicated,
+        e.g. streams.
+        """
+        admitted = self.breaker.allow()
+        if not admitted:
+            CIRCUIT_REJECTIONS.inc()
+            raise CircuitOpenError("LLM circuit breaker is open")
+        deadline = time.monotonic() + self.deadline
+        try:
+            for retry in range(self.attempts):
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        raise DeadlineExceeded(f"no time left for attempt {retry + 1}")
+                    result = self._run(attempt, remaining, self._hedge_delay(hedge))
+                except Exception as e:
+                    admitted = None  # the breaker has the result
+                    if not self._finish_attempt(e):
+                        raise
+                    remaining = deadline - time.monotonic()
+                    if retry + 1 >= self.attempts or remaining <= 0:
+                        raise
+                    admitted = self.breaker.allow()
+                    if not admitted:
+                        raise
+                    LLM_RETRIES.inc()
+                    time.sleep(self._backoff(retry, remaining))
+                    continue
+                admitted = None
+                self._finish_attempt(None)
+                return result
+        finally:
+            if admitted == HALF_OPEN:
+                # Left without a result (KeyboardInterrupt, GeneratorExit...): don't hold the trial slot
+                self.breaker.abandon_trial()
+
+    def _timed(self, attempt, timeout):
+        start = time.perf_counter()
+        result = attempt(timeout)
+        self.latency.add(time.perf_counter() - start)
+        return result
+
+    def _run(self, attempt, timeout, hedge_delay):
+        if hedge_delay is None or hedge_delay >= timeout:
+            return self._timed(attempt, timeout)
+        started = time.monotonic()
+        # Each attempt gets its own copy of the context (metrics timers etc.)
+        futures = [_hedge_pool.submit(contextvars.copy_context().run, self._timed, attempt, timeout)]
+        done, _ = concurrent.futures.wait(futures, timeout=hedge_delay)
+        if not done:
+            LLM_HEDGES.inc()
+            futures.append(_hedge_pool.submit(contextvars.copy_context().run, self._timed, attempt,
+                                              timeout - (time.monotonic() - started)))
+        error = None
+        winner = None
+        try:
+            # The deadline counts from the first attempt, not from the hedge
+            for future in concurrent.futures.as_completed(futures, timeout=timeout - (time.monotonic() - started)):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                winner = future
+                return result
+        except concurrent.futures.TimeoutError:
+            raise DeadlineExceeded("LLM call deadline exceeded")
+        finally:
+            # A running thread can't be stopped: drop the slower copy, and close what it returns
+            for future in futures:
+                if future is not winner and not future.cancel():
+                    future.add_done_callback(_close_abandoned)
+        raise error
+
+    async def acall(self, attempt, hedge=True):
+        """Async version of call(); attempt(timeout) is a coroutine function."""
+        admitted = self.breaker.allow()
+        if not admitted:
+            CIRCUIT_REJECTIONS.inc()
+            raise CircuitOpenError("LLM circuit breaker is open")
+        deadline = time.monotonic() + self.deadline
+        try:
+            for retry in range(self.attempts):
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        raise DeadlineExceeded(f"no time left for attempt {retry + 1}")
+                    result = await self._arun(attempt, remaining, self._hedge_delay(hedge))
+                except Exception as e:
+                    admitted = None  # the breaker has the result
+                    if not self._finish_attempt(e):
+                        raise
+                    remaining = deadline - time.monotonic()
+                    if retry + 1 >= self.attempts or remaining <= 0:
+                        raise
+                    admitted = self.breaker.allow()
+                    if not admitted:
+                        raise
+                    LLM_RETRIES.inc()
+                    await asyncio.sleep(self._backoff(retry, remaining))
+                    continue
+                admitted = None
+                self._finish_attempt(None)
+                return result
+        finally:
+            if admitted == HALF_OPEN:
+                # Cancelled (e.g. the ASGI client went away) without a result: don't hold the trial slot
+                self.breaker.abandon_trial()
+
+    async def _atimed(self, attempt, timeout):
+        start = time.perf_counter()
+        result = await asyncio.wait_for(attempt(timeout), timeout)
+        self.latency.add(time.perf_counter() - start)
+        return result
+
+    async def _arun(self, attempt, timeout, hedge_delay):
+        if hedge_delay is None or hedge_delay >= timeout:
+            return await self._atimed(attempt, timeout)
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(self._atimed(attempt, timeout))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                LLM_HEDGES.inc()
+                tasks.append(asyncio.ensure_future(
+                    self._atimed(attempt, timeout - (time.monotonic() - started))))
+            error = None
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    return await next_done
+                except Exception as e:
+                    error = e
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()  # the slower copy isn't needed any more
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_policy():
+    """The process-wide policy for LLM calls, configured from the environment."""
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = ResiliencePolicy()
+    return _policy
+
+
+def reset_policy():
+    global _policy
+    with _policy_lock:
+        _policy = None
+
+
+def _breaker_metrics():
+    policy = _policy
+    state = policy.breaker.state if policy is not None else CLOSED
+    return [
+        ("tutor_llm_circuit_state", "gauge", "LLM circuit breaker state: 0 closed, 1 half-open, 2 open.",
+         {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[state]),
+    ]
+
+
+REGISTRY.add_collector(_breaker_metrics)
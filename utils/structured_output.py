@@ -0,0 +1,179 @@
+# utils/structured_output.py
+"""
+Getting the tutor's JSON analysis out of a completion reliably.
+
+Three layers, shared by the Django views and the CLI tutor:
+  - json_completion()/ajson_completion() ask the provider for JSON mode
+    (response_format={"type": "json_object"}). A model that rejects it is
+    remembered and called without it from then on.
+  - extract_json_object() finds the first balanced {...} object in one scan,
+    so code fences, a sentence before the JSON or text after it don't matter.
+  - validate_tutor_response() checks the four fields and fills in the ones
+    that can be defaulted. Only a missing conversational_response or a wrong
+    type makes the output unusable.
+
+Anything unusable raises ResponseFormatError. salvage_reply() recovers plain
+prose, for when the model ignored the format and just answered. When the
+provider itself rejects a JSON-mode generation as invalid (Groq's
+json_validate_failed), the json_completion helpers raise FailedGeneration
+carrying the text the model produced, so the paid-for output can still go
+through the tolerant parser.
+"""
+import json
+import threading
+
+import openai
+
+JSON_MODE = {"type": "json_object"}
+
+
+class ResponseFormatError(ValueError):
+    pass
+
+
+class FailedGeneration(ResponseFormatError):
+    def __init__(self, content):
+        super().__init__("provider rejected the JSON-mode output")
+        self.content = content
+
+
+def _failed_generation(error):
+    # The SDK unwraps the provider's {"error": {...}} into error.body
+    body = error.body if isinstance(error.body, dict) else {}
+    if body.get("code") == "json_validate_failed":
+        return body.get("failed_generation") or ""
+    return None
+
+
+def extract_json_object(text):
+    """Return the first complete JSON object in text as a dict."""
+    depth = 0
+    start = None
+    in_string = escaped = False
+    for i, ch in enumerate(text):
+        if start is None:
+            if ch == "{":
+                start, depth = i, 1
+            continue
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                try:
+                    value = json.loads(text[start:i + 1])
+                except ValueError:
+                    value = None  # braces in prose, e.g. "{name}"; keep looking
+                if isinstance(value, dict):
+                    return value
+                start = None
+    if start is not None:
+        raise ResponseFormatError("unterminated JSON object (output cut off?)")
+    raise ResponseFormatError("no JSON object in output")
+
+
+def _coerce_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    raise ResponseFormatError(f"has_errors must be a boolean, got {value!r}")
+
+
+def _coerce_text(field, value, default):
+    if value is None:
+        return default
+    if not isinstance(value, str):
+        raise ResponseFormatError(f"{field} must be a string, got {type(value).__name__}")
+    return value
+
+
+def validate_tutor_response(data, user_text):
+    """The four tutor fields from a decoded object; extra keys are dropped."""
+    reply = _coerce_text("conversational_response", data.get("conversational_response"), "").strip()
+    if not reply:
+        raise ResponseFormatError("conversational_response is missing")
+    return {
+        "corrected_sentence": _coerce_text("corrected_sentence", data.get("corrected_sentence"), user_text),
+        "has_errors": _coerce_bool(data.get("has_errors", False)),
+        "explanation": _coerce_text("explanation", data.get("explanation"), ""),
+        "conversational_response": reply,
+    }
+
+
+def decode_tutor_response(content, user_text):
+    return validate_tutor_response(extract_json_object(content or ""), user_text)
+
+
+def salvage_reply(content):
+    """Prose the model wrote instead of JSON, usable as the reply; None if it looks like broken JSON."""
+    text = (content or "").strip()
+    if not text or "{" in text or '"conversational_response"' in text:
+        return None
+    return text
+
+
+class _JSONModeSupport:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._unsupported = set()
+
+    def supported(self, model):
+        return model not in self._unsupported
+
+    def reject(self, model, error):
+        """True (and remember it) if error is the provider refusing response_format."""
+        if not isinstance(error, openai.BadRequestError):
+            return False
+        message = str(error).lower()
+        if "response_format" not in message and "json_object" not in message and "json mode" not in message:
+            return False
+        with self._lock:
+            self._unsupported.add(model)
+        print(f"Model {model} does not support JSON mode; continuing without it")
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._unsupported.clear()
+
+
+json_mode_support = _JSONModeSupport()
+
+
+def json_completion(client, json_mode=True, **kwargs):
+    """client.chat.completions.create(**kwargs), in JSON mode when the model allows it."""
+    model = kwargs["model"]
+    if json_mode and json_mode_support.supported(model):
+        try:
+            return client.chat.completions.create(response_format=JSON_MODE, **kwargs)
+        except openai.BadRequestError as e:
+            failed = _failed_generation(e)
+            if failed is not None:
+                raise FailedGeneration(failed) from e
+            if not json_mode_support.reject(model, e):
+                raise
+    return client.chat.completions.create(**kwargs)
+
+
+async def ajson_completion(client, json_mode=True, **kwargs):
+    model = kwargs["model"]
+    if json_mode and json_mode_support.supported(model):
+        try:
+            return await client.chat.completions.create(response_format=JSON_MODE, **kwargs)
+        except openai.BadRequestError as e:
+            failed = _failed_generation(e)
+            if failed is not None:
+                raise FailedGeneration(failed) from e
+            if not json_mode_support.reject(model, e):
+                raise
+    return await client.chat.completions.create(**kwargs)
@@ -0,0 +1,166 @@
+# utils/tts.py
+"""
+Text-to-speech for the CLI tutor on one long-lived pyttsx3 engine.
+
+A SpeechWorker thread creates the engine once, picks the voice and then
+speaks the text segments put on its queue, one after another. Callers don't
+wait for speech unless they ask to, so the tutor can queue the first
+sentence of a reply while the rest is still being generated:
+
+    tts = SpeechWorker().start()
+    first = tts.say("Nice try!")       # returns at once
+    tts.say("We say 'I am', not 'I is'.")
+    first.started.wait()               # audio has begun
+    tts.wait()                         # everything queued has been spoken
+
+The engine is created and used only on the worker thread, as SAPI5 (COM)
+requires. Without pyttsx3, or if the engine fails, text is only printed by
+the caller and say() completes at once.
+
+split_sentences() cuts streamed text into speakable pieces as it arrives.
+
+Tuning is done through environment variables:
+    TTS_RATE         words per minute (default 165)
+    TTS_VOLUME       0.0 to 1.0 (default 1.0)
+    TTS_VOICE_INDEX  which installed voice to use, if there are that many
+                     (default 1, the second voice; falls back to the first)
+"""
+import os
+import queue
+import re
+import threading
+import time
+
+TTS_RATE = int(os.environ.get("TTS_RATE", "165"))
+TTS_VOLUME = float(os.environ.get("TTS_VOLUME", "1.0"))
+TTS_VOICE_INDEX = int(os.environ.get("TTS_VOICE_INDEX", "1"))
+
+# End of a sentence: terminal punctuation, optional closing quotes/brackets, then whitespace
+_SENTENCE_END = re.compile(r"""[.!?]+["')\]]*\s+""")
+MIN_SENTENCE_CHARS = 12  # shorter pieces ("Hi." "Oh!") are joined to the next one
+
+
+def split_sentences(pending, text):
+    """
+    Add streamed text to pending and split off the complete sentences.
+    Returns: (sentences, rest) where rest is kept for the next call.
+    """
+    pending += text
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(pending):
+        if match.end() - start >= MIN_SENTENCE_CHARS:
+            sentences.append(pending[start:match.end()].strip())
+            start = match.end()
+    return sentences, pending[start:]
+
+
+class Utterance:
+    """One queued segment; started and done are set as the engine speaks it."""
+
+    def __init__(self, text):
+        self.text = text
+        self.started = threading.Event()
+        self.done = threading.Event()
+        self.started_at = None
+
+    def mark_started(self):
+        if not self.started.is_set():
+            self.started_at = time.perf_counter()
+            self.started.set()
+
+
+class SpeechWorker:
+    def __init__(self, rate=TTS_RATE, volume=TTS_VOLUME, voice_index=TTS_VOICE_INDEX, engine_factory=None):
+        self.rate = rate
+        self.volume = volume
+        self.voice_index = voice_index
+        self.engine_factory = engine_factory or _pyttsx3_engine
+        self.voice_id = None
+        self.available = False
+        self._queue = queue.Queue()
+        self._ready = threading.Event()
+        self._thread = None
+        self._current = None
+
+    def start(self):
+        """Start the worker and wait for the engine to be set up."""
+        self._thread = threading.Thread(target=self._run, name="tts", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def say(self, text):
+        """Queue text to be spoken; returns its Utterance."""
+        utterance = Utterance(text)
+        if not self.available:
+            utterance.mark_started()
+            utterance.done.set()
+            return utterance
+        self._queue.put(utterance)
+        return utterance
+
+    def wait(self):
+        """Block until everything queued so far has been spoken."""
+        self._queue.join()
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        try:
+            engine = self._open_engine()
+        except Exception as e:
+            print(f"WARNING: text-to-speech unavailable ({e}); replies will only be printed.")
+            engine = None
+        finally:
+            self._ready.set()  # start() must not wait forever, whatever happened above
+        if engine is None:
+            return
+        while True:
+            utterance = self._queue.get()
+            try:
+                if utterance is None:
+                    engine.stop()
+                    return
+                self._current = utterance
+                engine.say(utterance.text)
+                engine.runAndWait()
+            except Exception as e:
+                print(f"TTS Error: {e}. Could not play audio.")
+            finally:
+                if utterance is not None:
+                    utterance.mark_started()  # in case the driver sent no callback
+                    utterance.done.set()
+                self._queue.task_done()
+
+    def _open_engine(self):
+        engine = self.engine_factory()
+        voices = engine.getProperty("voices") or []
+        if len(voices) > self.voice_index:
+            voice = voices[self.voice_index]
+            print(f"\nSUCCESS: Selected voice is '{voice.name}'\n")
+        else:
+            print("WARNING: Only one voice available. Using default.")
+            voice = voices[0] if voices else None
+        if voice is not None:
+            self.voice_id = voice.id
+            engine.setProperty("voice", voice.id)
+        engine.setProperty("rate", self.rate)
+        engine.setProperty("volume", self.volume)
+        try:
+            engine.connect("started-utterance", lambda name: self._current and self._current.mark_started())
+        except Exception:
+            pass  # started is then set when the utterance finishes
+        self.available = True
+        return engine
+
+
+def _pyttsx3_engine():
+    import pyttsx3
+
+    if os.name == "nt":
+        return pyttsx3.init(driverName="sapi5")
+    return pyttsx3.init()
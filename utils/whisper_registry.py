@@ -0,0 +1,73 @@
+# utils/whisper_registry.py
+"""
+Process-wide registry of loaded Whisper models, so the CLI tutor only pays for
+`import whisper` (torch) and load_model() when a voice turn needs them.
+
+    model = get_whisper_model()       # loads on first use, cached afterwards
+    preload_whisper()                 # or start loading on a background thread
+
+A call that arrives while the preload is still running waits for it instead
+of loading a second copy. If the preload fails, the next call tries again in
+the foreground and reports the error there.
+
+Tuning is done through environment variables:
+    WHISPER_MODEL     model size to load: tiny, base, small, ... (default base)
+    WHISPER_PRELOAD   1 to start loading at session start, 0 to wait for the
+                      first voice turn (default 1)
+"""
+import os
+import threading
+import time
+
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "base")
+WHISPER_PRELOAD = os.environ.get("WHISPER_PRELOAD", "1") == "1"
+
+_models = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def _lock_for(name):
+    with _registry_lock:
+        return _locks.setdefault(name, threading.Lock())
+
+
+def get_whisper_model(name=None):
+    """The Whisper model called name (default WHISPER_MODEL), loading it once per process."""
+    name = name or WHISPER_MODEL
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _lock_for(name):
+        model = _models.get(name)
+        if model is None:
+            start = time.perf_counter()
+            import whisper  # pulls in torch; seconds on a cold start
+
+            model = whisper.load_model(name)
+            _models[name] = model
+            print(f"Whisper model '{name}' loaded in {time.perf_counter() - start:.1f}s")
+    return model
+
+
+def preload_whisper(name=None):
+    """Load the model on a daemon thread; returns the thread."""
+
+    def load():
+        try:
+            get_whisper_model(name)
+        except Exception as e:
+            print(f"Background Whisper load failed ({e}); will retry on the first voice turn")
+
+    thread = threading.Thread(target=load, name="whisper-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def is_loaded(name=None):
+    return (name or WHISPER_MODEL) in _models
+
+
+def reset_whisper_models():
+    with _registry_lock:
+        _models.clear()